@@ -1,8 +1,10 @@
+import hmac
 import json
+import asyncio
 import logging
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Header, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.responses import StreamingResponse
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
@@ -10,9 +12,20 @@ from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from botbuilder.core import BotFrameworkAdapter, BotFrameworkAdapterSettings, TurnContext
 from botbuilder.schema import Activity, ActivityTypes
 
-from src.agents.LangBotAgent import LangBotAgent, Response
+from src.agents.LangBotAgent import LangBotAgent, Response, find_structured_response
+from src.agents.intent_classifier import intent_classifier
+from src.agents.answer_cache import answer_cache
+from src.agents.plan_cache import plan_cache
+from src.agents.repair_cache import repair_cache
+from src.database.async_executor import sql_executor
+from src.database.connection_pool import pool
+from src.database.index_advisor import index_advisor
+from src.database.result_cache import result_cache
+from src.database.result_pages import iter_pages, decode_cursor, CursorError
+from src.llm.cached_embeddings import embedding_cache
+from src.tools.azure_search_retriever import aclose_search_clients, awarm_example_index
 
-from config.config import AZURE_BOT_APP_CONFIG
+from config.config import AZURE_BOT_APP_CONFIG, PLAN_CACHE_CONFIG, RESULT_PAGES_CONFIG
 
 APP_ID = AZURE_BOT_APP_CONFIG["azure_bot_app_id"]
 APP_PASSWORD = AZURE_BOT_APP_CONFIG["azure_app_bot_password"]
@@ -37,6 +50,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_example_index():
+    """Load the local SQL example index before the first request, which would otherwise wait on it"""
+    await awarm_example_index()
+
+@app.on_event("shutdown")
+async def close_search_clients():
+    """Close the keep-alive HTTP session of the async Azure Search client"""
+    await aclose_search_clients()
+
 class QueryRequest(BaseModel):
     query: str
 
@@ -48,13 +71,18 @@ class ApiResponse(BaseModel):
     suggested_questions: Optional[List[str]] = None
     is_chitchat: bool = False
     query_result: Optional[str] = None 
+    query_result_html: Optional[str] = None
+    query_result_json: Optional[Dict[str, Any]] = None
+    total_rows: Optional[int] = None
+    result_cursor: Optional[str] = None
+    stage_timings: Optional[Dict[str, float]] = None
 
 agent = LangBotAgent()
 
 def extract_message_content(chunk):
     if isinstance(chunk, dict):
-        if 'supervisor' in chunk and 'structured_response' in chunk['supervisor']:
-            sr = chunk['supervisor']['structured_response']
+        sr = find_structured_response(chunk)
+        if sr is not None:
             if hasattr(sr, 'dict'):
                 sr = sr.dict()
             return sr  # Return the dict for final output
@@ -83,6 +111,9 @@ async def ask_database_stream(request: QueryRequest):
             
             # Process each chunk as it arrives
             async for chunk in async_gen:
+                cache_hit = chunk.get("answer_cache", {}).get("cache_hit") if isinstance(chunk, dict) else None
+                if cache_hit:
+                    yield f"data: {json.dumps({'type': 'cache_hit', 'data': cache_hit})}\n\n"
                 pretty = extract_message_content(chunk)
                 
                 # If we have the final structured output
@@ -176,6 +207,8 @@ async def qna_teams(input_payload: Dict, request: Request) -> Any:
 
             response = output["answer"]
             final_answer = response
+            if output.get("query_result_html"):
+                final_answer += "<br><br>" + output["query_result_html"]
 
             await turn_context.send_activity(final_answer)
     
@@ -187,6 +220,80 @@ async def qna_teams(input_payload: Dict, request: Request) -> Any:
 
     return {"message": "Response generated"}
 
+@app.get("/results/{cursor}")
+async def stream_result_pages(
+    cursor: str, page_size: Optional[int] = Query(None, ge=1, le=RESULT_PAGES_CONFIG["max_page_size"])
+):
+    """
+    Stream the remaining rows of a query result page by page, straight from SQLite,
+    starting at the result_cursor returned by /ask or /askbot
+    """
+    try:
+        decode_cursor(cursor)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Sync generator: Starlette iterates it in a worker thread, keeping SQLite off the event loop
+    def page_generator():
+        try:
+            for page in iter_pages(cursor, page_size):
+                yield f"data: {json.dumps({'type': 'page', 'data': page.model_dump()}, default=str)}\n\n"
+        except CursorError as e:
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(page_generator(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def stats():
+    """Runtime statistics for the SQLite connection pool, SQL worker threads, caches and intent classifier"""
+    return {
+        "sqlite_pool": pool.stats(),
+        "sql_executor": sql_executor.stats(),
+        "result_cache": result_cache.stats(),
+        "intent_classifier": intent_classifier.stats(),
+        "answer_cache": answer_cache.stats(),
+        # The plan and embedding caches count the rows of their files, which may wait on a write
+        "plan_cache": await asyncio.to_thread(plan_cache.stats),
+        "sql_repair_cache": repair_cache.stats(),
+        "embedding_cache": await asyncio.to_thread(embedding_cache.stats),
+        "index_advisor": index_advisor.stats(),
+    }
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Check the X-Admin-Token header; the admin endpoints are disabled unless ADMIN_API_TOKEN is configured"""
+    token = PLAN_CACHE_CONFIG["admin_token"]
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: ADMIN_API_TOKEN is not set")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+# The admin handlers are plain functions: FastAPI runs them in its thread pool, off the event loop,
+# since the plan cache reads and writes a SQLite file
+@app.get("/admin/plans", dependencies=[Depends(require_admin)])
+def list_plans():
+    """List cached question -> SQL plans, pinned first"""
+    return {"plans": [plan.model_dump() for plan in plan_cache.list_plans()], "stats": plan_cache.stats()}
+
+@app.post("/admin/plans/{key}/pin", dependencies=[Depends(require_admin)])
+def pin_plan(key: str, pinned: bool = True):
+    """Pin a plan so it is never evicted, overwritten or invalidated (pinned=false unpins it)"""
+    if not plan_cache.pin(key, pinned):
+        raise HTTPException(status_code=404, detail=f"No cached plan {key}")
+    return {"key": key, "pinned": pinned}
+
+@app.delete("/admin/plans/{key}", dependencies=[Depends(require_admin)])
+def purge_plan(key: str):
+    """Delete one cached plan, pinned or not"""
+    if not plan_cache.purge(key, include_pinned=True):
+        raise HTTPException(status_code=404, detail=f"No cached plan {key}")
+    return {"deleted": 1}
+
+@app.delete("/admin/plans", dependencies=[Depends(require_admin)])
+def purge_plans(include_pinned: bool = False):
+    """Delete every cached plan, keeping pinned ones unless include_pinned is set"""
+    return {"deleted": plan_cache.purge(include_pinned=include_pinned)}
+
 @app.get("/health")
 async def health_check():
     """Simple endpoint to check if API is running"""
@@ -7,4 +7,136 @@ load_dotenv()
 AZURE_BOT_APP_CONFIG = {
     "azure_bot_app_id" : os.getenv("AZURE_BOT_APP_ID"),
     "azure_app_bot_password" : os.getenv("AZURE_BOT_APP_PASSWORD")
-}
\ No newline at end of file
+}
+
+# Configuration for the DigiBook SQLite database
+SQLITE_CONFIG = {
+    "db_path" : os.getenv("DIGIBOOK_DB_PATH", os.path.join(os.path.dirname(__file__), "../src/database/digibook.db")),
+    "pool_size" : int(os.getenv("SQLITE_POOL_SIZE", "8")),
+    "pool_timeout" : float(os.getenv("SQLITE_POOL_TIMEOUT", "30")),
+    "mmap_size" : int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size" : int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+}
+
+
+# Configuration for the sqlite_tool query result cache
+RESULT_CACHE_CONFIG = {
+    "max_entries" : int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256")),
+    "max_bytes" : int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+}
+
+# Execution budget for LLM-generated SQL run by sqlite_tool
+QUERY_LIMITS_CONFIG = {
+    "timeout_seconds" : float(os.getenv("SQLITE_QUERY_TIMEOUT", "10")),
+    "max_vm_steps" : int(os.getenv("SQLITE_QUERY_MAX_VM_STEPS", "50000000")),
+    "max_rows" : int(os.getenv("SQLITE_QUERY_MAX_ROWS", "5000")),
+    "max_bytes" : int(os.getenv("SQLITE_QUERY_MAX_BYTES", str(5 * 1024 * 1024)))
+}
+
+# Paging of sqlite_tool results and the /results streaming endpoint
+RESULT_PAGES_CONFIG = {
+    "page_size" : int(os.getenv("RESULT_PAGE_SIZE", "50")),
+    "max_page_size" : int(os.getenv("RESULT_MAX_PAGE_SIZE", "1000"))
+}
+
+# Query plan observation and automatic index building
+INDEX_ADVISOR_CONFIG = {
+    "enabled" : os.getenv("INDEX_ADVISOR_ENABLED", "true").lower() == "true",
+    "log_path" : os.getenv("INDEX_ADVISOR_LOG_PATH", os.path.join(os.path.dirname(__file__), "../src/database/query_log.db")),
+    "max_index_columns" : int(os.getenv("INDEX_ADVISOR_MAX_INDEX_COLUMNS", "6")),
+    "queue_size" : int(os.getenv("INDEX_ADVISOR_QUEUE_SIZE", "10000")),
+    "flush_interval" : float(os.getenv("INDEX_ADVISOR_FLUSH_INTERVAL", "2")),
+    "benchmark_queries" : int(os.getenv("INDEX_ADVISOR_BENCHMARK_QUERIES", "20")),
+    "benchmark_timeout" : float(os.getenv("INDEX_ADVISOR_BENCHMARK_TIMEOUT", "5"))
+}
+# Worker threads that run sqlite_tool queries for the async API
+SQL_EXECUTOR_CONFIG = {
+    "max_workers" : int(os.getenv("SQL_EXECUTOR_MAX_WORKERS", os.getenv("SQLITE_POOL_SIZE", "8"))),
+    "max_queue" : int(os.getenv("SQL_EXECUTOR_MAX_QUEUE", "64"))
+}
+
+# How the database agents are orchestrated: "graph" runs them in a fixed StateGraph order,
+# "parallel" runs the reframer, BA agent and example retrieval concurrently before SQL generation,
+# "supervisor" lets the supervisor LLM route every handoff
+PIPELINE_CONFIG = {
+    "mode" : os.getenv("PIPELINE_MODE", "graph")
+}
+
+# Local chit-chat detection in front of the database pipeline
+INTENT_CLASSIFIER_CONFIG = {
+    "enabled" : os.getenv("INTENT_CLASSIFIER_ENABLED", "true").lower() == "true",
+    "threshold" : float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.8"))
+}
+
+# Semantic cache of final answers, keyed on question embeddings
+ANSWER_CACHE_CONFIG = {
+    "enabled" : os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true",
+    "threshold" : float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    "ttl_seconds" : float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+    "max_entries" : int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+}
+
+# Question -> validated SQL cache used by the "graph" pipeline mode
+PLAN_CACHE_CONFIG = {
+    "enabled" : os.getenv("PLAN_CACHE_ENABLED", "true").lower() == "true",
+    "path" : os.getenv("PLAN_CACHE_PATH", os.path.join(os.path.dirname(__file__), "../src/database/plan_cache.db")),
+    "max_entries" : int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "500")),
+    "threshold" : float(os.getenv("PLAN_CACHE_THRESHOLD", "0.97")),
+    "admin_token" : os.getenv("ADMIN_API_TOKEN")
+}
+
+# Schema linking index over db_schema_and_rules.md used by the lookup_schema tool
+SCHEMA_INDEX_CONFIG = {
+    "doc_path" : os.getenv("SCHEMA_DOC_PATH", os.path.join(os.path.dirname(__file__), "../db_schema_and_rules.md")),
+    "index_path" : os.getenv("SCHEMA_INDEX_PATH", os.path.join(os.path.dirname(__file__), "../src/tools/schema_index.json")),
+    "max_columns" : int(os.getenv("SCHEMA_INDEX_MAX_COLUMNS", "12")),
+    "max_tables" : int(os.getenv("SCHEMA_INDEX_MAX_TABLES", "3"))
+}
+
+# Distinct values of categorical columns, built at ingest for exact entity matching
+VALUE_DICTIONARY_CONFIG = {
+    "max_distinct" : int(os.getenv("VALUE_DICTIONARY_MAX_DISTINCT", "500")),
+    "threshold" : float(os.getenv("VALUE_DICTIONARY_THRESHOLD", "0.6")),
+    "hint_threshold" : float(os.getenv("VALUE_DICTIONARY_HINT_THRESHOLD", "0.85")),
+    "max_matches" : int(os.getenv("VALUE_DICTIONARY_MAX_MATCHES", "5")),
+    "max_hints" : int(os.getenv("VALUE_DICTIONARY_MAX_HINTS", "10"))
+}
+
+# In-process checks and rewrites of generated SQL, in place of the sql_evaluation_agent LLM call
+SQL_VALIDATOR_CONFIG = {
+    "enabled" : os.getenv("SQL_VALIDATOR_ENABLED", "true").lower() == "true"
+}
+
+# Bounded generator retries when generated SQL fails validation or execution
+SQL_REPAIR_CONFIG = {
+    "max_attempts" : int(os.getenv("SQL_REPAIR_MAX_ATTEMPTS", "2")),
+    "cache_max_entries" : int(os.getenv("SQL_REPAIR_CACHE_MAX_ENTRIES", "500"))
+}
+
+# Few-shot SQL example retrieval: "azure" (Azure AI Search) or "local" (in-process index over schemaVectors.json)
+EXAMPLE_RETRIEVAL_CONFIG = {
+    "backend" : os.getenv("EXAMPLE_RETRIEVAL_BACKEND", "azure"),
+    "vectors_path" : os.getenv("EXAMPLE_VECTORS_PATH", os.path.join(os.path.dirname(__file__), "../src/tools/schemaVectors.json")),
+    "examples_path" : os.getenv("EXAMPLES_CSV_PATH", os.path.join(os.path.dirname(__file__), "../src/tools/updated_examples.csv")),
+    # Local backend ranking: BM25 and vector ranks fused by reciprocal rank fusion, then MMR for diversity
+    "hybrid" : os.getenv("EXAMPLE_RETRIEVAL_HYBRID", "true").lower() == "true",
+    "rrf_k" : int(os.getenv("EXAMPLE_RETRIEVAL_RRF_K", "60")),
+    "mmr_lambda" : float(os.getenv("EXAMPLE_RETRIEVAL_MMR_LAMBDA", "0.7")),
+    "candidates" : int(os.getenv("EXAMPLE_RETRIEVAL_CANDIDATES", "10")),
+    # Async retrieval gives up after this long and falls back to the local index, or to no examples
+    "timeout_seconds" : float(os.getenv("EXAMPLE_RETRIEVAL_TIMEOUT", "3"))
+}
+
+# Query and document embeddings cache shared by the example retriever and the index builder
+EMBEDDING_CACHE_CONFIG = {
+    "enabled" : os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true",
+    "persist" : os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true",
+    "path" : os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "../src/llm/embedding_cache.db")),
+    "max_entries" : int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+}
+
+# Run the best retrieved example's SQL while the generator works, when its question is close enough
+SPECULATIVE_SQL_CONFIG = {
+    "enabled" : os.getenv("SPECULATIVE_SQL_ENABLED", "true").lower() == "true",
+    "threshold" : float(os.getenv("SPECULATIVE_SQL_THRESHOLD", "0.92"))
+}
@@ -4,20 +4,39 @@ current_date = now.strftime('%Y-%m-%d')
 current_month = now.strftime('%B')
 current_year = now.strftime('%Y')
 
+import re
+import time
+import asyncio
+import logging
 from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from config.config import PIPELINE_CONFIG, INTENT_CLASSIFIER_CONFIG, ANSWER_CACHE_CONFIG, PLAN_CACHE_CONFIG, SQL_VALIDATOR_CONFIG, SQL_REPAIR_CONFIG, SPECULATIVE_SQL_CONFIG
+from src.agents.intent_classifier import intent_classifier
+from src.agents.answer_cache import answer_cache, current_data_version
+from src.agents.plan_cache import plan_cache
+from src.agents.repair_cache import repair_cache, current_schema_version
 from src.llm.base_llm import get_llm
-from src.tools.sqlite_tool import sqlite_tool
-from src.tools.read_file_content import read_file_content
-from src.tools.azure_search_retriever import retrieve_sql_examples
+from src.tools.sqlite_tool import sqlite_tool, collect_query_results, collect_page, query_database, run_sqlite_query, arun_sqlite_query
+from src.tools.schema_index import lookup_schema, schema_index
+from src.tools.value_lookup import lookup_column_values
+from src.database.value_dictionary import value_dictionary, format_matches
+from src.database.sql_validator import validate_generated_sql
+from src.database.sql_text import canonicalize_sql
+from src.database.async_executor import sql_executor, ExecutorBusyError
+from src.database.result_renderer import render_markdown, render_html, render_json
+from src.tools.azure_search_retriever import retrieve_sql_examples, search_examples, asearch_examples, format_examples, embedding_model
 
 from langgraph_supervisor.supervisor import create_supervisor
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.store.memory import InMemoryStore
 from langchain_core.messages import convert_to_messages
 from langchain_core.runnables.config import RunnableConfig
-from typing import Optional
+from typing import Any, Optional, Literal, Annotated, TypedDict
 
 checkpointer = InMemorySaver()
 store = InMemoryStore()
@@ -46,6 +65,8 @@ def pretty_print_messages(update, last_message=False):
         is_subgraph = True
 
     for node_name, node_update in update.items():
+        if not isinstance(node_update, dict) or "messages" not in node_update:
+            continue
         update_label = f"Update from node {node_name}:"
         if is_subgraph:
             update_label = "\t" + update_label
@@ -68,19 +89,149 @@ class Response(BaseModel):
     ba_analysis: Optional[str] = Field(default=None, description="Business analysis output, if applicable.")
     suggested_questions: Optional[list[str]] = Field(default=None, description="Suggest similar questions, should be a variation of the initial question, if applicable.")
     is_chitchat: bool = Field(default=False, description="True if the question is chit-chat or non-database.")
-    query_result: Optional[str] = Field(default=None, description="The entire formatted results of the SQL query execution.")
+    # Rendered in code from the executed query by attach_query_result, hidden from the LLM's output schema
+    query_result: SkipJsonSchema[Optional[str]] = None
+    query_result_html: SkipJsonSchema[Optional[str]] = None
+    query_result_json: SkipJsonSchema[Optional[dict]] = None
+    total_rows: SkipJsonSchema[Optional[int]] = None
+    result_cursor: SkipJsonSchema[Optional[str]] = None
+    stage_timings: SkipJsonSchema[Optional[dict]] = None
+
+
+def attach_query_result(response, pages):
+    """Render the last query run by sqlite_tool into the result fields of the structured response."""
+    if response is None or not pages or response.is_chitchat:
+        return response
+    page = pages[-1]
+    response.query_result = render_markdown(page)
+    response.query_result_html = render_html(page)
+    response.query_result_json = render_json(page)
+    response.total_rows = page.total_rows
+    response.result_cursor = page.cursor
+    return response
+
+
+class RouteDecision(BaseModel):
+    route: Literal["database", "chitchat"] = Field(description="'database' for questions about data in the DigiBook database, 'chitchat' for small talk and anything else.")
+    suggested_questions: Optional[list[str]] = Field(default=None, description="For database questions only: 3 variations of the user's question.")
+
+
+def merge_timings(left, right):
+    # Parallel branches add their own keys; nodes that run again, such as sql_repair, add up
+    merged = dict(left or {})
+    for name, elapsed in (right or {}).items():
+        merged[name] = round(merged.get(name, 0) + elapsed, 1)
+    return merged
+
+
+class DatabasePipelineState(TypedDict, total=False):
+    messages: Annotated[list, add_messages]
+    question: str
+    question_embedding: Any
+    plan_key: Optional[str]
+    route: str
+    suggested_questions: Optional[list[str]]
+    reframed_query: Optional[str]
+    ba_analysis: Optional[str]
+    sql_examples: Optional[str]
+    value_hints: Optional[str]  # Stored values the question mentions, appended to the generator's input
+    speculative_sql: Optional[str]  # Validated SQL of a near-identical example, run alongside the generator
+    speculative_execution: Optional[str]
+    speculative_page: Any
+    sql: Optional[str]
+    execution: Optional[str]  # sqlite_tool output for sql
+    failed_sql: Optional[str]
+    sql_error: Optional[str]  # Validation or SQLite error of failed_sql, cleared once a query runs
+    repair_attempts: int
+    repairs: Optional[list]  # (failed SQL, error, schema version) fixed on the way to the current sql
+    result: Optional[str]
+    started_at: float
+    timings: Annotated[dict, merge_timings]  # node name -> elapsed ms, merged across parallel branches
+    structured_response: Response
+
+
+_SQL_BLOCK = re.compile(r"```(?:sql)?\s*(.*?)```", re.S | re.I)
+_SQL_START = re.compile(r"^\s*(SELECT|WITH)\b", re.I | re.M)
+
+
+def extract_sql(text):
+    """
+    Pull the SQL query out of an agent reply.
+
+    Args:
+        text (str): Agent output, possibly with prose and ```sql fences.
+
+    Returns:
+        str: The last fenced or bare SELECT/WITH statement, or None if there is none.
+    """
+    text = text or ""
+    for block in reversed(_SQL_BLOCK.findall(text)):
+        if _SQL_START.match(block):
+            return block.strip()
+    match = _SQL_START.search(text)
+    if match is None:
+        return None
+    statement = re.split(r";|\n\s*\n", text[match.start():], maxsplit=1)[0]
+    return statement.strip()
+
+
+def last_ai_content(result):
+    """Text of the last AI message in an agent's output state."""
+    for message in reversed(result.get("messages", [])):
+        if isinstance(message, AIMessage) and message.content:
+            return message.content
+    return ""
+
+
+def timed_node(name, func, afunc=None):
+    """
+    Graph node that records how long it took in the state's timings.
+
+    Args:
+        name (str): Node name, also the key in timings.
+        func (callable): State -> update dict.
+        afunc (callable, optional): Async variant of func.
+
+    Returns:
+        RunnableLambda: Node whose update also carries {"timings": {name: elapsed_ms}}.
+    """
+    def with_timing(update, started):
+        return {**update, "timings": {name: round((time.perf_counter() - started) * 1000, 1)}}
+
+    def run(state):
+        started = time.perf_counter()
+        return with_timing(func(state), started)
+
+    async def arun(state):
+        started = time.perf_counter()
+        return with_timing(await afunc(state), started)
+
+    return RunnableLambda(run, afunc=arun if afunc else None, name=name)
+
+
+def find_structured_response(chunk):
+    """The Response in a streamed graph update, from the supervisor or the pipeline's respond node."""
+    if not isinstance(chunk, dict):
+        return None
+    for node_update in chunk.values():
+        if isinstance(node_update, dict) and node_update.get("structured_response") is not None:
+            return node_update["structured_response"]
+    return None
 
 
 class LangBotAgent:
     def __init__(self):
         self.model = get_llm("gpt-4o")
         self.supervisor_model = get_llm("gpt-4o-mini")
+        # Questions are embedded with the same model as the SQL examples index
+        answer_cache.set_embedder(embedding_model().embed_query)
+        schema_index.set_embedder(embedding_model())
         
         # --- Database pipeline agents ---
 
         self.clarity_check_agent = create_react_agent(
             model=self.model,
-            tools=[read_file_content],
+            tools=[lookup_schema],
             name="clarity_check_agent",
             prompt=(
                 "You are a Clarity Check Agent for a Text2SQL system based on the DigiBook database.\n\n"
@@ -88,7 +239,7 @@ class LangBotAgent:
                 "1. **Clear** — includes all necessary filters (e.g., time, metric, quantity, dimension) and maps to the schema.\n"
                 "2. **Ambiguous** — vague, incomplete, or missing key details.\n"
                 "3. **Schema-Mismatched** — uses terms that don’t appear in the database schema.\n\n"
-                "You have access to the `read_file_content` tool to check the schema. Use it when you're unsure whether a column or table exists.\n\n"
+                "You have access to the `lookup_schema` tool, which returns the tables and columns relevant to a question. Use it when you're unsure whether a column or table exists.\n\n"
                 "### You must check:\n"
                 "- If vague metric terms like `top`, `best`, `performance`, `recent`, `total` are used without context\n"
                 "- If vague dimensions like `employee`, `sales`, `data`, `project` appear without grounding in the schema\n"
@@ -119,12 +270,12 @@ class LangBotAgent:
 
         self.query_reframer_agent = create_react_agent(
             model=self.model,
-            tools=[read_file_content],
+            tools=[lookup_schema],
             name="user_query_reframer_agent",
             prompt=(
                 "You are a User quetion reframer agent. Your job is to understand the user's natural language question and rephrase it in clear, unambiguous technical language suitable for SQL analysis. "
                 "Output only the reframed user's question as a single string. Once you have provided the reframed query, do not repeat or rephrase it. Return control to the supervisor."
-                "Use the documentation file 'db_schema_and_rules.md' as a source of truth for database schema, tables, columns, and business rules. "
+                "Call the lookup_schema tool once with the user's question; the tables, columns, and business rules it returns from 'db_schema_and_rules.md' are the source of truth for the database schema. "
                 "Example: What is the total revenue generated by the company in the last 3 months?"
                 "Reframed question: Select the sum of the amount column from the transactions table where the date is between last 3 months."
             ),
@@ -132,28 +283,54 @@ class LangBotAgent:
         
         self.ba_agent = create_react_agent(
             model=self.model,
-            tools=[read_file_content],
+            tools=[lookup_schema],
             name="business_analysis_agent",
             prompt=(
-                "You are a Business Analysis Agent. Given a reframed technical query, use the documentation file 'db_schema_and_rules.md' as a source of truth for database schema, tables, columns, and business rules. "
+                "You are a Business Analysis Agent. Given a reframed technical query, call the lookup_schema tool once with it; the tables, columns, and business rules it returns from 'db_schema_and_rules.md' are the source of truth for the database schema. "
                 "Output your analysis in a concise format, listing only the relevant tables, columns, and business rules. Once you have provided this analysis, do not repeat or rephrase it. Return control to the supervisor."
             ),
         )
 
+        # Shared by both generator agents; only how they get the few-shot examples differs
+        sql_generator_rules = (
+            "Then, generate ONE SQL query that best answers the current question, using the few-shot examples and business analysis as guidance.\n"
+            "Return ONLY the final SQL query, nothing else.\n"
+        )
+        sql_generator_data_rules = (
+            "IMPORTANT: All data in the database is stored in lowercase, so compare against lowercase values.\n"
+            "Only the free-text name columns account.Name, obm.Project_Name__c, obm.End_Client_Name_POC__c and obm.Sales_lead__c may be matched with LIKE '%term%'; "
+            "those substring matches are served by a full-text index, so use them for partial names on these four columns only.\n"
+            "Categorical columns (e.g. Vertical, Industry, Primary_Practice__c, Client_Geography_Tagging__c, Type__c) must be filtered with = or IN on their exact stored values, never with LIKE: "
+            "use the stored values listed in your input, or call lookup_column_values for terms not listed.\n"
+        )
+
         self.sql_generate_agent = create_react_agent(
             model=self.model,
-            tools=[retrieve_sql_examples],
+            tools=[retrieve_sql_examples, lookup_column_values],
             name="sql_generator_agent",
             prompt=(
                 "You are a SQL Generator Agent. Your job is to generate a single, correct SQL query based on the reframed technical question and business analysis provided.\n"
                 "You MUST first call the retrieve_sql_examples tool with the reframed query to get a set of few-shot example questions and their SQL queries.\n"
                 "Study these few-shot examples carefully.\n"
-                "Then, generate ONE SQL query that best answers the current question, using the few-shot examples and business analysis as guidance.\n"
-                "Ensure your query is robust to different data formats by using LIKE, wildcard matching, or string transformations where appropriate.\n"
-                "Return ONLY the final SQL query, nothing else.\n"
-                "Return control to the supervisor.\n\n"
-                "IMPORTANT: All data in the database is stored in lowercase, but be flexible with matching by using LIKE or pattern matching techniques.\n"
-                "DO NOT call retrieve_sql_examples more than once.\n"
+                + sql_generator_rules
+                + "Return control to the supervisor.\n\n"
+                + sql_generator_data_rules
+                + "DO NOT call retrieve_sql_examples more than once.\n"
+            ),
+        )
+
+        # Parallel pipeline mode and speculative SQL retrieve the few-shot examples alongside the reframer
+        # and BA agents, so this generator gets them in its input instead of calling retrieve_sql_examples
+        self.sql_generate_with_examples_agent = create_react_agent(
+            model=self.model,
+            tools=[lookup_column_values],
+            name="sql_generator_agent",
+            prompt=(
+                "You are a SQL Generator Agent. Your job is to generate a single, correct SQL query based on the user's question, the reframed technical question, the business analysis and the few-shot examples provided.\n"
+                "Study the few-shot example questions and their SQL queries carefully.\n"
+                + sql_generator_rules
+                + "\n"
+                + sql_generator_data_rules
             ),
         )
 
@@ -174,14 +351,13 @@ class LangBotAgent:
             tools=[sqlite_tool],
             name="sql_runner_agent",
             prompt=(
-                 "You are a SQL Runner Agent. Given a SQL query, execute it using the provided tool, and return the result. "
-                "When returning query results:\n"
-                "1. Always format the results as a proper markdown table with headers and column alignment\n"
-                "2. Display the complete table - do not truncate rows or columns\n"
-                "3. Use headers that match the column names returned by the query\n"
-                "4. For all table results, use three-backtick markdown format with the table inside\n"
-                "5. Ensure your response includes the complete formatted table results\n"
-                "6. After showing the table, provide a brief 1-2 sentence explanation of what the query results show\n"
+                 "You are a SQL Runner Agent. Given a SQL query, execute it using the provided tool. "
+                "The tool returns a compact summary of the result (row count, columns, sample rows and numeric totals); "
+                "the full result table is rendered and shown to the user automatically.\n"
+                "1. Do NOT reproduce the result table or list the rows\n"
+                "2. Reply with a brief 1-2 sentence explanation of what the query results show, based on the summary\n"
+                "3. If the tool reports no results, an error or an aborted query, say so plainly\n"
+                "4. If your input already contains the result summary, explain it without running the query again\n"
 
             ),
         )
@@ -208,9 +384,7 @@ class LangBotAgent:
             "    d. SQL Evaluation agent  \n"
             "    e. SQL Runner agent  \n"
             "2. After all steps, fill all relevant fields in the response.\n"
-            "3. If the SQL query returns tabular results, ensure the complete table is displayed in a properly formatted markdown table.\n"
-            "4. For large tables, do not truncate the results - display all rows and columns completely.\n"
-            "5. Always include the formatted table results in the query_result field of the response.\n"
+            "3. The result table is attached to the response automatically; do not copy it into the answer.\n"
 
             "\n"
             "For general chit-chat or non-database questions:\n"
@@ -222,11 +396,8 @@ class LangBotAgent:
             "    - Do not add suggested questions in this case.\n"
             "\n"
             "When presenting SQL query results:\n"
-            "1. Always format table output using markdown tables with proper column alignment\n"
-            "2. Include the full dataset without truncation\n"
-            "3. Use headers that match the column names returned by the query\n"
-            "4. For empty results, clearly state 'No data found' and suggest possible reasons\n"
-            "5. Always include the query results in the response's query_result field\n"
+            "1. Put the SQL Runner agent's short explanation in the answer field\n"
+            "2. For empty results, clearly state 'No data found' and suggest possible reasons\n"
         )
 
         self.database_supervisor = create_supervisor(
@@ -246,21 +417,518 @@ class LangBotAgent:
             output_mode="last_message",  # Use last message to avoid confusion in the output
         )
         
-        self.database_app = self.database_supervisor.compile()
+        if PIPELINE_CONFIG["mode"] == "supervisor":
+            self.database_app = self.database_supervisor.compile()
+        else:
+            self.database_app = self.build_database_pipeline()
+
+    def agent_step(self, agent, make_input, output_key, name=None):
+        """
+        Graph node that runs a ReAct agent on a fresh, minimal input and stores its final answer.
+
+        Args:
+            agent: Compiled agent from create_react_agent.
+            make_input (callable): State -> prompt text for the agent.
+            output_key (str): State field that receives the agent's final message.
+            name (str, optional): Node name for the timings, when it differs from the agent's name.
+        """
+        def to_update(result):
+            content = last_ai_content(result)
+            return {output_key: content, "messages": [AIMessage(content=content, name=agent.name)]}
+
+        def run(state):
+            return to_update(agent.invoke({"messages": [HumanMessage(content=make_input(state))]}))
+
+        async def arun(state):
+            return to_update(await agent.ainvoke({"messages": [HumanMessage(content=make_input(state))]}))
+
+        return timed_node(name or agent.name, run, arun)
+
+    def build_database_pipeline(self):
+        """
+        Fixed reframer -> BA -> generator -> validator -> runner pipeline as a LangGraph StateGraph.
+
+        The supervisor model is only called once, to choose between the database and chit-chat
+        branches (and to suggest follow-up questions). Each agent sees just the fields it needs
+        instead of the whole conversation.
+
+        In "parallel" mode the reframer, the BA agent (working from the raw question) and the
+        few-shot example retrieval run as concurrent branches that join before SQL generation.
+        Every node records its elapsed time in the state's timings, returned as stage_timings.
+        Generated SQL is checked in process by sql_validator; with SQL_VALIDATOR_ENABLED=false the
+        sql_evaluation_agent reviews it instead. execute_sql runs it, and a query that fails validation
+        or execution goes back to the generator with its error and the relevant schema, up to
+        SQL_REPAIR_MAX_ATTEMPTS times, before the runner agent explains the result.
+
+        With speculative SQL enabled, the best retrieved example whose question is within
+        SPECULATIVE_SQL_THRESHOLD of the user's is validated and run alongside the reframer and BA
+        agents. The generator sees it as a candidate; when the checked SQL matches it after
+        canonicalization, its result is reused and execute_sql is skipped.
+
+        Returns:
+            CompiledStateGraph: Drop-in replacement for the compiled supervisor.
+        """
+        router = self.supervisor_model.with_structured_output(RouteDecision)
+        router_prompt = (
+            "Classify the user's message. Answer 'database' if it asks about data in the DigiBook database "
+            "(accounts, clients, projects, revenue, orders, users, practices, verticals), otherwise 'chitchat'. "
+            "For database questions, also suggest 3 variations of the question."
+        )
+
+        def route_update(decision):
+            return {"route": decision.route, "suggested_questions": decision.suggested_questions}
+
+        def route(state):
+            return route_update(router.invoke([SystemMessage(content=router_prompt), HumanMessage(content=state["question"])]))
+
+        async def aroute(state):
+            return route_update(await router.ainvoke([SystemMessage(content=router_prompt), HumanMessage(content=state["question"])]))
+
+        def lookup_plan(state):
+            # A cached plan for this question goes straight to the runner with its validated SQL
+            plan = plan_cache.lookup(state["question"], state.get("question_embedding")) if PLAN_CACHE_CONFIG["enabled"] else None
+            if plan is None:
+                return {"plan_key": None}
+            return {
+                "plan_key": plan.key,
+                "route": "database",
+                "sql": plan.sql,
+                "reframed_query": plan.reframed_query,
+                "ba_analysis": plan.ba_analysis,
+                "suggested_questions": plan.suggested_questions,
+            }
+
+        def retrieve_examples(state):
+            return {"sql_examples": retrieve_sql_examples.invoke(state["question"])}
+
+        async def aretrieve_examples(state):
+            return {"sql_examples": await retrieve_sql_examples.ainvoke(state["question"])}
+
+        def speculation_candidate(examples):
+            # The closest example's SQL is worth running early only when its question nearly matches
+            update = {"sql_examples": format_examples(examples), "speculative_sql": None}
+            best = examples[0] if examples else None
+            if best is None or best.get("similarity", 0) < SPECULATIVE_SQL_CONFIG["threshold"]:
+                return update
+            validation = validate_generated_sql(best["sql"])
+            if validation.valid:
+                logging.info(f"Speculatively running example SQL (similarity {best['similarity']}): {validation.sql}")
+                update["speculative_sql"] = validation.sql
+            return update
+
+        def speculation_result(update, output, page):
+            # A failed or aborted speculative query is simply dropped
+            if page is None:
+                return {**update, "speculative_sql": None}
+            return {**update, "speculative_execution": output, "speculative_page": page}
+
+        def speculate(state):
+            try:
+                examples = search_examples(state["question"], with_similarity=True)
+            except Exception as e:
+                return {"sql_examples": f"Error retrieving SQL examples: {e}", "speculative_sql": None}
+            update = speculation_candidate(examples)
+            if not update["speculative_sql"]:
+                return update
+            return speculation_result(update, *query_database(update["speculative_sql"]))
+
+        async def aspeculate(state):
+            # Bounded by EXAMPLE_RETRIEVAL_TIMEOUT, with no examples rather than an error on failure
+            update = speculation_candidate(await asearch_examples(state["question"], 2, True))
+            if not update["speculative_sql"]:
+                return update
+            try:
+                return speculation_result(update, *await sql_executor.run(query_database, update["speculative_sql"]))
+            except ExecutorBusyError:
+                return {**update, "speculative_sql": None}
+
+        def speculation_hint(state):
+            if not state.get("speculative_sql"):
+                return ""
+            return ("\n\nCandidate SQL from an example with a near-identical question:\n"
+                    f"{state['speculative_sql']}\nIf it answers the question exactly, return it unchanged.")
+
+        def speculation_hit(state):
+            return bool(state.get("speculative_sql") and state.get("sql")
+                        and canonicalize_sql(state["sql"]) == canonicalize_sql(state["speculative_sql"]))
+
+        def match_values(state):
+            # Stored categorical values the question mentions, so the generator can use exact equality
+            try:
+                matches = value_dictionary.hints(f"{state['question']} {state.get('reframed_query') or ''}")
+            except Exception as e:
+                logging.warning(f"Value dictionary hints skipped: {e}")
+                return {"value_hints": ""}
+            if not matches:
+                return {"value_hints": ""}
+            return {"value_hints": "\n\nStored values mentioned in the question (filter on these with = or IN):\n"
+                                   f"{format_matches(matches)}"}
+
+        async def amatch_values(state):
+            # The value dictionary reads SQLite and may rebuild its indexes, so it runs off the event loop
+            return await asyncio.to_thread(match_values, state)
+
+        def generated_sql(state):
+            return {"sql": extract_sql(state.get("sql"))}
+
+        def validated_sql(state):
+            # In-process replacement for the evaluator agent's SELECT-only and lowercasing checks
+            validation = validate_generated_sql(state["sql"])
+            if not validation.valid:
+                logging.warning(f"Rejected generated SQL {state['sql']!r}: {validation.errors}")
+                error = "; ".join(validation.errors)
+                return {"sql": None, "failed_sql": state["sql"], "sql_error": error,
+                        "result": f"The generated SQL query was rejected: {error}"}
+            if validation.changes:
+                logging.info(f"Validator rewrote generated SQL: {', '.join(validation.changes)}")
+            return {"sql": validation.sql}
+
+        def execution_update(state, output):
+            if output.startswith("Error executing query:") and "database is busy" not in output:
+                error = output[len("Error executing query:"):].strip()
+                logging.warning(f"Generated SQL failed: {error}")
+                return {"execution": output, "failed_sql": state["sql"], "sql_error": error,
+                        "result": f"I could not run the SQL query: {error}"}
+            # Remember the fixes that led to a query that runs
+            for failed_sql, error, version in state.get("repairs") or []:
+                repair_cache.store(failed_sql, error, state["sql"], version)
+            return {"execution": output, "sql_error": None, "repairs": []}
+
+        def execute(state):
+            return execution_update(state, run_sqlite_query(state["sql"]))
+
+        def use_speculation(state):
+            # The generator confirmed the example's SQL, whose result is already in hand
+            collect_page(state["speculative_page"])
+            logging.info("Generated SQL matches the speculative query; reusing its result")
+            return execution_update(state, state["speculative_execution"])
+
+        async def aexecute(state):
+            return execution_update(state, await arun_sqlite_query(state["sql"]))
+
+        def repair_input(state):
+            # The error, the failing SQL and the schema slice go straight to the generator
+            question, failed_sql = state["question"], state["failed_sql"]
+            reframed = f"Reframed query: {state['reframed_query']}\n\n" if state.get("reframed_query") else ""
+            return (
+                f"User question: {question}\n\n{reframed}"
+                f"This SQL query failed:\n{failed_sql}\n\nError: {state['sql_error']}\n\n"
+                f"{schema_index.relevant_schema(f'{question} {failed_sql}')}\n\n"
+                "Fix the query so it answers the question. Return ONLY the corrected SQL query."
+            )
+
+        def cached_repair(state):
+            # The broken cached plan is dropped; the repaired SQL is stored under the same key once it runs
+            if state.get("plan_key"):
+                plan_cache.invalidate(state["plan_key"])
+            version = current_schema_version()
+            return repair_cache.get(state["failed_sql"], state["sql_error"], version), version
+
+        def repair_update(state, fixed_sql, cached, version):
+            repairs = list(state.get("repairs") or []) + [(state["failed_sql"], state["sql_error"], version)]
+            update = {"sql": fixed_sql, "repairs": repairs, "repair_attempts": state.get("repair_attempts", 0) + 1,
+                      "sql_error": None, "result": None, "plan_key": None}
+            logging.info(f"Repaired SQL ({'cached fix' if cached else 'generator'}): {fixed_sql}")
+            return update
+
+        def repair(state):
+            fixed, version = cached_repair(state)
+            if fixed is not None:
+                return repair_update(state, fixed, True, version)
+            reply = last_ai_content(self.sql_generate_with_examples_agent.invoke(
+                {"messages": [HumanMessage(content=repair_input(state))]}))
+            return repair_update(state, extract_sql(reply), False, version)
+
+        async def arepair(state):
+            # Plan and repair cache lookups read SQLite and the schema slice may embed the schema
+            # chunks, so both run off the event loop
+            fixed, version = await asyncio.to_thread(cached_repair, state)
+            if fixed is not None:
+                return repair_update(state, fixed, True, version)
+            prompt = await asyncio.to_thread(repair_input, state)
+            reply = last_ai_content(await self.sql_generate_with_examples_agent.ainvoke(
+                {"messages": [HumanMessage(content=prompt)]}))
+            return repair_update(state, extract_sql(reply), False, version)
+
+        def after_failure(state):
+            # Bounded: give up and answer with the error after max_attempts repairs
+            if state.get("repair_attempts", 0) < SQL_REPAIR_CONFIG["max_attempts"] and state.get("failed_sql"):
+                return "repair"
+            return "respond"
+
+        def evaluated_sql(state):
+            # The evaluator either confirms the query, returns a corrected one or rejects it
+            evaluation = state.get("result") or ""
+            corrected = extract_sql(evaluation)
+            if corrected:
+                return {"sql": corrected, "result": None}
+            if re.search(r"\breject", evaluation, re.I):
+                return {"sql": None}
+            return {"result": None}
+
+        def respond(state):
+            timings = dict(state.get("timings") or {})
+            if state.get("started_at"):
+                timings["total"] = round((time.perf_counter() - state["started_at"]) * 1000, 1)
+            logging.info(f"Pipeline stage timings (ms): {timings}")
+            if state.get("route") == "chitchat":
+                response = Response(answer=state.get("result") or "", is_chitchat=True)
+            else:
+                answer = state.get("result")
+                if not answer and not state.get("sql"):
+                    answer = "I could not generate a SQL query for this question. Please rephrase it."
+                response = Response(
+                    answer=answer or "No data found.",
+                    sql_query=state.get("sql"),
+                    reframed_query=state.get("reframed_query"),
+                    ba_analysis=state.get("ba_analysis"),
+                    suggested_questions=state.get("suggested_questions"),
+                )
+            response.stage_timings = timings
+            return {"structured_response": response}
+
+        parallel = PIPELINE_CONFIG["mode"] == "parallel"
+        speculative = SPECULATIVE_SQL_CONFIG["enabled"]
+        date_context = f"Today's date: {current_date}. Current month: {current_month}. Current year: {current_year}.\n"
+        graph = StateGraph(DatabasePipelineState)
+        graph.add_node("plan_lookup", timed_node("plan_lookup", lookup_plan))
+        graph.add_node("router", timed_node("router", route, aroute))
+        graph.add_node("chit_chat_agent", self.agent_step(self.chitchat_agent, lambda s: s["question"], "result"))
+        graph.add_node("user_query_reframer_agent", self.agent_step(
+            self.query_reframer_agent, lambda s: date_context + s["question"], "reframed_query"))
+        if parallel:
+            # The BA agent cannot wait for the reframed query, so it works from the question itself
+            graph.add_node("business_analysis_agent", self.agent_step(
+                self.ba_agent, lambda s: date_context + f"User question: {s['question']}", "ba_analysis"))
+            if speculative:
+                graph.add_node("retrieve_sql_examples", timed_node("retrieve_sql_examples", speculate, aspeculate))
+            else:
+                graph.add_node("retrieve_sql_examples", timed_node("retrieve_sql_examples", retrieve_examples, aretrieve_examples))
+            graph.add_node("sql_generator_agent", self.agent_step(
+                self.sql_generate_with_examples_agent,
+                lambda s: (f"User question: {s['question']}\n\nReframed query: {s['reframed_query']}\n\n"
+                           f"Business analysis:\n{s['ba_analysis']}\n\nFew-shot examples:\n{s['sql_examples']}"
+                           + (s.get("value_hints") or "") + speculation_hint(s)), "sql"))
+        else:
+            graph.add_node("business_analysis_agent", self.agent_step(
+                self.ba_agent, lambda s: f"Reframed query: {s['reframed_query']}", "ba_analysis"))
+            if speculative:
+                # speculative_sql already retrieves the examples, so the generator gets them in its input
+                graph.add_node("speculative_sql", timed_node("speculative_sql", speculate, aspeculate))
+                graph.add_node("sql_generator_agent", self.agent_step(
+                    self.sql_generate_with_examples_agent,
+                    lambda s: (f"User question: {s['question']}\n\nReframed query: {s['reframed_query']}\n\n"
+                               f"Business analysis:\n{s['ba_analysis']}\n\nFew-shot examples:\n{s['sql_examples']}"
+                               + (s.get("value_hints") or "") + speculation_hint(s)), "sql"))
+            else:
+                graph.add_node("sql_generator_agent", self.agent_step(
+                    self.sql_generate_agent,
+                    lambda s: (f"Reframed query: {s['reframed_query']}\n\nBusiness analysis:\n{s['ba_analysis']}"
+                               + (s.get("value_hints") or "")),
+                    "sql"))
+        graph.add_node("match_values", timed_node("match_values", match_values, amatch_values))
+        graph.add_node("extract_sql", timed_node("extract_sql", generated_sql))
+        if SQL_VALIDATOR_CONFIG["enabled"]:
+            graph.add_node("sql_validator", timed_node("sql_validator", validated_sql))
+        else:
+            graph.add_node("sql_evaluation_agent", self.agent_step(
+                self.sql_evaluation_agent, lambda s: f"SQL query:\n{s['sql']}", "result"))
+            graph.add_node("apply_evaluation", timed_node("apply_evaluation", evaluated_sql))
+        graph.add_node("execute_sql", timed_node("execute_sql", execute, aexecute))
+        if speculative:
+            graph.add_node("speculative_result", timed_node("speculative_result", use_speculation))
+        graph.add_node("sql_repair", timed_node("sql_repair", repair, arepair))
+        graph.add_node("sql_runner_agent", self.agent_step(
+            self.sql_runner_agent,
+            lambda s: f"SQL query:\n{s['sql']}\n\nThe query has already been run. Result summary:\n{s['execution']}", "result"))
+        graph.add_node("respond", respond)
+
+        graph.add_edge(START, "plan_lookup")
+        graph.add_conditional_edges("plan_lookup", lambda s: "run" if s.get("plan_key") else "route", {
+            "run": "execute_sql",
+            "route": "router",
+        })
+        graph.add_edge("chit_chat_agent", "respond")
+        if parallel:
+            branches = ["user_query_reframer_agent", "business_analysis_agent", "retrieve_sql_examples"]
+            graph.add_conditional_edges(
+                "router", lambda s: ["chit_chat_agent"] if s["route"] == "chitchat" else branches,
+                ["chit_chat_agent", *branches])
+            # Value hints need the reframed query; SQL generation waits for all branches
+            graph.add_edge("user_query_reframer_agent", "match_values")
+            graph.add_edge(["match_values", "business_analysis_agent", "retrieve_sql_examples"], "sql_generator_agent")
+        elif speculative:
+            # The example SQL runs while the reframer and BA agents work
+            graph.add_conditional_edges(
+                "router",
+                lambda s: ["chit_chat_agent"] if s["route"] == "chitchat" else ["user_query_reframer_agent", "speculative_sql"],
+                ["chit_chat_agent", "user_query_reframer_agent", "speculative_sql"])
+            graph.add_edge("user_query_reframer_agent", "business_analysis_agent")
+            graph.add_edge("user_query_reframer_agent", "match_values")
+            graph.add_edge(["business_analysis_agent", "match_values", "speculative_sql"], "sql_generator_agent")
+        else:
+            graph.add_conditional_edges("router", lambda s: s["route"], {
+                "chitchat": "chit_chat_agent",
+                "database": "user_query_reframer_agent",
+            })
+            # Value hints are matched while the BA agent works
+            graph.add_edge("user_query_reframer_agent", "business_analysis_agent")
+            graph.add_edge("user_query_reframer_agent", "match_values")
+            graph.add_edge(["business_analysis_agent", "match_values"], "sql_generator_agent")
+        graph.add_edge("sql_generator_agent", "extract_sql")
+        checked = "sql_validator" if SQL_VALIDATOR_CONFIG["enabled"] else "apply_evaluation"
+        for generated in ("extract_sql", "sql_repair"):
+            graph.add_conditional_edges(generated, lambda s: "evaluate" if s.get("sql") else "respond", {
+                "evaluate": "sql_validator" if SQL_VALIDATOR_CONFIG["enabled"] else "sql_evaluation_agent",
+                "respond": "respond",
+            })
+        if not SQL_VALIDATOR_CONFIG["enabled"]:
+            graph.add_edge("sql_evaluation_agent", "apply_evaluation")
+        def after_check(state):
+            if not state.get("sql"):
+                return after_failure(state)
+            return "reuse" if speculative and speculation_hit(state) else "run"
+
+        graph.add_conditional_edges(checked, after_check, {
+            "run": "execute_sql",
+            **({"reuse": "speculative_result"} if speculative else {}),
+            "repair": "sql_repair",
+            "respond": "respond",
+        })
+        if speculative:
+            graph.add_edge("speculative_result", "sql_runner_agent")
+        graph.add_conditional_edges("execute_sql", lambda s: after_failure(s) if s.get("sql_error") else "explain", {
+            "explain": "sql_runner_agent",
+            "repair": "sql_repair",
+            "respond": "respond",
+        })
+        graph.add_edge("sql_runner_agent", "respond")
+        graph.add_edge("respond", END)
+        return graph.compile()
+
+    def pipeline_input(self, message: str, embedding=None):
+        if PIPELINE_CONFIG["mode"] == "supervisor":
+            return {"messages": [HumanMessage(content=message)]}
+        return {"messages": [HumanMessage(content=message)], "question": message, "question_embedding": embedding,
+                "started_at": time.perf_counter()}
+
+    def remember_plan(self, message: str, response, plan_key=None, embedding=None):
+        """
+        Cache the validated SQL of a successful answer, or drop a cached plan whose SQL failed.
+
+        Args:
+            message (str): The user's question.
+            response (Response): The final structured response.
+            plan_key (str, optional): Key of the cached plan the answer was produced from.
+            embedding (np.ndarray, optional): Question embedding for similarity lookups.
+        """
+        if not PLAN_CACHE_CONFIG["enabled"] or PIPELINE_CONFIG["mode"] == "supervisor" \
+                or response is None or response.is_chitchat:
+            return
+        try:
+            if plan_key:
+                if response.query_result is None:
+                    plan_cache.invalidate(plan_key)
+            elif response.sql_query and response.query_result is not None:
+                plan_cache.store(message, response.sql_query, response.reframed_query, response.ba_analysis,
+                                 response.suggested_questions, embedding)
+        except Exception as e:
+            logging.warning(f"Could not update plan cache: {e}")
+
+    def answer_locally(self, message: str):
+        """
+        Answer trivial chit-chat from the intent classifier's templates, without any LLM call.
+
+        Returns:
+            dict: Graph-style output with messages and structured_response, or None to run the pipeline.
+        """
+        if not INTENT_CLASSIFIER_CONFIG["enabled"]:
+            return None
+        reply = intent_classifier.answer(message)
+        if reply is None:
+            return None
+        return {
+            "messages": [HumanMessage(content=message), AIMessage(content=reply, name="intent_classifier")],
+            "structured_response": Response(answer=reply, is_chitchat=True),
+        }
+
+    def lookup_cached_answer(self, message: str):
+        """
+        Look a question up in the semantic answer cache.
+
+        Returns:
+            tuple: (graph-style output with structured_response and cache_hit, or None on a miss,
+            question embedding, data version). The embedding is None when the cache is disabled
+            or the question could not be embedded.
+        """
+        if not ANSWER_CACHE_CONFIG["enabled"]:
+            return None, None, None
+        try:
+            embedding = answer_cache.embed(message)
+            version = current_data_version()
+        except Exception as e:
+            logging.warning(f"Answer cache lookup skipped: {e}")
+            return None, None, None
+        hit = answer_cache.lookup(message, embedding, version)
+        if hit is None:
+            return None, embedding, version
+        # The cached answer's stage timings describe the run that produced it, not this request
+        response = Response(**{**hit.response, "stage_timings": None})
+        return {
+            "messages": [HumanMessage(content=message), AIMessage(content=response.answer, name="answer_cache")],
+            "structured_response": response,
+            "cache_hit": {"question": hit.question, "similarity": hit.similarity},
+        }, embedding, version
 
     def ask_database(self, message: str):
-        result = self.database_app.invoke({"messages": [HumanMessage(content=message)]})
+        local = self.answer_locally(message)
+        if local is not None:
+            print(local["structured_response"])
+            return local
+        cached, embedding, version = self.lookup_cached_answer(message)
+        if cached is not None:
+            print(cached["structured_response"])
+            return cached
+        pages = collect_query_results()
+        result = self.database_app.invoke(self.pipeline_input(message, embedding))
         if isinstance(result, Response):
+            attach_query_result(result, pages)
             print(result)
         elif "structured_response" in result:
+            attach_query_result(result["structured_response"], pages)
             print(result["structured_response"])
+        response = result if isinstance(result, Response) else result.get("structured_response")
+        if embedding is not None:
+            answer_cache.store(message, embedding, version, response)
+        self.remember_plan(message, response, None if isinstance(result, Response) else result.get("plan_key"), embedding)
         return result
 
     def stream_database(self, message: str):
-        for chunk in self.database_app.stream({"messages": [HumanMessage(content=message)]}):
+        for chunk in self.database_app.stream(self.pipeline_input(message)):
             pretty_print_messages(chunk)
 
     async def astream_database(self, message: str):
-        async for chunk in self.database_app.astream({"messages": [HumanMessage(content=message)]}):
+        local = self.answer_locally(message)
+        if local is not None:
+            yield {"intent_classifier": local}
+            return
+        # Embedding the question and reading the data version block, so keep them off the event loop
+        cached, embedding, version = await asyncio.to_thread(self.lookup_cached_answer, message)
+        if cached is not None:
+            yield {"answer_cache": cached}
+            return
+        pages = collect_query_results()
+        plan_key = None
+        async for chunk in self.database_app.astream(self.pipeline_input(message, embedding)):
+            for node in ("plan_lookup", "sql_repair"):
+                if isinstance(chunk.get(node), dict) and "plan_key" in chunk[node]:
+                    plan_key = chunk[node]["plan_key"]
+            response = attach_query_result(find_structured_response(chunk), pages)
+            if response is not None:
+                if embedding is not None:
+                    # Matching the question's stored values reads the value dictionary
+                    await asyncio.to_thread(answer_cache.store, message, embedding, version, response)
+                # The plan cache is a SQLite file, written off the event loop
+                await asyncio.to_thread(self.remember_plan, message, response, plan_key, embedding)
             pretty_print_messages(chunk)
             yield chunk
\ No newline at end of file
@@ -0,0 +1,173 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+
+import numpy as np
+from pydantic import BaseModel
+
+from config.config import ANSWER_CACHE_CONFIG
+from src.agents.question_literals import cache_literals
+from src.database.connection_pool import pool
+from src.database.data_version import get_data_version
+
+
+class AnswerCacheHit(BaseModel):
+    question: str  # The cached question that matched
+    similarity: float
+    response: Dict[str, Any]  # Response.model_dump() of the cached answer
+
+
+def current_data_version():
+    """Data generation of digibook.db, read through the connection pool."""
+    with pool.connection() as conn:
+        return get_data_version(conn)
+
+
+class SemanticAnswerCache:
+    """
+    LRU cache of final pipeline responses keyed on question embeddings.
+
+    A lookup hits when the cosine similarity to a cached question reaches the threshold and
+    both questions carry the same literals (numbers, years, months, quoted values, stored values
+    and names), so "revenue in 2024" never serves the answer to "revenue in 2025", nor "revenue
+    for pfizer" the answer to "revenue for novartis". Entries expire after ttl_seconds and all
+    entries are dropped when the data version changes.
+    """
+
+    def __init__(self, embed=None, threshold=0.95, ttl_seconds=3600, max_entries=1000):
+        """
+        Args:
+            embed (callable, optional): Text -> embedding vector. Can be set later with set_embedder().
+            threshold (float): Minimum cosine similarity for a hit.
+            ttl_seconds (float): Lifetime of an entry.
+            max_entries (int): Entries kept before the least recently used ones are evicted.
+        """
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._next_id = 0
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def set_embedder(self, embed):
+        self._embed = embed
+
+    def embed(self, question):
+        """Unit-length embedding of a question."""
+        vector = np.asarray(self._embed(question.strip()), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, version, now):
+        """Drop entries from other data versions or past their TTL. Caller holds the lock."""
+        if version != self._version:
+            self._expirations += len(self._entries)
+            self._entries.clear()
+            self._version = version
+        stale = [key for key, entry in self._entries.items() if now - entry["stored_at"] > self.ttl_seconds]
+        for key in stale:
+            del self._entries[key]
+        self._expirations += len(stale)
+
+    def lookup(self, question, embedding, version):
+        """
+        Find the cached answer closest to a question embedding among questions with the same literals.
+
+        Args:
+            question (str): The user's question.
+            embedding (np.ndarray): Output of embed().
+            version (int): Current data version.
+
+        Returns:
+            AnswerCacheHit: The best match at or above the threshold, or None.
+        """
+        # Matching stored values reads the value dictionary, so it happens outside the lock
+        literals = cache_literals(question)
+        with self._lock:
+            self._expire(version, time.time())
+            keys = [key for key, entry in self._entries.items() if entry["literals"] == literals]
+            if not keys:
+                self._misses += 1
+                return None
+            matrix = np.stack([self._entries[key]["embedding"] for key in keys])
+            similarities = matrix @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(keys[best])
+            entry = self._entries[keys[best]]
+            return AnswerCacheHit(question=entry["question"], similarity=round(float(similarities[best]), 4), response=entry["response"])
+
+    def store(self, question, embedding, version, response):
+        """
+        Cache a final response. Chit-chat and answers without a query result are not cached.
+
+        Args:
+            question (str): The user's question.
+            embedding (np.ndarray): Output of embed() for the question.
+            version (int): Data version the answer was computed from.
+            response (Response): The pipeline's structured response.
+        """
+        if response is None or response.is_chitchat or not response.sql_query or response.query_result is None:
+            return
+        literals = cache_literals(question)
+        with self._lock:
+            self._expire(version, time.time())
+            self._entries[self._next_id] = {
+                "question": question,
+                "literals": literals,
+                "embedding": embedding,
+                "response": response.model_dump(),
+                "stored_at": time.time(),
+            }
+            self._next_id += 1
+            self._stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        logging.info(f"Cached answer for question: {question}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Hit/miss counters and occupancy.
+
+        Returns:
+            dict: Entry count, limits, hits, misses, hit rate, stores, evictions and expirations.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "data_version": self._version,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_CONFIG["threshold"],
+    ttl_seconds=ANSWER_CACHE_CONFIG["ttl_seconds"],
+    max_entries=ANSWER_CACHE_CONFIG["max_entries"],
+)
@@ -0,0 +1,152 @@
+import re
+import threading
+from typing import Optional
+from pydantic import BaseModel
+
+from config.config import INTENT_CLASSIFIER_CONFIG
+
+# Words that make a message a database question, whatever else it contains
+DATABASE_WORDS = {
+    "revenue", "account", "client", "customer", "project", "order", "obm", "total", "sum", "count", "average",
+    "year", "month", "quarter", "fy", "ytd", "vertical", "industry", "practice", "sales", "lead", "owner", "user",
+    "geography", "region", "pricing", "vendor", "cost", "margin", "deal", "top", "list", "show", "sql", "query",
+    "table", "database", "data", "many", "trend", "growth", "compare", "highest", "lowest", "amount",
+}
+
+# intent -> (trigger words, reply template); a message needs a trigger to match an intent
+INTENTS = {
+    "greeting": (
+        {"hi", "hello", "hey", "hiya", "howdy", "greetings", "yo", "morning", "afternoon", "evening"},
+        "Hello! I can answer questions about the DigiBook data: accounts, projects, revenue, practices and verticals. What would you like to know?",
+    ),
+    "how_are_you": (
+        {"how", "doing", "going", "whats", "up", "sup"},
+        "I'm doing well, thanks for asking! What would you like to know about the DigiBook data?",
+    ),
+    "thanks": (
+        {"thanks", "thank", "thx", "ty", "appreciate", "appreciated", "cheers"},
+        "You're welcome! Let me know if you have another question about the DigiBook data.",
+    ),
+    "goodbye": (
+        {"bye", "goodbye", "later", "cya", "night", "farewell"},
+        "Goodbye! Come back any time you have a question about the DigiBook data.",
+    ),
+    "acknowledgement": (
+        {"ok", "okay", "cool", "great", "nice", "awesome", "perfect", "got", "understood", "sure", "fine"},
+        "Great! Anything else you'd like to know about the DigiBook data?",
+    ),
+    "identity": (
+        {"help", "yourself", "capabilities", "name"},
+        "I'm DigiBook Bot. Ask me about accounts, clients, projects, revenue, practices or verticals, "
+        "for example: \"What was the total revenue in 2025 by vertical?\"",
+    ),
+}
+
+# Words that may accompany any chit-chat intent without making it less certain; they never
+# select an intent on their own, so "what do you have for acme" is not an identity question
+FILLER_WORDS = {
+    "what", "who", "can", "do", "with",
+    "there", "bot", "digibook", "you", "your", "are", "is", "it", "so", "very", "much", "a", "lot", "please",
+    "again", "all", "team", "good", "the", "me", "i", "im", "tell", "about", "that", "this", "oh", "and", "for",
+    "see", "talk", "soon", "day", "have", "nice", "to", "meet", "well", "today", "friend",
+}
+
+# Long messages are rarely small talk, so confidence decays beyond this many words
+MAX_CHITCHAT_WORDS = 8
+
+
+class IntentResult(BaseModel):
+    label: str  # chitchat, database or unknown
+    confidence: float
+    intent: Optional[str] = None
+    reply: Optional[str] = None
+
+
+def _words(message):
+    words = re.findall(r"[a-z0-9]+", message.lower().replace("'", ""))
+    # Crude plural folding so "accounts" matches "account"
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and w[:-1] in DATABASE_WORDS else w for w in words]
+
+
+class IntentClassifier:
+    """Rule-based classifier that answers trivial chit-chat without calling an LLM."""
+
+    def __init__(self, threshold=0.8):
+        """
+        Args:
+            threshold (float): Minimum confidence for a chit-chat template reply.
+        """
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counts = {"total": 0, "chitchat_answered": 0, "database": 0, "below_threshold": 0}
+        self._intent_counts = {}
+
+    def classify(self, message):
+        """
+        Classify a user message.
+
+        Args:
+            message (str): The user's message.
+
+        Returns:
+            IntentResult: chitchat results carry the matched intent and its template reply.
+        """
+        words = _words(message)
+        if not words:
+            return IntentResult(label="unknown", confidence=0.0)
+        if any(w in DATABASE_WORDS or re.fullmatch(r"(19|20)\d\d", w) for w in words):
+            hits = sum(1 for w in words if w in DATABASE_WORDS)
+            return IntentResult(label="database", confidence=round(min(1.0, 0.7 + 0.1 * hits), 3))
+
+        best, best_hits = None, 0
+        for intent, (triggers, _) in INTENTS.items():
+            hits = sum(1 for w in words if w in triggers)
+            if hits > best_hits:
+                best, best_hits = intent, hits
+        if best is None:
+            return IntentResult(label="unknown", confidence=0.0)
+        covered = sum(1 for w in words if w in FILLER_WORDS or any(w in triggers for triggers, _ in INTENTS.values()))
+        # Any other word may be an account, client or project name, so the pipeline answers it
+        if covered < len(words):
+            return IntentResult(label="unknown", confidence=round(covered / len(words), 3), intent=best)
+        confidence = min(1.0, MAX_CHITCHAT_WORDS / len(words))
+        return IntentResult(label="chitchat", confidence=round(confidence, 3), intent=best, reply=INTENTS[best][1])
+
+    def answer(self, message):
+        """
+        Template reply for a message that is confidently chit-chat, updating the hit counters.
+
+        Returns:
+            str: The reply, or None if the message should go through the database pipeline.
+        """
+        result = self.classify(message)
+        with self._lock:
+            self._counts["total"] += 1
+            if result.label == "chitchat" and result.confidence >= self.threshold:
+                self._counts["chitchat_answered"] += 1
+                self._intent_counts[result.intent] = self._intent_counts.get(result.intent, 0) + 1
+                return result.reply
+            if result.label == "database":
+                self._counts["database"] += 1
+            else:
+                self._counts["below_threshold"] += 1
+        return None
+
+    def stats(self):
+        """
+        Classification counters.
+
+        Returns:
+            dict: Message counts per outcome, the local hit rate and template replies per intent.
+        """
+        with self._lock:
+            total = self._counts["total"]
+            return {
+                "threshold": self.threshold,
+                **self._counts,
+                "hit_rate": round(self._counts["chitchat_answered"] / total, 4) if total else 0.0,
+                "intents": dict(self._intent_counts),
+            }
+
+
+intent_classifier = IntentClassifier(threshold=INTENT_CLASSIFIER_CONFIG["threshold"])
@@ -0,0 +1,266 @@
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from config.config import PLAN_CACHE_CONFIG
+from src.agents.question_literals import cache_literals, has_relative_date
+
+# Words that do not change which SQL answers a question. Prepositions are kept: "revenue by
+# vertical" groups where "revenue for vertical" may filter
+_STOP_WORDS = {
+    "a", "an", "the", "please", "can", "could", "would", "you", "me", "us", "i", "we", "show", "give", "get",
+    "tell", "list", "what", "whats", "is", "are", "was", "were", "do", "does",
+}
+
+
+def normalize_question(question):
+    """
+    Canonical form of a question for exact plan lookups.
+
+    Lowercases, drops punctuation and stop words and collapses whitespace, so
+    "Show me the total revenue for 2025?" and "total revenue for 2025" match.
+    """
+    words = re.findall(r"[a-z0-9_%.]+", question.lower().replace("'", ""))
+    return " ".join(w.strip(".") for w in words if w.strip(".") and w.strip(".") not in _STOP_WORDS)
+
+
+def plan_key(question):
+    return hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()[:16]
+
+
+class QueryPlan(BaseModel):
+    key: str
+    question: str
+    normalized_question: str
+    sql: str
+    reframed_query: Optional[str] = None
+    ba_analysis: Optional[str] = None
+    suggested_questions: Optional[list[str]] = None
+    pinned: bool = False
+    hits: int = 0
+    created_at: str
+    last_used: str
+    similarity: Optional[float] = None  # Set on lookups matched by embedding
+
+
+class PlanCache:
+    """
+    Question -> validated SQL cache that lets the pipeline skip the reframer, BA, generator and
+    evaluator agents and re-run the SQL against current data.
+
+    Plans survive data reloads and restarts: they are kept in a small writable SQLite file, like
+    the index advisor's query log. Lookups match the normalized question exactly, then fall back
+    to the nearest question embedding above the similarity threshold among questions with the
+    same literals (numbers, years, months, quoted values, stored values and names), so one
+    account's SQL is never replayed for another.
+
+    Questions with relative dates ("last month", "this year") are never cached: their SQL
+    hard-codes the dates that were current when it was generated.
+    """
+
+    def __init__(self, path, max_entries=500, threshold=0.97):
+        """
+        Args:
+            path (str): Path of the plan cache database.
+            max_entries (int): Unpinned plans kept before the least recently used ones are evicted.
+            threshold (float): Minimum cosine similarity for an embedding match.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._conn = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_cache ("
+                "key TEXT PRIMARY KEY, question TEXT, normalized_question TEXT, sql TEXT, reframed_query TEXT, "
+                "ba_analysis TEXT, suggested_questions TEXT, embedding BLOB, pinned INTEGER DEFAULT 0, "
+                "hits INTEGER DEFAULT 0, created_at TEXT, last_used TEXT, literals TEXT)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(plan_cache)").fetchall()}
+            if "literals" not in columns:
+                # Plans cached before literals were stored only match exactly
+                self._conn.execute("ALTER TABLE plan_cache ADD COLUMN literals TEXT")
+        return self._conn
+
+    @staticmethod
+    def _plan(row, similarity=None):
+        key, question, normalized, sql, reframed, ba, suggested, pinned, hits, created_at, last_used = row
+        return QueryPlan(
+            key=key, question=question, normalized_question=normalized, sql=sql, reframed_query=reframed,
+            ba_analysis=ba, suggested_questions=json.loads(suggested) if suggested else None, pinned=bool(pinned),
+            hits=hits, created_at=created_at, last_used=last_used, similarity=similarity,
+        )
+
+    _COLUMNS = ("key, question, normalized_question, sql, reframed_query, ba_analysis, suggested_questions, "
+                "pinned, hits, created_at, last_used")
+
+    def lookup(self, question, embedding=None):
+        """
+        Find the cached plan for a question.
+
+        Args:
+            question (str): The user's question.
+            embedding (np.ndarray, optional): Unit-length question embedding for the similarity fallback.
+
+        Returns:
+            QueryPlan: The matching plan, or None.
+        """
+        if has_relative_date(question):
+            with self._lock:
+                self._misses += 1
+            return None
+        key = plan_key(question)
+        # Only questions with the same literals may share SQL, e.g. not "revenue in 2024" and "in 2025"
+        literals = json.dumps(cache_literals(question)) if embedding is not None else None
+        with self._lock:
+            db = self._db()
+            row = db.execute(f"SELECT {self._COLUMNS} FROM plan_cache WHERE key = ?", (key,)).fetchone()
+            similarity = None
+            if row is None and embedding is not None:
+                candidates = db.execute(
+                    "SELECT key, embedding FROM plan_cache WHERE embedding IS NOT NULL AND literals = ?", (literals,)
+                ).fetchall()
+                if candidates:
+                    matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in candidates])
+                    similarities = matrix @ np.asarray(embedding, dtype=np.float32)
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        key, similarity = candidates[best][0], round(float(similarities[best]), 4)
+                        row = db.execute(f"SELECT {self._COLUMNS} FROM plan_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            db.execute(
+                "UPDATE plan_cache SET hits = hits + 1, last_used = ? WHERE key = ?",
+                (time.strftime('%Y-%m-%dT%H:%M:%S'), key)
+            )
+            db.commit()
+        return self._plan(row, similarity)
+
+    def store(self, question, sql, reframed_query=None, ba_analysis=None, suggested_questions=None, embedding=None):
+        """
+        Cache the validated SQL for a question. Pinned plans are never overwritten.
+
+        Returns:
+            str: The plan key, or None for questions with relative dates, which are not cached.
+        """
+        if has_relative_date(question):
+            return None
+        key = plan_key(question)
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        literals = json.dumps(cache_literals(question))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO plan_cache (key, question, normalized_question, sql, reframed_query, ba_analysis, "
+                "suggested_questions, embedding, created_at, last_used, literals) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET question = excluded.question, sql = excluded.sql, "
+                "reframed_query = excluded.reframed_query, ba_analysis = excluded.ba_analysis, "
+                "suggested_questions = excluded.suggested_questions, embedding = excluded.embedding, "
+                "last_used = excluded.last_used, literals = excluded.literals WHERE pinned = 0",
+                (key, question, normalize_question(question), sql, reframed_query, ba_analysis,
+                 json.dumps(suggested_questions) if suggested_questions else None, blob, now, now, literals)
+            )
+            db.execute(
+                "DELETE FROM plan_cache WHERE pinned = 0 AND key NOT IN "
+                "(SELECT key FROM plan_cache WHERE pinned = 0 ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            db.commit()
+        logging.info(f"Cached query plan {key} for question: {question}")
+        return key
+
+    def invalidate(self, key):
+        """Drop an unpinned plan whose SQL no longer runs, e.g. after a schema change."""
+        with self._lock:
+            db = self._db()
+            deleted = db.execute("DELETE FROM plan_cache WHERE key = ? AND pinned = 0", (key,)).rowcount
+            db.commit()
+        if deleted:
+            logging.warning(f"Invalidated query plan {key}")
+        else:
+            logging.warning(f"Pinned query plan {key} failed to run and was kept")
+
+    def list_plans(self):
+        """All cached plans, pinned first, then most recently used."""
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT {self._COLUMNS} FROM plan_cache ORDER BY pinned DESC, last_used DESC"
+            ).fetchall()
+        return [self._plan(row) for row in rows]
+
+    def pin(self, key, pinned=True):
+        """
+        Pin a plan so it is never evicted, overwritten or invalidated, or unpin it.
+
+        Returns:
+            bool: False if there is no plan with this key.
+        """
+        with self._lock:
+            db = self._db()
+            updated = db.execute("UPDATE plan_cache SET pinned = ? WHERE key = ?", (int(pinned), key)).rowcount
+            db.commit()
+        return updated > 0
+
+    def purge(self, key=None, include_pinned=False):
+        """
+        Delete one plan, or every plan when key is None.
+
+        Args:
+            key (str, optional): The plan to delete.
+            include_pinned (bool): Also delete pinned plans.
+
+        Returns:
+            int: Number of plans deleted.
+        """
+        sql, params = "DELETE FROM plan_cache WHERE 1 = 1", []
+        if key is not None:
+            sql += " AND key = ?"
+            params.append(key)
+        if not include_pinned:
+            sql += " AND pinned = 0"
+        with self._lock:
+            db = self._db()
+            deleted = db.execute(sql, params).rowcount
+            db.commit()
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            entries, pinned = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(pinned), 0) FROM plan_cache"
+            ).fetchone()
+            lookups = self._hits + self._misses
+            return {
+                "entries": entries,
+                "pinned": pinned,
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+plan_cache = PlanCache(
+    path=PLAN_CACHE_CONFIG["path"],
+    max_entries=PLAN_CACHE_CONFIG["max_entries"],
+    threshold=PLAN_CACHE_CONFIG["threshold"],
+)
@@ -0,0 +1,138 @@
+import os
+import re
+import logging
+
+from config.config import EXAMPLE_RETRIEVAL_CONFIG
+from src.agents.intent_classifier import DATABASE_WORDS, FILLER_WORDS, INTENTS
+from src.database.value_dictionary import value_dictionary
+from src.tools.local_example_index import load_examples
+from src.tools.schema_index import COLUMN_ALIASES, keywords
+
+# Month names and abbreviations -> month number, so "Jan" and "January" compare equal
+_MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",),
+        ("june", "jun"), ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"),
+        ("october", "oct"), ("november", "nov"), ("december", "dec"),
+    ], start=1)
+    for name in names
+}
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "twenty": 20, "fifty": 50, "hundred": 100,
+}
+# Words that make a question's date range depend on when it is asked
+RELATIVE_DATE_WORDS = {
+    "today", "yesterday", "tomorrow", "current", "currently", "this", "last", "previous", "prior", "past",
+    "next", "recent", "recently", "latest", "ytd", "mtd", "qtd", "now", "ago",
+}
+# Everyday question words; any other word may name an account, client, project or person
+_COMMON_WORDS = {
+    "a", "about", "above", "across", "after", "against", "all", "along", "also", "among", "an", "and", "any",
+    "as", "at", "average", "avg", "based", "be", "been", "before", "below", "best", "between", "biggest",
+    "both", "bottom", "breakdown", "but", "by", "calculate", "change", "changed", "compared", "comparison",
+    "contribute", "contributed", "contribution", "decline", "did", "distinct", "distribution", "does", "done",
+    "down", "during", "each", "every", "except", "find", "first", "from", "generate", "generated", "get",
+    "give", "group", "grouped", "had", "has", "have", "high", "how", "if", "in", "include", "including",
+    "increase", "into", "least", "less", "level", "low", "made", "maximum", "max", "median", "min", "minimum",
+    "more", "most", "my", "new", "no", "not", "number", "of", "off", "on", "only", "or", "other", "our", "out",
+    "over", "overall", "percent", "percentage", "performing", "period", "rank", "ranked", "ranking", "rate",
+    "ratio", "same", "share", "should", "since", "size", "smallest", "split", "start", "started", "than",
+    "their", "them", "then", "these", "they", "those", "through", "till", "times", "under", "until", "versus",
+    "via", "vs", "was", "we", "were", "when", "where", "whether", "which", "while", "whose", "why", "will",
+    "within", "without", "worst", "would", "yearly", "monthly", "quarterly", "annual", "week", "weekly", "day",
+    "days", "date", "dates", "value", "values", "wise", "details", "detail", "information", "info", "name",
+    "names", "records", "rows", "bring", "brought", "acquire", "acquired", "acquisition", "created", "won",
+    "lost", "open", "closed", "active", "running", "ongoing",
+}
+_TOKEN = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?%?|[a-z]+\d*", re.IGNORECASE)
+
+
+def question_literals(question):
+    """
+    The values a question pins its SQL to: numbers, years, months, quarters, quoted strings
+    and relative date words.
+
+    Two questions whose embeddings are nearly identical can still need different SQL, e.g.
+    "revenue in 2024" and "revenue in 2025"; caches only treat them as the same question
+    when these literals are equal too.
+
+    Returns:
+        tuple: Sorted literal tokens, with months and number words in numeric form.
+    """
+    literals = []
+    for token in _TOKEN.findall(question.lower()):
+        if token[0] in "'\"":
+            literals.append(token)
+        elif token[0].isdigit():
+            literals.append(token.rstrip("0").rstrip(".") if "." in token and not token.endswith("%") else token)
+        elif token in _MONTHS:
+            literals.append(f"month:{_MONTHS[token]}")
+        elif token in _NUMBER_WORDS:
+            literals.append(str(_NUMBER_WORDS[token]))
+        elif re.fullmatch(r"q[1-4]|h[12]|fy\d*", token):
+            literals.append(token)
+        elif token in RELATIVE_DATE_WORDS:
+            literals.append(token)
+    return tuple(sorted(literals))
+
+
+def has_relative_date(question):
+    """True if the question's answer depends on the date it is asked, e.g. "revenue last month"."""
+    return any(literal in RELATIVE_DATE_WORDS for literal in question_literals(question))
+
+
+_WORD = re.compile(r"[a-z][a-z0-9&]*")
+_vocabulary = None
+
+
+def _known_words():
+    global _vocabulary
+    if _vocabulary is None:
+        words = set(_COMMON_WORDS) | DATABASE_WORDS | FILLER_WORDS | RELATIVE_DATE_WORDS | set(_MONTHS) | set(_NUMBER_WORDS)
+        for triggers, _ in INTENTS.values():
+            words |= triggers
+        for column, aliases in COLUMN_ALIASES.items():
+            words.update(keywords(column.split(".", 1)[1]))
+            words.update(aliases.split())
+        # The few-shot example questions use the business vocabulary but name no accounts
+        if os.path.exists(EXAMPLE_RETRIEVAL_CONFIG["examples_path"]):
+            for example in load_examples(EXAMPLE_RETRIEVAL_CONFIG["examples_path"]):
+                words.update(_WORD.findall(example["question"].lower().replace("'", "")))
+        _vocabulary = words
+    return _vocabulary
+
+
+def _known(word):
+    known = _known_words()
+    return word in known or (len(word) > 3 and word.endswith("s") and word[:-1] in known)
+
+
+def entity_literals(question):
+    """
+    The named things a question is about: stored values it mentions, from value_dictionary.hints(),
+    and words outside the question vocabulary, which may be account, client or project names.
+
+    "revenue for pfizer in 2024" and "revenue for novartis in 2024" embed almost identically
+    but must not share an answer, so caches compare these alongside question_literals().
+
+    Returns:
+        tuple: Sorted "value:table.column=value" and "name:word" tokens.
+    """
+    literals, matched = set(), set()
+    try:
+        for match in value_dictionary.hints(question):
+            literals.add(f"value:{match.table}.{match.column}={match.value}")
+            matched.update((match.term or "").split())
+    except Exception as e:
+        logging.warning(f"Value dictionary skipped for cache literals: {e}")
+    for word in _WORD.findall(question.lower().replace("'", "")):
+        if word not in matched and not _known(word) and not re.fullmatch(r"q[1-4]|h[12]|fy\d*", word):
+            literals.add(f"name:{word}")
+    return tuple(sorted(literals))
+
+
+def cache_literals(question):
+    """question_literals() and entity_literals() together: what two questions must share to share an answer."""
+    return tuple(sorted(question_literals(question) + entity_literals(question)))
@@ -0,0 +1,96 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from config.config import SQL_REPAIR_CONFIG
+from src.database.connection_pool import pool
+from src.database.data_version import get_data_version
+from src.database.sql_text import sql_fingerprint
+
+
+def current_schema_version():
+    """(PRAGMA schema_version, data generation) of digibook.db, read through the connection pool."""
+    with pool.connection() as conn:
+        return conn.execute("PRAGMA schema_version").fetchone()[0], get_data_version(conn)
+
+
+class SQLRepairCache:
+    """
+    LRU cache of known (failed SQL, error) -> corrected SQL pairs.
+
+    A pair is only recorded once the corrected query has run successfully, so a repeated failure
+    is fixed without another generator call. Pairs are tied to the schema version they were
+    learned under, see current_schema_version(); all entries are dropped when it changes.
+    """
+
+    def __init__(self, max_entries=500):
+        """
+        Args:
+            max_entries (int): Pairs kept before the least recently used ones are evicted.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._version = None
+
+    def _expire(self, version):
+        """Drop every pair learned under another schema version. Caller holds the lock."""
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    @staticmethod
+    def _key(sql, error):
+        return sql_fingerprint(sql), (error or "").strip().lower()
+
+    def get(self, sql, error, version):
+        """
+        Args:
+            sql (str): The failed query.
+            error (str): Its error message.
+            version (tuple): Output of current_schema_version().
+
+        Returns:
+            str: The corrected query recorded for this query and error, or None.
+        """
+        key = self._key(sql, error)
+        with self._lock:
+            self._expire(version)
+            fixed = self._entries.get(key)
+            if fixed is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return fixed
+
+    def store(self, sql, error, fixed_sql, version):
+        """Record that fixed_sql ran successfully in place of sql, which failed with error under schema version."""
+        with self._lock:
+            if version != self._version:
+                # The schema changed after the repair was looked up; the fix may not apply any more
+                return
+            self._entries[self._key(sql, error)] = fixed_sql
+            self._entries.move_to_end(self._key(sql, error))
+            self._stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logging.info(f"Cached SQL repair for error: {error}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "stores": self._stores,
+            }
+
+
+repair_cache = SQLRepairCache(max_entries=SQL_REPAIR_CONFIG["cache_max_entries"])
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from config.config import SQL_EXECUTOR_CONFIG
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when too many queries are already waiting for a worker thread."""
+
+
+class SQLExecutor:
+    """Bounded thread pool that runs blocking SQLite work off the event loop thread."""
+
+    def __init__(self, max_workers=8, max_queue=64):
+        """
+        Args:
+            max_workers (int): Queries that may run at the same time.
+            max_queue (int): Queries that may wait for a free worker before new ones are rejected.
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sqlite")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._max_queue_depth = 0
+        self._total_queue_wait = 0.0
+        self._max_queue_wait = 0.0
+
+    def _call(self, enqueued, fn, args):
+        waited = time.perf_counter() - enqueued
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_queue_wait += waited
+            self._max_queue_wait = max(self._max_queue_wait, waited)
+        try:
+            result = fn(*args)
+        except BaseException:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+        return result
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on a worker thread and await its result.
+
+        The caller's context variables are copied into the worker, so collectors such as
+        sqlite_tool.collect_query_results() keep working.
+
+        Raises:
+            ExecutorBusyError: If max_queue queries are already waiting.
+        """
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorBusyError(f"{self._queued} queries are already waiting for a database worker")
+            self._queued += 1
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, context.run, self._call, time.perf_counter(), fn, args)
+        except RuntimeError:
+            # The executor has been shut down
+            with self._lock:
+                self._queued -= 1
+            raise
+        return await future
+
+    def stats(self):
+        """
+        Worker and queue-depth statistics.
+
+        Returns:
+            dict: Running/queued counts, totals and queue wait times in milliseconds.
+        """
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_queue_wait_ms": round(self._total_queue_wait / started * 1000, 3) if started else 0.0,
+                "max_queue_wait_ms": round(self._max_queue_wait * 1000, 3),
+            }
+
+    def shutdown(self):
+        """Stop accepting work and wait for running queries to finish."""
+        logging.info("Shutting down SQL executor")
+        self._executor.shutdown(wait=True)
+
+
+sql_executor = SQLExecutor(
+    max_workers=SQL_EXECUTOR_CONFIG["max_workers"],
+    max_queue=SQL_EXECUTOR_CONFIG["max_queue"],
+)
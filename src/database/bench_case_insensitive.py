@@ -0,0 +1,92 @@
+"""
+Benchmark the LOWER()/LIKE normalisation against COLLATE NOCASE indexes on the obm table.
+
+Runs on a temporary copy of digibook.db, so the real database is never modified:
+
+    python -m src.database.bench_case_insensitive [--db path/to/digibook.db] [--repeat 5]
+"""
+import os
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+
+from src.database.index_advisor import create_index_sql
+from src.database.schema import nocase_columns
+from src.database.sql_normalizer import normalize_case_predicates
+
+DB_PATH = os.path.join(os.path.dirname(__file__), 'digibook.db')
+
+BENCH_COLUMNS = ["Type__c", "Primary_Practice__c", "Project_Name__c", "Client_Geography_Tagging__c"]
+
+
+def most_common(conn, column):
+    row = conn.execute(
+        f'SELECT "{column}" FROM obm WHERE "{column}" IS NOT NULL GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1'
+    ).fetchone()
+    return str(row[0]).replace("'", "''") if row else ""
+
+
+def sample_queries(conn):
+    """Queries in the style the generator/evaluator agents produce, using real values from obm."""
+    type_value = most_common(conn, "Type__c")
+    practice = most_common(conn, "Primary_Practice__c")
+    project_prefix = most_common(conn, "Project_Name__c")[:6]
+    geography = most_common(conn, "Client_Geography_Tagging__c")
+    year = conn.execute("SELECT MAX(Year__c) FROM obm").fetchone()[0]
+    return [
+        f"SELECT COUNT(*) FROM obm WHERE LOWER(Type__c) = '{type_value}'",
+        f"SELECT SUM(Total__c) FROM obm WHERE LOWER(Primary_Practice__c) = '{practice}' AND Year__c = {year}",
+        f"SELECT COUNT(*) FROM obm WHERE LOWER(Project_Name__c) LIKE '{project_prefix}%'",
+        f"SELECT COUNT(*) FROM obm WHERE LOWER(Client_Geography_Tagging__c) IN ('{geography}')",
+    ]
+
+
+def plan(conn, sql):
+    return "; ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall())
+
+
+def best_ms(conn, sql, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark case-insensitive predicate normalisation on obm.')
+    parser.add_argument('--db', type=str, default=DB_PATH, help='Path to digibook.db')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the best time is reported')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'digibook.db')
+        shutil.copyfile(args.db, path)
+        conn = sqlite3.connect(path)
+        queries = sample_queries(conn)
+        before = [(plan(conn, q), best_ms(conn, q, args.repeat)) for q in queries]
+
+        nocase = nocase_columns(conn).get("obm", set())
+        for column in BENCH_COLUMNS:
+            conn.execute(create_index_sql("obm", (column,), nocase))
+        conn.execute("ANALYZE")
+        conn.commit()
+
+        text_cols = nocase_columns(conn)
+        for query, (plan_before, ms_before) in zip(queries, before):
+            rewritten = normalize_case_predicates(query, text_cols)
+            plan_after, ms_after = plan(conn, rewritten), best_ms(conn, rewritten, args.repeat)
+            print(query)
+            print(f"  -> {rewritten}")
+            print(f"  before: {ms_before:8.2f} ms  {plan_before}")
+            print(f"  after:  {ms_after:8.2f} ms  {plan_after}")
+            print(f"  speedup: {ms_before / ms_after:.1f}x\n" if ms_after else "")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
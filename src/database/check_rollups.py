@@ -0,0 +1,67 @@
+"""
+Check that queries answered from the rollup tables return the same rows as the base tables.
+
+Runs on a temporary copy of digibook.db with freshly built rollups, so the real database is
+never modified. Exits with status 1 if any query differs:
+
+    python -m src.database.check_rollups [--db path/to/digibook.db]
+"""
+import os
+import sys
+import shutil
+import sqlite3
+import argparse
+import tempfile
+
+from src.database.rollups import build_rollups, rewrite_with_rollups, rollup_columns
+from src.database.schema import load_schema
+
+DB_PATH = os.path.join(os.path.dirname(__file__), 'digibook.db')
+
+# Each query either runs unchanged or must give the base-table result from a rollup
+EQUIVALENCE_QUERIES = [
+    "SELECT Year__c, SUM(Total__c) FROM obm GROUP BY Year__c",
+    "SELECT Year__c, Month__c, COUNT(*), COUNT(Total__c), AVG(Total__c) FROM obm GROUP BY Year__c, Month__c",
+    "SELECT COUNT(*), COUNT(Total__c), SUM(Total__c) FROM obm WHERE Year__c = -1",
+    "SELECT Primary_Practice__c, MAX(Month__c), COUNT(DISTINCT Type__c) FROM obm GROUP BY Primary_Practice__c",
+    "SELECT a.Vertical, SUM(o.Total__c) AS Revenue FROM obm o JOIN account a ON o.Account__c = a.Id GROUP BY a.Vertical",
+    "SELECT a.Name, SUM(o.Total__c) FROM obm o LEFT JOIN account a ON o.Account__c = a.Id GROUP BY a.Name",
+    "SELECT Year__c, SUM(CASE WHEN Type__c IS NOT NULL THEN Total__c ELSE 0 END) FROM obm GROUP BY Year__c",
+    # Total__c in a WHEN condition tests individual rows, which a rollup cannot answer
+    "SELECT Year__c, SUM(CASE WHEN Total__c > 1000 THEN Total__c ELSE 0 END) FROM obm GROUP BY Year__c",
+]
+
+
+def rows(conn, sql):
+    """Result rows in a canonical order, with floats rounded so summation order does not matter."""
+    result = [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in conn.execute(sql).fetchall()]
+    return sorted(result, key=repr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check rollup rewrites against the base tables.')
+    parser.add_argument('--db', type=str, default=DB_PATH, help='Path to digibook.db')
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'digibook.db')
+        shutil.copyfile(args.db, path)
+        conn = sqlite3.connect(path)
+        build_rollups(conn)
+        conn.commit()
+        schema, rollups = load_schema(conn), rollup_columns(conn)
+        for query in EQUIVALENCE_QUERIES:
+            rewritten = rewrite_with_rollups(query, schema, rollups)
+            if rewritten == query:
+                print(f"unchanged  {query}")
+                continue
+            same = rows(conn, query) == rows(conn, rewritten)
+            failed += not same
+            print(f"{'ok' if same else 'DIFFERENT':<10} {query}\n  -> {rewritten}")
+        conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
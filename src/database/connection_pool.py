@@ -0,0 +1,160 @@
+import os
+import queue
+import sqlite3
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+from config.config import SQLITE_CONFIG
+
+
+class SQLiteConnectionPool:
+    """Pool of read-only SQLite connections to digibook.db, shared across requests."""
+
+    def __init__(self, db_path, pool_size=8, timeout=30.0, mmap_size=256 * 1024 * 1024, cache_size=-65536):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file.
+            pool_size (int): Maximum number of open connections.
+            timeout (float): Seconds to wait for a free connection before giving up.
+            mmap_size (int): Bytes of the database file to memory-map per connection.
+            cache_size (int): SQLite page cache size (negative values are KiB).
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        """Open a new read-only connection with the tuned PRAGMAs applied."""
+        uri = f"file:{pathname2url(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute("PRAGMA query_only=ON")
+        logging.info(f"Opened pooled SQLite connection to {self.db_path}")
+        return conn
+
+    def acquire(self):
+        """
+        Take a connection from the pool, opening a new one while below pool_size.
+
+        Returns:
+            sqlite3.Connection: A read-only connection. Hand it back with release().
+        """
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_open = self._created < self.pool_size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No SQLite connection available after {self.timeout}s")
+                with self._lock:
+                    self._waits += 1
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that acquires a pooled connection and always releases it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def dedicated_connection(self):
+        """
+        Context manager for a read-only connection outside the pool, closed on exit.
+
+        For long-lived readers such as result streams, which would otherwise hold a
+        pooled connection for as long as the client takes to consume them.
+        """
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        """
+        Pool size and wait-time statistics.
+
+        Returns:
+            dict: Open/idle/in-use connection counts and acquire wait times in milliseconds.
+        """
+        with self._lock:
+            acquired = self._acquired
+            return {
+                "pool_size": self.pool_size,
+                "open_connections": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "acquired": acquired,
+                "waited": self._waits,
+                "avg_wait_ms": round(self._total_wait / acquired * 1000, 3) if acquired else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+    def close_all(self):
+        """Close every idle connection, e.g. before the database file is swapped out."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+pool = SQLiteConnectionPool(
+    db_path=SQLITE_CONFIG["db_path"],
+    pool_size=SQLITE_CONFIG["pool_size"],
+    timeout=SQLITE_CONFIG["pool_timeout"],
+    mmap_size=SQLITE_CONFIG["mmap_size"],
+    cache_size=SQLITE_CONFIG["cache_size"],
+)
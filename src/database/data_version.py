@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+META_TABLE = "digibook_meta"
+
+
+def ensure_meta_table(conn):
+    """Create the key/value metadata table used to track data loads."""
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)')
+
+
+def bump_generation(conn, table_name):
+    """
+    Record that a table was reloaded. Must run on a writable connection,
+    ideally in the same transaction as the load itself.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to digibook.db.
+        table_name (str): The table that was replaced.
+
+    Returns:
+        int: The new data generation.
+    """
+    ensure_meta_table(conn)
+    conn.execute(
+        f"INSERT INTO {META_TABLE} (key, value) VALUES ('generation', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+    conn.execute(
+        f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)",
+        (f"loaded_at:{table_name}", time.strftime('%Y-%m-%dT%H:%M:%S'))
+    )
+    return get_data_version(conn)
+
+
+def get_data_version(conn):
+    """
+    Current data generation of the database, bumped by every Excel load.
+
+    Args:
+        conn (sqlite3.Connection): Any connection to digibook.db.
+
+    Returns:
+        int: The generation, or 0 if the database has never been loaded by insert_from_excel.py.
+    """
+    try:
+        row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
@@ -0,0 +1,133 @@
+import sqlite3
+import logging
+
+from src.database.sql_text import Token, tokenize, table_references, unquote, render_tokens
+
+# Free-text columns the generator matches with LIKE '%term%'
+FTS_COLUMNS = {
+    "account": ["Name"],
+    "obm": ["Project_Name__c", "End_Client_Name_POC__c", "Sales_lead__c"],
+}
+
+# The trigram tokenizer can only use its index for patterns with at least 3 literal characters
+MIN_TERM_LENGTH = 3
+
+
+def fts_table(table):
+    return f"{table}_fts"
+
+
+def build_fts_indexes(conn, tables=None):
+    """
+    (Re)build the trigram FTS5 shadow index of each table in FTS_COLUMNS.
+
+    The indexes are external-content tables over the base table's rowid, so after
+    insert_from_excel.py replaces a table a 'rebuild' brings them back in sync.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to digibook.db.
+        tables (list[str], optional): Only rebuild the indexes of these tables.
+
+    Returns:
+        list[str]: The FTS tables that were built.
+    """
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        logging.warning(f"SQLite {sqlite3.sqlite_version} has no trigram tokenizer; skipping FTS indexes")
+        return []
+    built = []
+    for table, wanted in FTS_COLUMNS.items():
+        if tables is not None and table not in tables:
+            continue
+        existing = {row[1].lower(): row[1] for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+        columns = [existing[c.lower()] for c in wanted if c.lower() in existing]
+        if not columns:
+            continue
+        name = fts_table(table)
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            conn.execute(
+                f'CREATE VIRTUAL TABLE "{name}" USING fts5('
+                + ", ".join(f'"{c}"' for c in columns)
+                + f", content='{table}', content_rowid='rowid', tokenize='trigram')"
+            )
+            conn.execute(f"INSERT INTO \"{name}\"(\"{name}\") VALUES('rebuild')")
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Could not build full-text index {name}: {e}")
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            continue
+        built.append(name)
+        logging.info(f"Built full-text index {name}({', '.join(columns)})")
+    return built
+
+
+def _substring_pattern(token):
+    """True for a string literal of the form '%term%' whose term can use the trigram index."""
+    if token.kind != "string":
+        return False
+    value = token.value[1:-1]
+    if not (value.startswith("%") and value.endswith("%")):
+        return False
+    term = value[1:-1]
+    return len(term) >= MIN_TERM_LENGTH and "%" not in term and "_" not in term
+
+
+def rewrite_fts_predicates(sql, fts_cols):
+    """
+    Route col LIKE '%term%' on full-text indexed columns through the trigram index.
+
+        o.Project_Name__c LIKE '%alpha%'
+        -> o.rowid IN (SELECT rowid FROM obm_fts WHERE Project_Name__c LIKE '%alpha%')
+
+    FTS5 evaluates LIKE on a trigram table with the same case-insensitive semantics
+    as SQLite's LIKE, so results are unchanged.
+
+    Args:
+        sql (str): The query.
+        fts_cols (dict): Lowercase table -> set of indexed columns, see schema.fts_columns().
+
+    Returns:
+        str: The rewritten query, or the original text when nothing applied.
+    """
+    if not fts_cols:
+        return sql
+    tokens = tokenize(sql)
+    references = table_references(tokens)
+    aliases = {alias: table for table, alias in references}
+    tables = list(dict.fromkeys(table for table, _ in references))
+    output = []
+    changed = False
+    i, n = 0, len(tokens)
+    while i < n:
+        token = tokens[i]
+        qualified = (i + 2 < n and tokens[i + 1] == Token("punct", ".") and token.kind in ("word", "quoted"))
+        end = i + 3 if qualified else i + 1
+        if (token.kind in ("word", "quoted") and end + 1 < n
+                and tokens[end].kind == "word" and tokens[end].value.lower() == "like"
+                and _substring_pattern(tokens[end + 1])
+                and not (i > 0 and tokens[i - 1] == Token("punct", "."))
+                and not (end + 2 < n and tokens[end + 2].kind == "word" and tokens[end + 2].value.lower() == "escape")):
+            column = unquote(tokens[end - 1].value).lower()
+            if qualified:
+                table = aliases.get(unquote(token.value).lower())
+                rowid = [token, Token("punct", "."), Token("word", "rowid")]
+            else:
+                owners = [t for t in tables if column in fts_cols.get(t, ())]
+                table = owners[0] if len(owners) == 1 else None
+                # rowid must be qualified once several tables are read; skip self-joins
+                matches = [alias for t, alias in references if t == table]
+                if len(matches) != 1:
+                    table = None
+                elif len(references) == 1:
+                    rowid = [Token("word", "rowid")]
+                else:
+                    rowid = [Token("quoted", f'"{matches[0]}"'), Token("punct", "."), Token("word", "rowid")]
+            if table is not None and column in fts_cols.get(table, ()):
+                subquery = tokenize(
+                    f'IN (SELECT rowid FROM "{fts_table(table)}" WHERE "{unquote(tokens[end - 1].value)}" LIKE {tokens[end + 1].value})'
+                )
+                output.extend(rowid + subquery)
+                i, changed = end + 2, True
+                continue
+        output.append(token)
+        i += 1
+    return render_tokens(output) if changed else sql
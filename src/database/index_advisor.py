@@ -0,0 +1,402 @@
+import re
+import time
+import queue
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+
+from config.config import INDEX_ADVISOR_CONFIG
+from src.database.connection_pool import pool
+from src.database.query_governor import QueryLimits, execute_governed
+from src.database.schema import load_schema, column_sets, nocase_columns
+from src.database.sql_text import (
+    Token, tokenize, table_references, column_references, clause_at, sql_fingerprint
+)
+
+# Columns the generated queries filter, join and group on most (see db_schema_and_rules.md).
+# These are indexed on every load regardless of what the advisor has observed. Categorical and
+# free-text columns are indexed COLLATE NOCASE to serve the predicates produced by sql_normalizer;
+# id and join columns stay BINARY (see schema.nocase_columns()).
+BASELINE_INDEXES = {
+    "obm": [
+        ("Year__c", "Month__c"),
+        ("Account__c", "Year__c"),
+        ("Primary_Practice__c",),
+        ("Type__c",),
+        ("Client_Geography_Tagging__c",),
+        ("CreatedById",),
+        ("LastModifiedById",),
+        ("Owner__c",),
+    ],
+    "account": [
+        ("Vertical",),
+        ("Industry",),
+        ("Name",),
+        ("OwnerId",),
+        ("CreatedById",),
+        ("LastModifiedById",),
+    ],
+}
+
+_EQUALITY_OPS = {"=", "==", "is", "in"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "between", "like", "glob"}
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?")
+
+
+def full_scans(conn, sql):
+    """
+    Tables (by alias) that a query reads with a full table scan.
+
+    Args:
+        conn (sqlite3.Connection): Connection to plan the query on.
+        sql (str): The query.
+
+    Returns:
+        list[str]: Lowercase aliases of the scanned tables, from EXPLAIN QUERY PLAN.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    scans = []
+    for row in plan:
+        match = _FULL_SCAN.match(row[3])
+        if match and "USING" not in row[3]:
+            scans.append((match.group(2) or match.group(1)).lower())
+    return scans
+
+
+def index_name(table, columns, nocase=()):
+    key = ",".join(f"{c} nocase" if c.lower() in nocase else c for c in columns)
+    digest = hashlib.sha1(key.lower().encode("utf-8")).hexdigest()[:8]
+    return f"idx_auto_{table}_{digest}"
+
+
+def create_index_sql(table, columns, nocase=(), name=None):
+    """
+    CREATE INDEX statement for table(columns).
+
+    Args:
+        table (str): Table name.
+        columns (tuple): Indexed columns in key order.
+        nocase (set): Lowercase names of columns to index COLLATE NOCASE.
+        name (str, optional): Index name. Defaults to a stable hash of the definition.
+    """
+    name = name or index_name(table, columns, nocase)
+    column_list = ", ".join(f'"{c}" COLLATE NOCASE' if c.lower() in nocase else f'"{c}"' for c in columns)
+    return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({column_list})'
+
+
+class IndexAdvisor:
+    """
+    Records the query plans of executed SQL and proposes indexes for full table scans.
+
+    Observations are kept in a small writable SQLite file next to digibook.db, because the
+    API only holds read-only connections to the main database. insert_from_excel.py reads
+    them back after each load to build the proposed indexes.
+
+    observe() only queues the query; a background thread plans the queued queries on its own
+    read-only connection and writes them to the log in batches, one commit per batch.
+    """
+
+    def __init__(self, log_path, max_index_columns=6, queue_size=10000, flush_interval=2.0):
+        """
+        Args:
+            log_path (str): Path of the observation log database.
+            max_index_columns (int): Upper bound on columns per proposed (covering) index.
+            queue_size (int): Observations held before new ones are dropped.
+            flush_interval (float): Seconds the writer waits to collect a batch.
+        """
+        self.log_path = log_path
+        self.max_index_columns = max_index_columns
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._dropped = 0
+
+    def _log(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.log_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_log ("
+                "fingerprint TEXT PRIMARY KEY, sql TEXT, executions INTEGER, "
+                "full_scans TEXT, total_ms REAL, last_seen TEXT)"
+            )
+        return self._conn
+
+    def observe(self, sql, elapsed_ms):
+        """
+        Queue one execution of a query for the background writer.
+
+        Never blocks or raises: when the queue is full the observation is dropped.
+
+        Args:
+            sql (str): The executed query.
+            elapsed_ms (float): Execution time reported by the query governor.
+        """
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="index-advisor", daemon=True)
+                    self._writer.start()
+        try:
+            self._pending.put_nowait((sql, elapsed_ms, time.strftime('%Y-%m-%dT%H:%M:%S')))
+        except queue.Full:
+            self._dropped += 1
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued observation has been written.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        """Observations waiting to be written and observations dropped because the queue was full."""
+        return {"pending": self._pending.qsize(), "dropped": self._dropped}
+
+    def _next_batch(self):
+        """Block for one observation, then collect whatever else arrives within flush_interval."""
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logging.warning(f"Index advisor could not record {len(batch)} query plan(s): {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+    def _write_batch(self, batch):
+        """Plan each observed query and upsert the batch into query_log in one transaction."""
+        entries = {}
+        with pool.dedicated_connection() as plan_conn:
+            for sql, elapsed_ms, seen in batch:
+                fingerprint = sql_fingerprint(sql)
+                if fingerprint in entries:
+                    entry = entries[fingerprint]
+                    entries[fingerprint] = (sql, entry[1] + 1, entry[2], entry[3] + elapsed_ms, seen)
+                    continue
+                try:
+                    scans = ",".join(full_scans(plan_conn, sql))
+                except sqlite3.Error as e:
+                    logging.warning(f"Index advisor could not plan query: {e}")
+                    continue
+                entries[fingerprint] = (sql, 1, scans, elapsed_ms, seen)
+        with self._lock:
+            log = self._log()
+            log.executemany(
+                "INSERT INTO query_log (fingerprint, sql, executions, full_scans, total_ms, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(fingerprint) DO UPDATE SET executions = executions + excluded.executions, "
+                "full_scans = excluded.full_scans, total_ms = total_ms + excluded.total_ms, "
+                "last_seen = excluded.last_seen",
+                [(fingerprint, *entry) for fingerprint, entry in entries.items()]
+            )
+            log.commit()
+
+    def observed_queries(self, only_scans=False, limit=None):
+        """
+        Logged queries, most frequently executed first.
+
+        Returns:
+            list[dict]: fingerprint, sql, executions, full_scans (list) and avg_ms per query.
+        """
+        with self._lock:
+            rows = self._log().execute(
+                "SELECT fingerprint, sql, executions, full_scans, total_ms FROM query_log "
+                + ("WHERE full_scans != '' " if only_scans else "")
+                + "ORDER BY executions DESC, total_ms DESC"
+                + (f" LIMIT {int(limit)}" if limit else "")
+            ).fetchall()
+        return [
+            {
+                "fingerprint": fingerprint,
+                "sql": sql,
+                "executions": executions,
+                "full_scans": [s for s in scans.split(",") if s],
+                "avg_ms": round(total_ms / executions, 3) if executions else 0.0,
+            }
+            for fingerprint, sql, executions, scans, total_ms in rows
+        ]
+
+    def propose_indexes(self, schema):
+        """
+        Propose one index per scanned table and query shape.
+
+        Key columns are ordered equality predicates first, then range/prefix
+        predicates, then GROUP BY columns; the remaining referenced columns of the
+        table are appended to make the index covering while it stays within
+        max_index_columns.
+
+        Args:
+            schema (dict): Output of load_schema().
+
+        Returns:
+            list[tuple]: (table, columns) pairs, weighted by how often the shape was executed.
+        """
+        columns_by_table = column_sets(schema)
+        names = {table: {c.lower(): c for c in cols} for table, cols in schema.items()}
+        weights = defaultdict(int)
+        for query in self.observed_queries(only_scans=True):
+            tokens = tokenize(query["sql"])
+            references = table_references(tokens)
+            aliases = {alias: table for table, alias in references}
+            scanned = {aliases.get(alias, alias) for alias in query["full_scans"]}
+            clauses = clause_at(tokens)
+            roles = defaultdict(lambda: defaultdict(set))
+            for table, column, i, qualifier in column_references(tokens, references, columns_by_table):
+                if table not in scanned:
+                    continue
+                start = i - 2 if qualifier else i
+                following = tokens[i + 1] if i + 1 < len(tokens) else Token("punct", "")
+                preceding = tokens[start - 1] if start > 0 else Token("punct", "")
+                op = following.value.lower()
+                if op == "not" and i + 2 < len(tokens):
+                    op = tokens[i + 2].value.lower()
+                if clauses[i] in ("where", "on") and (op in _EQUALITY_OPS or preceding.value in ("=", "==")):
+                    roles[table]["eq"].add(column)
+                elif clauses[i] in ("where", "on") and op in _RANGE_OPS:
+                    roles[table]["range"].add(column)
+                elif clauses[i] == "group":
+                    roles[table]["group"].add(column)
+                else:
+                    roles[table]["other"].add(column)
+            for table, role in roles.items():
+                key = sorted(role["eq"]) + sorted(role["range"] - role["eq"])[:1]
+                key += [c for c in sorted(role["group"]) if c not in key]
+                if not key:
+                    continue
+                covering = key + [c for c in sorted(role["other"] | role["range"]) if c not in key]
+                columns = covering if len(covering) <= self.max_index_columns else key[:self.max_index_columns]
+                weights[(table, tuple(names[table][c] for c in columns))] += query["executions"]
+
+        # Drop proposals that are a prefix of a longer proposal on the same table
+        proposals = sorted(weights, key=lambda p: (-weights[p], -len(p[1])))
+        kept = []
+        for table, columns in proposals:
+            lowered = [c.lower() for c in columns]
+            if any(t == table and [c.lower() for c in cols[:len(lowered)]] == lowered for t, cols in kept):
+                continue
+            kept.append((table, columns))
+        return kept
+
+
+def _timed(conn, sql, limits):
+    """Best-of-three execution time in ms, or None when the query is over budget."""
+    best = None
+    for _ in range(3):
+        result = execute_governed(conn, sql, limits)
+        if result.aborted:
+            return None
+        best = result.elapsed_ms if best is None else min(best, result.elapsed_ms)
+    return best
+
+
+def build_indexes(db_path, advisor=None, benchmark_limit=None):
+    """
+    Create the baseline and advisor-proposed indexes, then report which observed
+    query fingerprints got faster.
+
+    Args:
+        db_path (str): Path to digibook.db (opened read-write).
+        advisor (IndexAdvisor, optional): Source of observations. Defaults to the shared advisor.
+        benchmark_limit (int, optional): How many observed queries to time before and after.
+
+    Returns:
+        list[dict]: One entry per benchmarked fingerprint with before/after timings and scans.
+    """
+    advisor = advisor or index_advisor
+    benchmark_limit = benchmark_limit or INDEX_ADVISOR_CONFIG["benchmark_queries"]
+    limits = QueryLimits(timeout_seconds=INDEX_ADVISOR_CONFIG["benchmark_timeout"], max_rows=1_000_000, max_bytes=2 ** 62)
+    conn = sqlite3.connect(db_path)
+    try:
+        schema = load_schema(conn)
+        columns_by_table = column_sets(schema)
+        nocase = nocase_columns(conn)
+        queries = advisor.observed_queries(limit=benchmark_limit)
+
+        conn.execute("PRAGMA query_only=ON")
+        before = {}
+        for query in queries:
+            try:
+                before[query["fingerprint"]] = (_timed(conn, query["sql"], limits), full_scans(conn, query["sql"]))
+            except sqlite3.Error:
+                continue
+        conn.execute("PRAGMA query_only=OFF")
+
+        wanted = []
+        for table, index_columns in BASELINE_INDEXES.items():
+            for columns in index_columns:
+                if all(c.lower() in columns_by_table.get(table, ()) for c in columns):
+                    wanted.append((table, columns))
+        wanted.extend(advisor.propose_indexes(schema))
+        for table, columns in wanted:
+            conn.execute(create_index_sql(table, columns, nocase.get(table, ())))
+            logging.info(f"Ensured index on {table}({', '.join(columns)})")
+        conn.execute("ANALYZE")
+        conn.commit()
+
+        conn.execute("PRAGMA query_only=ON")
+        report = []
+        for query in queries:
+            if query["fingerprint"] not in before:
+                continue
+            before_ms, before_scans = before[query["fingerprint"]]
+            after_ms, after_scans = _timed(conn, query["sql"], limits), full_scans(conn, query["sql"])
+            report.append({
+                "fingerprint": query["fingerprint"],
+                "executions": query["executions"],
+                "before_ms": before_ms,
+                "after_ms": after_ms,
+                "speedup": round(before_ms / after_ms, 2) if before_ms and after_ms else None,
+                "scans_before": before_scans,
+                "scans_after": after_scans,
+            })
+        conn.execute("PRAGMA query_only=OFF")
+        return report
+    finally:
+        conn.close()
+
+
+def print_report(report):
+    """Print the before/after table produced by build_indexes()."""
+    if not report:
+        print("Index advisor: no observed queries to benchmark.")
+        return
+    print(f"{'fingerprint':<18}{'runs':>6}{'before ms':>12}{'after ms':>12}{'speedup':>9}  full scans")
+    for entry in sorted(report, key=lambda e: -(e["speedup"] or 0)):
+        before_ms = "timeout" if entry["before_ms"] is None else f"{entry['before_ms']:.2f}"
+        after_ms = "timeout" if entry["after_ms"] is None else f"{entry['after_ms']:.2f}"
+        speedup = f"{entry['speedup']}x" if entry["speedup"] else "-"
+        scans = f"{','.join(entry['scans_before']) or '-'} -> {','.join(entry['scans_after']) or '-'}"
+        print(f"{entry['fingerprint']:<18}{entry['executions']:>6}{before_ms:>12}{after_ms:>12}{speedup:>9}  {scans}")
+
+
+index_advisor = IndexAdvisor(
+    log_path=INDEX_ADVISOR_CONFIG["log_path"],
+    max_index_columns=INDEX_ADVISOR_CONFIG["max_index_columns"],
+    queue_size=INDEX_ADVISOR_CONFIG["queue_size"],
+    flush_interval=INDEX_ADVISOR_CONFIG["flush_interval"],
+)
@@ -2,6 +2,11 @@ import pandas as pd
 import sqlite3
 import argparse
 import os
+from src.database.data_version import bump_generation, get_data_version
+from src.database.fts_index import build_fts_indexes
+from src.database.index_advisor import build_indexes, print_report
+from src.database.rollups import SOURCE_TABLES, build_rollups, carry_rollups_forward
+from src.database.value_dictionary import build_value_dictionary
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'digibook.db')
 
@@ -15,7 +20,10 @@ def insert_data_from_excel(table_name, excel_file):
     for col in df.select_dtypes(include=['object']).columns:
         df[col] = df[col].apply(lambda x: x.lower() if isinstance(x, str) else x)
     conn = sqlite3.connect(DB_PATH)
+    # WAL lets the API's read-only pooled connections keep reading during a load
+    conn.execute('PRAGMA journal_mode=WAL')
     cursor = conn.cursor()
+    previous = get_data_version(conn)
     # Empty the table before inserting new data
     cursor.execute(f'DELETE FROM {table_name}')
     # Quote all column names to handle special characters
@@ -24,25 +32,56 @@ def insert_data_from_excel(table_name, excel_file):
     insert_sql = f"INSERT OR IGNORE INTO {table_name} ({columns}) VALUES ({placeholders})"
     data = [tuple(row) for row in df.values]
     cursor.executemany(insert_sql, data)
+    # The trigram indexes map rowids to rows, so they must be rebuilt before the new rows become visible
+    fts_tables = build_fts_indexes(conn, [table_name])
+    # Invalidates cached query results held by running API processes
+    generation = bump_generation(conn, table_name)
+    # Rollups are refreshed in the load transaction, so they are never stamped with a generation they do not reflect
+    rollups = []
+    if table_name in SOURCE_TABLES:
+        rollups = build_rollups(conn)
+    else:
+        carry_rollups_forward(conn, previous)
     conn.commit()
     conn.close()
-    print(f"Emptied and inserted {len(df)} rows into {table_name} from {excel_file}")
+    print(f"Emptied and inserted {len(df)} rows into {table_name} from {excel_file} (data generation {generation})")
+    if fts_tables:
+        print(f"Rebuilt full-text indexes: {', '.join(fts_tables)}")
+    for name, rows in rollups:
+        print(f"Rebuilt rollup table {name} ({rows} rows)")
+
+def refresh_value_dictionary(tables):
+    conn = sqlite3.connect(DB_PATH)
+    built = build_value_dictionary(conn, tables)
+    conn.commit()
+    conn.close()
+    for table, column, values in built:
+        print(f"Indexed {values} distinct values of {table}.{column}")
 
 def main():
     parser = argparse.ArgumentParser(description='Insert data from Excel files into digibook.db tables.')
     parser.add_argument('--user', type=str, help='Path to Excel file for user table')
     parser.add_argument('--account', type=str, help='Path to Excel file for account table')
     parser.add_argument('--obm', type=str, help='Path to Excel file for obm table')
+    parser.add_argument('--skip-indexes', action='store_true', help='Do not build baseline and advisor-proposed indexes after loading')
     args = parser.parse_args()
 
+    loaded = []
     if args.user:
         insert_data_from_excel('user', args.user)
+        loaded.append('user')
     if args.account:
         insert_data_from_excel('account', args.account)
+        loaded.append('account')
     if args.obm:
         insert_data_from_excel('obm', args.obm)
-    if not (args.user or args.account or args.obm):
+        loaded.append('obm')
+    if not loaded:
         print('No Excel files provided. Use --user, --account, or --obm to specify files.')
+        return
+    refresh_value_dictionary(loaded)
+    if not args.skip_indexes:
+        print_report(build_indexes(DB_PATH))
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,181 @@
+import sqlite3
+import time
+from typing import Any, Optional
+from pydantic import BaseModel, Field
+
+from config.config import QUERY_LIMITS_CONFIG
+
+
+class QueryLimits(BaseModel):
+    timeout_seconds: float = Field(default=10.0, description="Wall-clock budget for executing and fetching a query.")
+    max_vm_steps: int = Field(default=50_000_000, description="Maximum SQLite virtual machine instructions per query.")
+    max_rows: int = Field(default=5000, description="Maximum number of rows returned to the caller.")
+    max_bytes: int = Field(default=5 * 1024 * 1024, description="Approximate maximum size of the returned rows.")
+    progress_interval: int = Field(default=1000, description="VM instructions between progress handler calls.")
+    fetch_size: int = Field(default=500, description="Rows pulled per fetchmany() call.")
+
+
+class QueryResult(BaseModel):
+    columns: list[str] = Field(default_factory=list)
+    rows: list[Any] = Field(default_factory=list)
+    status: str = Field(default="ok", description="ok, truncated (a row/byte cap was hit) or aborted (time/step budget exceeded).")
+    reason: Optional[str] = None
+    elapsed_ms: float = 0.0
+    vm_steps: int = 0
+
+    @property
+    def truncated(self):
+        return self.status == "truncated"
+
+    @property
+    def aborted(self):
+        return self.status == "aborted"
+
+
+default_limits = QueryLimits(**QUERY_LIMITS_CONFIG)
+
+
+def execute_governed(conn, query, limits=None, params=()):
+    """
+    Execute a query under a time, VM-step, row and byte budget.
+
+    Args:
+        conn (sqlite3.Connection): Connection to run the query on.
+        query (str): The SQL query.
+        limits (QueryLimits, optional): Budget to enforce. Defaults to QUERY_LIMITS_CONFIG.
+        params (tuple): Bound parameters for the query.
+
+    Returns:
+        QueryResult: The fetched rows, with status "truncated" or "aborted" when a limit was hit.
+    """
+    limits = limits or default_limits
+    start = time.perf_counter()
+    deadline = start + limits.timeout_seconds
+    budget = {"steps": 0, "reason": None}
+
+    def on_progress():
+        budget["steps"] += limits.progress_interval
+        if budget["steps"] > limits.max_vm_steps:
+            budget["reason"] = f"exceeded the limit of {limits.max_vm_steps} SQLite VM steps"
+            return 1
+        if time.perf_counter() > deadline:
+            budget["reason"] = f"exceeded the {limits.timeout_seconds:g}s time limit"
+            return 1
+        return 0
+
+    columns, rows = [], []
+    status, reason = "ok", None
+    conn.set_progress_handler(on_progress, limits.progress_interval)
+    try:
+        cursor = conn.execute(query, params)
+        columns = [description[0] for description in cursor.description] if cursor.description else []
+        size = 0
+        while status == "ok":
+            batch = cursor.fetchmany(limits.fetch_size)
+            if not batch:
+                break
+            for row in batch:
+                if len(rows) >= limits.max_rows:
+                    status, reason = "truncated", f"row limit of {limits.max_rows} reached"
+                    break
+                size += 16 + sum(len(str(item)) for item in row)
+                if size > limits.max_bytes:
+                    status, reason = "truncated", f"size limit of {limits.max_bytes} bytes reached"
+                    break
+                rows.append(row)
+        cursor.close()
+    except sqlite3.OperationalError:
+        if budget["reason"] is None:
+            raise
+        status, reason = "aborted", budget["reason"]
+    finally:
+        conn.set_progress_handler(None, 0)
+
+    return QueryResult.model_construct(
+        columns=columns,
+        rows=rows,
+        status=status,
+        reason=reason,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 3),
+        vm_steps=budget["steps"],
+    )
+
+
+def iter_governed(conn, query, batch_size, limits=None, params=(), skip=0):
+    """
+    Execute a query once and yield its rows in batches, each under its own time, VM-step and byte budget.
+
+    The statement stays open between batches, so rows come back in the order the query
+    produces them and no batch re-runs the query. The caller owns the connection for as
+    long as the generator is alive.
+
+    Args:
+        conn (sqlite3.Connection): Connection to run the query on.
+        query (str): The SQL query.
+        batch_size (int): Rows per yielded batch.
+        limits (QueryLimits, optional): Per-batch budget. Defaults to QUERY_LIMITS_CONFIG; max_rows is not applied.
+        params (tuple): Bound parameters for the query.
+        skip (int): Rows to discard before the first batch.
+
+    Yields:
+        QueryResult: batch_size rows at a time, fewer in the last batch. A batch with status
+        "truncated" or "aborted" ends the iteration.
+    """
+    limits = limits or default_limits
+    budget = {"steps": 0, "deadline": 0.0, "reason": None}
+
+    def on_progress():
+        budget["steps"] += limits.progress_interval
+        if budget["steps"] > limits.max_vm_steps:
+            budget["reason"] = f"exceeded the limit of {limits.max_vm_steps} SQLite VM steps"
+            return 1
+        if time.perf_counter() > budget["deadline"]:
+            budget["reason"] = f"exceeded the {limits.timeout_seconds:g}s time limit"
+            return 1
+        return 0
+
+    conn.set_progress_handler(on_progress, limits.progress_interval)
+    cursor, columns = None, []
+    try:
+        while True:
+            start = time.perf_counter()
+            budget["steps"], budget["deadline"] = 0, start + limits.timeout_seconds
+            rows, size = [], 0
+            status, reason = "ok", None
+            try:
+                if cursor is None:
+                    cursor = conn.execute(query, params)
+                    columns = [description[0] for description in cursor.description] if cursor.description else []
+                    while skip > 0:
+                        skipped = cursor.fetchmany(min(skip, limits.fetch_size))
+                        if not skipped:
+                            break
+                        skip -= len(skipped)
+                while status == "ok" and len(rows) < batch_size:
+                    batch = cursor.fetchmany(min(batch_size - len(rows), limits.fetch_size))
+                    if not batch:
+                        break
+                    for row in batch:
+                        size += 16 + sum(len(str(item)) for item in row)
+                        if size > limits.max_bytes:
+                            status, reason = "truncated", f"size limit of {limits.max_bytes} bytes reached"
+                            break
+                        rows.append(row)
+            except sqlite3.OperationalError:
+                if budget["reason"] is None:
+                    raise
+                status, reason = "aborted", budget["reason"]
+            yield QueryResult.model_construct(
+                columns=columns,
+                rows=rows,
+                status=status,
+                reason=reason,
+                elapsed_ms=round((time.perf_counter() - start) * 1000, 3),
+                vm_steps=budget["steps"],
+            )
+            if status != "ok" or len(rows) < batch_size:
+                return
+    finally:
+        if cursor is not None:
+            cursor.close()
+        conn.set_progress_handler(None, 0)
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+
+from config.config import RESULT_CACHE_CONFIG
+from src.database.sql_text import tokenize
+
+# Queries touching these can return different rows for the same data version
+_VOLATILE_WORDS = {"random", "randomblob", "current_date", "current_time", "current_timestamp", "changes", "last_insert_rowid"}
+
+
+def estimate_size(columns, rows):
+    """Rough size in bytes of a result set, used for the cache memory bound."""
+    size = sum(len(str(c)) for c in columns)
+    for row in rows:
+        size += 16 + sum(len(str(item)) for item in row)
+    return size
+
+
+def is_cacheable(sql):
+    """True unless the query depends on the clock or on random values."""
+    for token in tokenize(sql):
+        if token.kind == "word" and token.value.lower() in _VOLATILE_WORDS:
+            return False
+        if token.kind == "string" and token.value.lower() in ("'now'", "'localtime'"):
+            return False
+    return True
+
+
+class QueryResultCache:
+    """
+    LRU cache of query results keyed by SQL fingerprint and database data version.
+
+    All entries are dropped as soon as a lookup sees a newer data version, so a
+    reload by insert_from_excel.py never serves stale rows.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int): Maximum number of cached result sets.
+            max_bytes (int): Approximate memory bound across all entries.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, fingerprint, version):
+        """
+        Look up a cached result.
+
+        Args:
+            fingerprint (str): Fingerprint of the canonical SQL.
+            version (int): Current data version of the database.
+
+        Returns:
+            QueryResult | None: The cached result on a hit, otherwise None.
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, fingerprint, version, result):
+        """Store a QueryResult, evicting least recently used entries to stay within bounds."""
+        size = estimate_size(result.columns, result.rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            old = self._entries.pop(fingerprint, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[fingerprint] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "data_version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+result_cache = QueryResultCache(
+    max_entries=RESULT_CACHE_CONFIG["max_entries"],
+    max_bytes=RESULT_CACHE_CONFIG["max_bytes"],
+)
@@ -0,0 +1,165 @@
+import os
+import hmac
+import json
+import base64
+import hashlib
+import secrets
+from typing import Any, Optional
+from pydantic import BaseModel, Field
+
+from config.config import RESULT_PAGES_CONFIG
+from src.database.connection_pool import pool
+from src.database.data_version import get_data_version
+from src.database.query_governor import execute_governed, iter_governed
+from src.database.sql_text import tokenize
+
+# Tokens are only valid inside the process that issued them unless a shared secret is configured
+_SECRET = (os.getenv("RESULT_CURSOR_SECRET") or "").encode("utf-8") or secrets.token_bytes(32)
+
+
+class CursorError(Exception):
+    """Raised when a continuation token is malformed, forged or refers to data that has since been reloaded."""
+
+
+class ResultPage(BaseModel):
+    sql: str = Field(description="The query this page belongs to.")
+    columns: list[str] = Field(default_factory=list)
+    rows: list[Any] = Field(default_factory=list)
+    offset: int = Field(default=0, description="Zero-based index of the first row in this page.")
+    total_rows: Optional[int] = Field(default=None, description="Total rows produced by the query, if known.")
+    cursor: Optional[str] = Field(default=None, description="Opaque token for the next page, None on the last page.")
+    status: str = Field(default="ok", description="Status of the underlying QueryResult.")
+    reason: Optional[str] = None
+
+
+def strip_statement(sql):
+    """Remove trailing semicolons/whitespace so a query can be wrapped as a subquery."""
+    sql = sql.strip()
+    while sql.endswith(";"):
+        sql = sql[:-1].rstrip()
+    return sql
+
+
+def encode_cursor(sql, offset, version):
+    """Create an opaque, signed continuation token for the rows of sql starting at offset."""
+    payload = json.dumps({"q": strip_statement(sql), "o": offset, "v": version}, separators=(",", ":")).encode("utf-8")
+    signature = hmac.new(_SECRET, payload, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(signature + payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Verify and unpack a continuation token.
+
+    Returns:
+        tuple: (sql, offset, version)
+
+    Raises:
+        CursorError: If the token is malformed or its signature does not match.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        signature, payload = raw[:16], raw[16:]
+    except Exception:
+        raise CursorError("Malformed result cursor")
+    expected = hmac.new(_SECRET, payload, hashlib.sha256).digest()[:16]
+    if not hmac.compare_digest(signature, expected):
+        raise CursorError("Invalid result cursor")
+    data = json.loads(payload)
+    return data["q"], data["o"], data["v"]
+
+
+def count_rows(conn, sql):
+    """Total number of rows a query produces, or None if counting exceeds the query budget."""
+    result = execute_governed(conn, f"SELECT COUNT(*) FROM ({strip_statement(sql)})")
+    if result.status != "ok" or not result.rows:
+        return None
+    return result.rows[0][0]
+
+
+def first_page(conn, sql, result, version, page_size=None):
+    """
+    Build the first page of an already executed query.
+
+    Args:
+        conn (sqlite3.Connection): Connection used to count rows when the result was truncated.
+        sql (str): The query that produced result.
+        result (QueryResult): The governed result of running sql.
+        version (int): Data version the result was read at.
+        page_size (int, optional): Rows per page. Defaults to RESULT_PAGES_CONFIG.
+
+    Returns:
+        ResultPage: The first page, with a cursor when more rows exist.
+    """
+    page_size = page_size or RESULT_PAGES_CONFIG["page_size"]
+    total = count_rows(conn, sql) if result.truncated else len(result.rows)
+    has_more = total is None or total > page_size
+    return ResultPage(
+        sql=sql,
+        columns=result.columns,
+        rows=result.rows[:page_size],
+        offset=0,
+        total_rows=total,
+        cursor=encode_cursor(sql, page_size, version) if has_more else None,
+        status=result.status,
+        reason=result.reason,
+    )
+
+
+def iter_pages(token, page_size=None):
+    """
+    Yield the remaining pages of a query straight from SQLite, starting at the cursor.
+
+    The query runs once, as written, on a dedicated read-only connection inside a single
+    read transaction, and each page is fetched from the open statement under its own
+    query budget. Pages therefore keep the query's own ORDER BY, all come from the same
+    snapshot, and no pooled connection is held while the client consumes the stream.
+
+    Args:
+        token (str): Continuation token from a previous page.
+        page_size (int, optional): Rows per page. Defaults to RESULT_PAGES_CONFIG.
+
+    Yields:
+        ResultPage: Successive pages until the result is exhausted.
+
+    Raises:
+        CursorError: If the token is invalid or the data was reloaded since it was issued.
+    """
+    sql, offset, version = decode_cursor(token)
+    page_size = min(page_size or RESULT_PAGES_CONFIG["page_size"], RESULT_PAGES_CONFIG["max_page_size"])
+    tokens = tokenize(sql)
+    if not tokens or tokens[0].value.upper() not in ("SELECT", "WITH", "VALUES"):
+        raise CursorError("Result cursor does not refer to a SELECT query")
+    with pool.dedicated_connection() as conn:
+        # WAL readers do not block loads; the transaction pins the snapshot the version was checked on
+        conn.execute("BEGIN")
+        batches = None
+        try:
+            if get_data_version(conn) != version:
+                raise CursorError("The database was reloaded since this cursor was issued; run the question again")
+            total = count_rows(conn, sql)
+            # The client already has the first offset rows, from the page that issued the cursor
+            batches = iter_governed(conn, sql, page_size, skip=offset)
+            result = next(batches, None)
+            while result is not None:
+                following = None
+                if result.status == "ok" and len(result.rows) == page_size:
+                    following = next(batches, None)
+                    if following is not None and not following.rows and following.status == "ok":
+                        following = None
+                yield ResultPage(
+                    sql=sql,
+                    columns=result.columns,
+                    rows=result.rows,
+                    offset=offset,
+                    total_rows=total,
+                    cursor=encode_cursor(sql, offset + page_size, version) if following is not None else None,
+                    status=result.status,
+                    reason=result.reason,
+                )
+                result = following
+                offset += page_size
+        finally:
+            if batches is not None:
+                batches.close()
+            conn.rollback()
@@ -0,0 +1,116 @@
+import html
+
+
+def format_value(value):
+    """Render a single cell deterministically: NULL as empty, floats without binary noise."""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return str(round(value, 6))
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    return str(value)
+
+
+def _footer(page):
+    if page.cursor:
+        total = page.total_rows if page.total_rows is not None else "more"
+        return f"Showing rows {page.offset + 1}-{page.offset + len(page.rows)} of {total}."
+    if page.status == "truncated":
+        return f"Result truncated: {page.reason}."
+    return None
+
+
+def render_markdown(page):
+    """
+    Render a ResultPage as a GitHub-flavoured markdown table.
+
+    Args:
+        page (ResultPage): The rows to render.
+
+    Returns:
+        str: The markdown table, or "No data found." for an empty result.
+    """
+    if not page.rows:
+        return "No data found."
+
+    def cell(value):
+        return format_value(value).replace("|", "\\|").replace("\n", " ")
+
+    lines = [
+        "| " + " | ".join(cell(c) for c in page.columns) + " |",
+        "|" + "|".join(" ---: " if _is_numeric_column(page, i) else " --- " for i in range(len(page.columns))) + "|",
+    ]
+    lines.extend("| " + " | ".join(cell(v) for v in row) + " |" for row in page.rows)
+    footer = _footer(page)
+    if footer:
+        lines.append("")
+        lines.append(f"_{footer}_")
+    return "\n".join(lines)
+
+
+def render_html(page):
+    """Render a ResultPage as an HTML table, e.g. for Microsoft Teams messages."""
+    if not page.rows:
+        return "<p>No data found.</p>"
+    header = "".join(f"<th>{html.escape(str(c))}</th>" for c in page.columns)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(format_value(v))}</td>" for v in row) + "</tr>"
+        for row in page.rows
+    )
+    output = f"<table><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>"
+    footer = _footer(page)
+    if footer:
+        output += f"<p><i>{html.escape(footer)}</i></p>"
+    return output
+
+
+def render_json(page):
+    """Render a ResultPage as a JSON-serialisable dict."""
+    return {
+        "columns": list(page.columns),
+        "rows": [[v if not isinstance(v, bytes) else format_value(v) for v in row] for row in page.rows],
+        "offset": page.offset,
+        "total_rows": page.total_rows,
+        "cursor": page.cursor,
+    }
+
+
+def _is_numeric_column(page, index):
+    values = [row[index] for row in page.rows if row[index] is not None]
+    return bool(values) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+
+
+def summarize(page, sample_rows=5):
+    """
+    Compact description of a ResultPage for the LLM to explain, instead of the full table.
+
+    Args:
+        page (ResultPage): The first page of the query result.
+        sample_rows (int): Number of leading rows to include verbatim.
+
+    Returns:
+        str: Row count, columns, a few sample rows and min/max/sum of numeric columns.
+    """
+    if not page.rows:
+        return "No results found."
+    total = page.total_rows if page.total_rows is not None else f"more than {len(page.rows)}"
+    lines = [
+        f"Rows returned: {total}",
+        f"Columns: {', '.join(page.columns)}",
+        f"First {min(sample_rows, len(page.rows))} rows:",
+    ]
+    for row in page.rows[:sample_rows]:
+        lines.append("  " + "\t".join(format_value(v) for v in row))
+    for i, column in enumerate(page.columns):
+        if _is_numeric_column(page, i) and len(page.rows) > 1:
+            values = [row[i] for row in page.rows if row[i] is not None]
+            scope = "shown rows" if page.cursor else "all rows"
+            lines.append(
+                f"{column} ({scope}): min {format_value(min(values))}, max {format_value(max(values))}, "
+                f"sum {format_value(sum(values))}"
+            )
+    if page.status == "truncated":
+        lines.append(f"Note: result truncated ({page.reason}).")
+    lines.append("The full table is rendered for the user automatically; do not reproduce it.")
+    return "\n".join(lines)
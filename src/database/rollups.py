@@ -0,0 +1,454 @@
+import sqlite3
+import logging
+from collections import defaultdict
+
+from src.database.data_version import META_TABLE, ensure_meta_table, get_data_version
+from src.database.sql_text import (
+    CLAUSE_KEYWORDS, Token, tokenize, token_spans, table_references, column_references, unquote, render_tokens
+)
+
+# Rollup tables of obm revenue, smallest first; a query is answered from the first one
+# that has every column it needs. Account attributes are joined on obm.Account__c.
+ROLLUPS = {
+    "rollup_obm_practice": {
+        "obm": ["Year__c", "Month__c", "Primary_Practice__c", "Type__c", "Client_Geography_Tagging__c",
+                "Country_Bill_to_Budget_owning_geo__c", "Pricing_Model__c"],
+        "account": ["Vertical", "Industry"],
+    },
+    "rollup_obm_account": {
+        "obm": ["Year__c", "Month__c", "Account__c", "Primary_Practice__c", "Type__c"],
+        "account": ["Name", "Vertical", "Industry", "Sub-Vertical_SF"],
+    },
+}
+
+# Tables the rollups are built from; loading any other table leaves them valid
+SOURCE_TABLES = {"obm", "account"}
+
+# Measure columns stored next to the dimensions
+SUM_COLUMN = "Total__c"
+COUNT_COLUMN = "rollup_total_count"
+RECORDS_COLUMN = "rollup_records"
+MATCHED_COLUMN = "rollup_account_matched"
+
+_GENERATION_KEY = "rollups_generation"
+_UNSUPPORTED = {"union", "intersect", "except", "with", "over", "window", "filter", "natural", "using",
+                "rowid", "_rowid_", "oid", "values", "group_concat"}
+_AGGREGATES = {"sum", "count", "avg", "min", "max", "total"}
+_FROM_END = {"where", "group", "order", "having", "limit"}
+_OPERATOR_WORDS = {"case", "when", "then", "else", "and", "or", "not", "is", "in", "like", "glob", "between",
+                   "collate", "escape", "distinct"}
+
+
+def _columns(conn, table):
+    return {row[1].lower(): row[1] for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+
+
+def build_rollups(conn):
+    """
+    (Re)build the ROLLUPS tables from obm and account and record the data generation they reflect.
+
+    Account attributes are only included when account.Id is unique, so the join cannot
+    duplicate revenue.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to digibook.db.
+
+    Returns:
+        list[tuple]: (rollup table, row count) for every table that was built.
+    """
+    obm = _columns(conn, "obm")
+    if SUM_COLUMN.lower() not in obm:
+        logging.warning("obm has no Total__c column; skipping rollup tables")
+        return []
+    account = _columns(conn, "account")
+    join = "id" in account and "account__c" in obm and conn.execute(
+        'SELECT COUNT("Id") = COUNT(DISTINCT "Id") FROM account'
+    ).fetchone()[0] == 1
+    if not join:
+        logging.warning("account.Id is missing or not unique; rollups are built without account attributes")
+
+    built = []
+    for name, spec in ROLLUPS.items():
+        dimensions = [f'o."{obm[c.lower()]}"' for c in spec["obm"] if c.lower() in obm]
+        if join:
+            dimensions += [f'a."{account[c.lower()]}"' for c in spec["account"] if c.lower() in account]
+            dimensions.append(f'(a."Id" IS NOT NULL) AS {MATCHED_COLUMN}')
+            source = f'obm o LEFT JOIN account a ON a."Id" = o."{obm["account__c"]}"'
+        else:
+            source = "obm o"
+        conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+        conn.execute(
+            f'CREATE TABLE "{name}" AS SELECT {", ".join(dimensions)}, '
+            f'SUM(o."{obm[SUM_COLUMN.lower()]}") AS "{SUM_COLUMN}", '
+            f'COUNT(o."{obm[SUM_COLUMN.lower()]}") AS {COUNT_COLUMN}, COUNT(*) AS {RECORDS_COLUMN} '
+            f'FROM {source} GROUP BY {", ".join(str(i + 1) for i in range(len(dimensions)))}'
+        )
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        built.append((name, rows))
+        logging.info(f"Built rollup table {name} with {rows} rows")
+
+    _stamp_generation(conn)
+    return built
+
+
+def _stamp_generation(conn):
+    ensure_meta_table(conn)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)",
+        (_GENERATION_KEY, str(get_data_version(conn)))
+    )
+
+
+def carry_rollups_forward(conn, previous):
+    """
+    Mark the rollup tables current after a load of a table outside SOURCE_TABLES.
+
+    Only rollups that reflected the generation before the load are carried forward, so
+    stale rollups stay stale.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection, after bump_generation().
+        previous (int): Data generation before the load.
+
+    Returns:
+        bool: True if the rollups are now current.
+    """
+    if not rollups_current(conn, previous):
+        return False
+    _stamp_generation(conn)
+    return True
+
+
+def rollups_current(conn, version):
+    """True if the rollup tables were built from data generation `version`."""
+    try:
+        row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (_GENERATION_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row is not None and int(row[0]) == version
+
+
+def rollup_columns(conn):
+    """
+    Columns of the rollup tables that exist in the database.
+
+    Returns:
+        dict: Rollup table -> set of lowercase column names.
+    """
+    found = {}
+    for name in ROLLUPS:
+        columns = _columns(conn, name)
+        if columns:
+            found[name] = set(columns)
+    return found
+
+
+def _table_at(tokens, i):
+    """(table, alias, next index) for `table [AS] alias` at i, or None."""
+    n = len(tokens)
+    if i >= n or tokens[i].kind not in ("word", "quoted"):
+        return None
+    table = alias = unquote(tokens[i].value).lower()
+    i += 1
+    if i < n and tokens[i].kind == "word" and tokens[i].value.lower() == "as":
+        i += 1
+    if i < n and tokens[i].kind in ("word", "quoted") and not (
+            tokens[i].kind == "word" and tokens[i].value.lower() in CLAUSE_KEYWORDS):
+        alias = unquote(tokens[i].value).lower()
+        i += 1
+    return table, alias, i
+
+
+def _parse_from(tokens, start):
+    """
+    Parse `FROM obm [o]` or `FROM obm o [INNER | LEFT [OUTER]] JOIN account a ON o.Account__c = a.Id`.
+
+    Returns:
+        tuple: (obm alias, account alias or None, inner join, end index), or None for any other FROM clause.
+    """
+    n = len(tokens)
+    first = _table_at(tokens, start)
+    if first is None:
+        return None
+    aliases = {first[0]: first[1]}
+    i = first[2]
+    word = tokens[i].value.lower() if i < n and tokens[i].kind == "word" else None
+    inner = True
+    if word in ("inner", "left", "join"):
+        if word == "left":
+            inner = False
+            i += 1
+            if i < n and tokens[i].value.lower() == "outer":
+                i += 1
+        elif word == "inner":
+            i += 1
+        if i >= n or tokens[i].value.lower() != "join":
+            return None
+        second = _table_at(tokens, i + 1)
+        if second is None or second[0] in aliases or second[1] == first[1]:
+            return None
+        aliases[second[0]] = second[1]
+        i = second[2]
+        # LEFT JOIN keeps every row of the first table, which must be obm
+        if set(aliases) != {"obm", "account"} or (not inner and first[0] != "obm"):
+            return None
+        on = tokens[i:i + 8]
+        if len(on) < 8 or on[0].value.lower() != "on" or on[2] != Token("punct", ".") \
+                or on[4] != Token("op", "=") or on[6] != Token("punct", "."):
+            return None
+        sides = {(unquote(on[1].value).lower(), unquote(on[3].value).lower()),
+                 (unquote(on[5].value).lower(), unquote(on[7].value).lower())}
+        if sides != {(aliases["obm"], "account__c"), (aliases["account"], "id")}:
+            return None
+        i += 8
+    elif first[0] != "obm":
+        return None
+    if i < n and not (tokens[i] == Token("punct", ";") or (tokens[i].kind == "word" and tokens[i].value.lower() in _FROM_END)):
+        return None
+    return aliases["obm"], aliases.get("account"), inner, i
+
+
+def _closing(tokens, i):
+    """Index of the parenthesis closing the one opened at i."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j] == Token("punct", "("):
+            depth += 1
+        elif tokens[j] == Token("punct", ")"):
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+
+def _total_ref(tokens, start, end, total_refs):
+    """True if tokens[start:end] is exactly one (possibly qualified) reference to obm.Total__c."""
+    return end - 1 in total_refs and end - start in (1, 3)
+
+
+def _case_of_totals(tokens, start, end, total_refs):
+    """
+    True for CASE WHEN ... THEN Total__c [ELSE 0 | NULL] END where every result is
+    Total__c, 0 or NULL, which sums the same over rollup rows as over obm rows.
+
+    Total__c anywhere else, e.g. in a WHEN condition, would be tested against the rollup's
+    group sums instead of individual obm rows, so such a CASE is rejected.
+    """
+    words = [t.value.lower() if t.kind == "word" else None for t in tokens[start:end]]
+    if not words or words[0] != "case" or words[-1] != "end" or words.count("case") != 1:
+        return False
+    results = set()
+    j = start
+    while j < end:
+        if words[j - start] in ("then", "else"):
+            k = j + 1
+            while k < end and words[k - start] not in ("when", "else", "end"):
+                k += 1
+            result = tokens[j + 1:k]
+            if _total_ref(tokens, j + 1, k, total_refs):
+                results.add(k - 1)
+            elif not (len(result) == 1 and result[0].value.lower() in ("0", "0.0", "null")):
+                return False
+            j = k
+            continue
+        j += 1
+    return all(i in results for i in total_refs if start <= i < end)
+
+
+def _has_alias(item):
+    """True if a select-list item ends with `AS name` or an implicit alias."""
+    if len(item) > 2 and item[-2].kind == "word" and item[-2].value.lower() == "as":
+        return True
+    return (len(item) > 1 and item[-1].kind in ("word", "quoted")
+            and item[-1].value.lower() not in ("end", "null", "nocase", "binary", "rtrim")
+            and item[-2] != Token("punct", ".") and item[-2].kind != "op"
+            and not (item[-2].kind == "word" and item[-2].value.lower() in _OPERATOR_WORDS))
+
+
+def rewrite_with_rollups(sql, schema, rollups):
+    """
+    Answer an aggregate query over obm (optionally joined to account) from a rollup table.
+
+        SELECT a.Vertical, SUM(o.Total__c) AS Revenue FROM obm o JOIN account a ON o.Account__c = a.Id
+        WHERE o.Year__c = 2025 GROUP BY a.Vertical
+        -> SELECT o.Vertical, SUM(o.Total__c) AS Revenue FROM rollup_obm_practice AS o
+           WHERE o.rollup_account_matched = 1 AND (o.Year__c = 2025) GROUP BY o.Vertical
+
+    Only single-SELECT queries are rewritten whose columns are all rollup dimensions,
+    with Total__c used as SUM(Total__c), AVG(Total__c), COUNT(Total__c) or inside
+    as a THEN/ELSE result of SUM(CASE ... END), plus COUNT(*). Aggregates over dimensions must
+    be MIN, MAX or DISTINCT. Unaliased select expressions keep their original column
+    names. Anything else is returned unchanged so it runs on the base tables.
+
+    Args:
+        sql (str): The query.
+        schema (dict): Output of load_schema().
+        rollups (dict): Output of rollup_columns().
+
+    Returns:
+        str: The rewritten query, or the original text when no rollup can answer it.
+    """
+    if not rollups:
+        return sql
+    tokens = tokenize(sql)
+    spans = token_spans(sql)
+    n = len(tokens)
+    words = [t.value.lower() if t.kind == "word" else None for t in tokens]
+    if words.count("select") != 1 or words[0] != "select" or words.count("from") != 1 or _UNSUPPORTED & set(words):
+        return sql
+    from_index = words.index("from")
+    parsed = _parse_from(tokens, from_index + 1)
+    if parsed is None:
+        return sql
+    obm_alias, account_alias, inner, from_end = parsed
+    joined = account_alias is not None
+
+    references = table_references(tokens)
+    sets = {table: {column.lower() for column in columns} for table, columns in schema.items()}
+    refs = column_references(tokens, references, sets)
+    resolved = {i: (table, column, qualifier) for table, column, i, qualifier in refs}
+    qualifiers = {alias for _, alias in references}
+    known = set().union(*(sets.get(table, set()) for table, _ in references))
+    for i, token in enumerate(tokens):
+        if token.kind not in ("word", "quoted") or (i + 1 < n and tokens[i + 1] in (Token("punct", "."), Token("punct", "("))):
+            continue
+        qualified = i >= 2 and tokens[i - 1] == Token("punct", ".")
+        name = unquote(token.value).lower()
+        # Ambiguous or misspelled columns would change meaning or fail on a rollup
+        if i not in resolved and (
+                (qualified and unquote(tokens[i - 2].value).lower() in qualifiers)
+                or (not qualified and name in known and not (token.kind == "word" and name in CLAUSE_KEYWORDS))):
+            return sql
+    for i, token in enumerate(tokens[:from_index]):
+        # SELECT * or o.* would expand to the rollup's columns
+        if token == Token("op", "*") and (tokens[i - 1] == Token("punct", ".") or words[i - 1] in ("select", "distinct", "all")
+                                          or tokens[i + 1] in (Token("punct", ","), tokens[from_index])):
+            return sql
+
+    total_refs = {i for i, (table, column, _) in resolved.items() if table == "obm" and column == SUM_COLUMN.lower()}
+    replace = {}
+    used_totals = set()
+    measures = set()
+    aggregated = "group" in words
+    for i, word in enumerate(words):
+        if word not in _AGGREGATES or i + 1 >= n or tokens[i + 1] != Token("punct", "("):
+            continue
+        close = _closing(tokens, i + 1)
+        if close is None:
+            return sql
+        aggregated = True
+        start, end = i + 2, close
+        if word == "count" and end - start == 1 and tokens[start] == Token("op", "*"):
+            replace[i] = (close + 1, [RECORDS_COLUMN])
+            measures.add(RECORDS_COLUMN)
+        elif word in ("sum", "count", "avg") and _total_ref(tokens, start, end, total_refs):
+            used_totals.add(end - 1)
+            if word == "count":
+                replace[i] = (close + 1, [COUNT_COLUMN])
+                measures.add(COUNT_COLUMN)
+            elif word == "avg":
+                replace[i] = (close + 1, [SUM_COLUMN, COUNT_COLUMN])
+                measures.update((SUM_COLUMN, COUNT_COLUMN))
+        elif word == "sum" and _case_of_totals(tokens, start, end, total_refs):
+            used_totals.update(j for j in total_refs if start <= j < end)
+        elif word not in ("min", "max") and not (words[start] == "distinct"):
+            return sql
+    if not aggregated or total_refs - used_totals:
+        return sql
+    if used_totals:
+        measures.add(SUM_COLUMN)
+
+    # Columns outside the measures must be rollup dimensions
+    on_clause = range(parsed[3] - 8, parsed[3]) if joined else range(0)
+    needed = set()
+    for i, (table, column, _) in resolved.items():
+        if i in total_refs or i in on_clause:
+            continue
+        needed.add((table, column))
+    if joined and inner:
+        measures.add(MATCHED_COLUMN)
+    target = None
+    for name, spec in ROLLUPS.items():
+        available = rollups.get(name)
+        if available is None:
+            continue
+        dimensions = {table: {c.lower() for c in columns} for table, columns in spec.items()}
+        if all(column in dimensions.get(table, ()) and column in available for table, column in needed) \
+                and {m.lower() for m in measures} <= available:
+            target = name
+            break
+    if target is None:
+        return sql
+
+    alias = Token("quoted", f'"{obm_alias}"')
+
+    def column(name):
+        return [alias, Token("punct", "."), Token("quoted", f'"{name}"')]
+
+    # Measures over obm rows become sums of the rollup's partial aggregates. Counts are
+    # wrapped in COALESCE: SUM over no rows is NULL where COUNT over no rows is 0
+    for i, (end, names) in list(replace.items()):
+        if names == [SUM_COLUMN, COUNT_COLUMN]:
+            replace[i] = (end, tokenize("(SUM(") + column(SUM_COLUMN) + tokenize(") * 1.0 / SUM(")
+                          + column(COUNT_COLUMN) + tokenize("))"))
+        else:
+            replace[i] = (end, tokenize("COALESCE(SUM(") + column(names[0]) + tokenize("), 0)"))
+    # Every table qualifier now refers to the single rollup table
+    for i, (table, _, qualifier) in resolved.items():
+        if qualifier is not None:
+            replace.setdefault(i - 2, (i - 1, [alias]))
+    replace[from_index + 1] = (from_end, [Token("quoted", f'"{target}"'), Token("word", "AS"), alias])
+
+    inserts = defaultdict(list)
+    # Keep the column names of unaliased expressions, e.g. SUM(o.Total__c)
+    item_start = 1
+    if words[1] in ("distinct", "all"):
+        item_start = 2
+    depth = 0
+    for i in range(item_start, from_index + 1):
+        if tokens[i] == Token("punct", "("):
+            depth += 1
+        elif tokens[i] == Token("punct", ")"):
+            depth -= 1
+        if i == from_index or (depth == 0 and tokens[i] == Token("punct", ",")):
+            item = tokens[item_start:i]
+            bare = (len(item) == 1 and item_start in resolved) or (len(item) == 3 and i - 1 in resolved)
+            if item and not bare and not _has_alias(item):
+                text = sql[spans[item_start][0]:spans[i - 1][1]]
+                inserts[i] += [Token("word", "AS"), Token("quoted", '"' + text.replace('"', '""') + '"')]
+            item_start = i + 1
+
+    # An inner join drops obm rows without an account
+    if joined and inner:
+        matched = column(MATCHED_COLUMN) + [Token("op", "="), Token("number", "1")]
+        if from_end < n and words[from_end] == "where":
+            where_end = from_end + 1
+            depth = 0
+            while where_end < n:
+                token = tokens[where_end]
+                if token == Token("punct", "("):
+                    depth += 1
+                elif token == Token("punct", ")"):
+                    depth -= 1
+                elif depth == 0 and (token == Token("punct", ";") or words[where_end] in _FROM_END):
+                    break
+                where_end += 1
+            inserts[from_end + 1] += matched + [Token("word", "AND"), Token("punct", "(")]
+            inserts[where_end].insert(0, Token("punct", ")"))
+        else:
+            inserts[from_end] += [Token("word", "WHERE")] + matched
+
+    output = []
+    i = 0
+    while i <= n:
+        output.extend(inserts.get(i, []))
+        if i == n:
+            break
+        if i in replace:
+            end, new = replace[i]
+            output.extend(new)
+            i = end
+            continue
+        output.append(tokens[i])
+        i += 1
+    return render_tokens(output)
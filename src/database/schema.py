@@ -0,0 +1,113 @@
+from collections import namedtuple
+
+from src.database.rollups import ROLLUPS, rollup_columns
+from src.database.value_dictionary import VALUE_TABLE
+
+
+def load_schema(conn):
+    """
+    Read table and column names from the live database.
+
+    Args:
+        conn (sqlite3.Connection): Any connection to digibook.db.
+
+    Returns:
+        dict: Lowercase table name -> list of column names in declaration order.
+            Internal tables (sqlite_*, digibook_meta, value_dictionary, the rollup tables, virtual tables
+            such as the FTS indexes and their shadow tables) are skipped.
+    """
+    schema = {}
+    tables = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    virtual = [name for name, sql in tables if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    for table, _ in tables:
+        if table in ("digibook_meta", VALUE_TABLE) or table in ROLLUPS or table in virtual or any(table.startswith(f"{v}_") for v in virtual):
+            continue
+        columns = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        schema[table.lower()] = [column[1] for column in columns]
+    return schema
+
+
+def column_sets(schema):
+    """Lowercase table name -> set of lowercase column names, for membership checks."""
+    return {table: {column.lower() for column in columns} for table, columns in schema.items()}
+
+
+def text_columns(conn):
+    """
+    Columns with TEXT affinity, i.e. the ones insert_from_excel.py lowercases on load.
+
+    Returns:
+        dict: Lowercase table name -> set of lowercase column names.
+    """
+    columns = {}
+    for table in load_schema(conn):
+        info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        columns[table] = {
+            column[1].lower() for column in info
+            if any(marker in (column[2] or "").upper() for marker in ("CHAR", "CLOB", "TEXT"))
+        }
+    return columns
+
+
+# Salesforce reference columns that hold record ids; "Id" itself and every "...Id" column are ids too
+_KEY_COLUMNS = {"account__c", "owner__c"}
+
+
+def is_key_column(column):
+    """Whether a column holds record ids, which are joined and looked up exactly."""
+    return column.lower() == "id" or column.endswith("Id") or column.lower() in _KEY_COLUMNS
+
+
+def nocase_columns(conn):
+    """
+    TEXT columns compared and indexed COLLATE NOCASE: the lowercased categorical and free-text
+    columns. Id and join columns keep BINARY collation, so "o.Account__c = a.Id" and
+    "Account__c = '3'" still search their indexes.
+
+    Returns:
+        dict: Lowercase table name -> set of lowercase column names.
+    """
+    keys = {table: {c.lower() for c in columns if is_key_column(c)} for table, columns in load_schema(conn).items()}
+    return {table: columns - keys.get(table, set()) for table, columns in text_columns(conn).items()}
+
+
+def fts_columns(conn):
+    """
+    Columns covered by the <table>_fts full-text indexes built by fts_index.py.
+
+    Returns:
+        dict: Lowercase base table name -> set of lowercase indexed column names.
+    """
+    columns = {}
+    for table in load_schema(conn):
+        row = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ? AND sql LIKE 'CREATE VIRTUAL TABLE%'",
+            (f"{table}_fts",)
+        ).fetchone()
+        if row:
+            info = conn.execute(f'PRAGMA table_info("{row[0]}")').fetchall()
+            columns[table] = {column[1].lower() for column in info}
+    return columns
+
+
+SchemaInfo = namedtuple("SchemaInfo", ["schema", "nocase_columns", "fts_columns", "rollup_columns"])
+
+_schema_cache = {}
+
+
+def get_schema_info(conn):
+    """
+    Cached load_schema(), nocase_columns(), fts_columns() and rollups.rollup_columns() for the
+    current schema version.
+
+    Returns:
+        SchemaInfo: Reloaded whenever PRAGMA schema_version changes.
+    """
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    cached = _schema_cache.get("info")
+    if cached is None or cached[0] != version:
+        cached = (version, SchemaInfo(load_schema(conn), nocase_columns(conn), fts_columns(conn), rollup_columns(conn)))
+        _schema_cache["info"] = cached
+    return cached[1]
@@ -0,0 +1,132 @@
+from src.database.sql_text import Token, tokenize, table_references, unquote, render_tokens
+
+_EQUALITY = ("=", "==", "!=", "<>")
+_NOCASE = [Token("word", "COLLATE"), Token("word", "NOCASE")]
+
+
+def _column_ref(tokens, i):
+    """End index (exclusive) of a possibly qualified column reference starting at i, or None."""
+    n = len(tokens)
+    if i >= n or tokens[i].kind not in ("word", "quoted"):
+        return None
+    if i + 2 < n and tokens[i + 1] == Token("punct", ".") and tokens[i + 2].kind in ("word", "quoted"):
+        return i + 3
+    return i + 1
+
+
+def _resolve(tokens, start, end, aliases, tables, text_cols):
+    """True if tokens[start:end] names a TEXT column of one of the query's tables."""
+    column = unquote(tokens[end - 1].value).lower()
+    if end - start == 3:
+        table = aliases.get(unquote(tokens[start].value).lower())
+        return table is not None and column in text_cols.get(table, ())
+    owners = [t for t in tables if column in text_cols.get(t, ())]
+    return len(owners) == 1
+
+
+def _literal(tokens, i):
+    """(value token, end index) for 'lit' or LOWER('lit') at i, with LOWER applied; otherwise (None, i)."""
+    n = len(tokens)
+    if i < n and tokens[i].kind == "string":
+        return tokens[i], i + 1
+    if (i + 3 < n and tokens[i].kind == "word" and tokens[i].value.lower() == "lower"
+            and tokens[i + 1] == Token("punct", "(") and tokens[i + 2].kind == "string"
+            and tokens[i + 3] == Token("punct", ")")):
+        return Token("string", tokens[i + 2].value.lower()), i + 4
+    return None, i
+
+
+def _literal_list(tokens, i):
+    """(list of tokens, end index) for a parenthesised list of string literals at i, else (None, i)."""
+    if i >= len(tokens) or tokens[i] != Token("punct", "("):
+        return None, i
+    items = [Token("punct", "(")]
+    j = i + 1
+    while j < len(tokens):
+        literal, j = _literal(tokens, j)
+        if literal is None or literal.value != literal.value.lower():
+            return None, i
+        items.append(literal)
+        if j < len(tokens) and tokens[j] == Token("punct", ","):
+            items.append(tokens[j])
+            j += 1
+            continue
+        if j < len(tokens) and tokens[j] == Token("punct", ")"):
+            items.append(tokens[j])
+            return items, j + 1
+        return None, i
+    return None, i
+
+
+def normalize_case_predicates(sql, text_cols):
+    """
+    Rewrite case-insensitive text predicates into forms that can use COLLATE NOCASE indexes.
+
+    insert_from_excel.py stores all text lowercased, so for TEXT columns:
+        LOWER(col) = 'abc'        ->  col = 'abc' COLLATE NOCASE
+        col = 'abc'               ->  col = 'abc' COLLATE NOCASE
+        LOWER(col) IN ('a', 'b')  ->  col COLLATE NOCASE IN ('a', 'b')
+        LOWER(col) LIKE 'ab%'     ->  col LIKE 'ab%'
+    Equality rewrites only apply to lowercase literals, where they cannot change the
+    result on lowercased data; LIKE is already case-insensitive in SQLite.
+
+    Args:
+        sql (str): The query.
+        text_cols (dict): Lowercase table -> set of case-insensitive column names, see schema.nocase_columns().
+
+    Returns:
+        str: The rewritten query, or the original text when nothing applied.
+    """
+    tokens = tokenize(sql)
+    references = table_references(tokens)
+    aliases = {alias: table for table, alias in references}
+    tables = list(dict.fromkeys(table for table, _ in references))
+    output = []
+    changed = False
+    i, n = 0, len(tokens)
+    while i < n:
+        token = tokens[i]
+        wrapped = (token.kind == "word" and token.value.lower() == "lower"
+                   and i + 1 < n and tokens[i + 1] == Token("punct", "("))
+        start = i + 2 if wrapped else i
+        end = _column_ref(tokens, start)
+        if end is None or (wrapped and (end >= n or tokens[end] != Token("punct", ")"))):
+            output.append(token)
+            i += 1
+            continue
+        after = end + 1 if wrapped else end
+        # Skip qualifiers, function names and columns that already carry a COLLATE
+        if (after < n and tokens[after].kind == "word" and tokens[after].value.lower() == "collate") \
+                or (start > 0 and tokens[start - 1] == Token("punct", ".")) \
+                or not _resolve(tokens, start, end, aliases, tables, text_cols):
+            output.append(token)
+            i += 1
+            continue
+        column = tokens[start:end]
+        op = tokens[after] if after < n else None
+        negated = op is not None and op.kind == "word" and op.value.lower() == "not"
+        op_index = after + 1 if negated else after
+        op = tokens[op_index] if op_index < n else None
+        op_name = op.value.lower() if op is not None else ""
+
+        if op_name in _EQUALITY and not negated:
+            literal, literal_end = _literal(tokens, op_index + 1)
+            already = literal_end < n and tokens[literal_end].value.lower() == "collate"
+            if literal is not None and literal.value == literal.value.lower() and not already:
+                output.extend(column + [op, literal] + _NOCASE)
+                i, changed = literal_end, True
+                continue
+        elif op_name == "in":
+            items, list_end = _literal_list(tokens, op_index + 1)
+            if items is not None:
+                output.extend(column + _NOCASE + tokens[after:op_index + 1] + items)
+                i, changed = list_end, True
+                continue
+        elif op_name == "like" and wrapped:
+            output.extend(column + tokens[after:op_index + 1])
+            i, changed = op_index + 1, True
+            continue
+        output.append(token)
+        i += 1
+
+    return render_tokens(output) if changed else sql
@@ -0,0 +1,246 @@
+import hashlib
+from collections import namedtuple
+
+# kind is one of: word, quoted, string, number, op, punct
+Token = namedtuple("Token", ["kind", "value"])
+
+_OPERATORS = ("<>", "!=", ">=", "<=", "==", "||", "<<", ">>", "->>", "->")
+_PUNCT = "(),;."
+
+
+def _scan(sql):
+    """(Token, start, end) for every token of sql, with end exclusive."""
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch.isspace():
+            i += 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif ch == "'":
+            j = i + 1
+            while j < n:
+                if sql[j] == "'":
+                    if j + 1 < n and sql[j + 1] == "'":
+                        j += 2
+                        continue
+                    break
+                j += 1
+            yield Token("string", sql[i:j + 1]), i, min(j + 1, n)
+            i = j + 1
+        elif ch in '"`[':
+            close = "]" if ch == "[" else ch
+            end = sql.find(close, i + 1)
+            end = n - 1 if end == -1 else end
+            yield Token("quoted", sql[i:end + 1]), i, end + 1
+            i = end + 1
+        elif ch.isdigit() or (ch == "." and i + 1 < n and sql[i + 1].isdigit()):
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] == "." or (sql[j] in "+-" and sql[j - 1] in "eE")):
+                j += 1
+            yield Token("number", sql[i:j]), i, j
+            i = j
+        elif ch.isalpha() or ch == "_":
+            j = i + 1
+            while j < n and (sql[j].isalnum() or sql[j] in "_$"):
+                j += 1
+            yield Token("word", sql[i:j]), i, j
+            i = j
+        elif ch in _PUNCT:
+            yield Token("punct", ch), i, i + 1
+            i += 1
+        else:
+            op = next((o for o in _OPERATORS if sql.startswith(o, i)), ch)
+            yield Token("op", op), i, i + len(op)
+            i += len(op)
+
+
+def tokenize(sql):
+    """
+    Split a SQL string into tokens, dropping whitespace and comments.
+
+    Args:
+        sql (str): The SQL text.
+
+    Returns:
+        list[Token]: Tokens in source order. String literals keep their quotes.
+    """
+    return [token for token, _, _ in _scan(sql)]
+
+
+def token_spans(sql):
+    """(start, end) character offsets in sql of each token returned by tokenize(sql)."""
+    return [(start, end) for _, start, end in _scan(sql)]
+
+
+def canonicalize_sql(sql):
+    """
+    Normalise SQL text so that formatting-only differences map to the same string.
+
+    Comments, whitespace, bare keyword/identifier case and trailing semicolons are
+    normalised; string literals and quoted identifiers are kept exactly as written,
+    since SQLite may read a double-quoted token as a string literal.
+
+    Args:
+        sql (str): The SQL text.
+
+    Returns:
+        str: The canonical form of the query.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1] == Token("punct", ";"):
+        tokens.pop()
+    parts = []
+    for token in tokens:
+        if token.kind == "word":
+            parts.append(token.value.lower())
+        else:
+            parts.append(token.value)
+    return " ".join(parts)
+
+
+def sql_fingerprint(sql):
+    """Stable short hash of the canonical form of a query."""
+    return hashlib.sha1(canonicalize_sql(sql).encode("utf-8")).hexdigest()[:16]
+
+
+# Words that can follow a table reference and therefore are never an alias
+CLAUSE_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "having", "limit", "offset", "union", "intersect", "except", "window", "as",
+    "select", "from", "values", "returning", "indexed", "not",
+}
+
+
+def unquote(name):
+    """Strip SQL identifier quoting ("x", `x`, [x]) from a name."""
+    if len(name) >= 2 and name[0] in '"`[' and name[-1] in '"`]':
+        return name[1:-1]
+    return name
+
+
+def table_references(tokens):
+    """
+    Find the tables a query reads and the aliases they are referred to by.
+
+    Args:
+        tokens (list[Token]): Output of tokenize().
+
+    Returns:
+        list[tuple]: (table, alias) pairs with lowercase, unquoted names; alias equals
+        the table name when none is given. Subqueries in FROM are skipped.
+    """
+    references = []
+    i, n = 0, len(tokens)
+    while i < n:
+        token = tokens[i]
+        if token.kind == "word" and token.value.lower() in ("from", "join"):
+            i += 1
+            while i < n and tokens[i].kind in ("word", "quoted"):
+                if tokens[i].kind == "word" and tokens[i].value.lower() in CLAUSE_KEYWORDS:
+                    break
+                table = unquote(tokens[i].value).lower()
+                i += 1
+                # schema-qualified name, e.g. main.obm
+                if i + 1 < n and tokens[i] == Token("punct", ".") and tokens[i + 1].kind in ("word", "quoted"):
+                    table = unquote(tokens[i + 1].value).lower()
+                    i += 2
+                alias = table
+                if i < n and tokens[i].kind == "word" and tokens[i].value.lower() == "as":
+                    i += 1
+                if i < n and tokens[i].kind in ("word", "quoted") and tokens[i].value.lower() not in CLAUSE_KEYWORDS:
+                    alias = unquote(tokens[i].value).lower()
+                    i += 1
+                references.append((table, alias))
+                if i < n and tokens[i] == Token("punct", ","):
+                    i += 1
+                    continue
+                break
+            continue
+        i += 1
+    return references
+
+
+def column_references(tokens, references, schema):
+    """
+    Resolve the column names used in a query to the tables they belong to.
+
+    Args:
+        tokens (list[Token]): Output of tokenize().
+        references (list[tuple]): Output of table_references().
+        schema (dict): Lowercase table name -> set of lowercase column names.
+
+    Returns:
+        list[tuple]: (table, column, token_index, qualifier) for every resolvable column
+        reference. Unqualified names are resolved only when exactly one table in the
+        query has a column of that name; qualifier is None for them.
+    """
+    aliases = {alias: table for table, alias in references}
+    tables = list(dict.fromkeys(table for table, _ in references))
+    found = []
+    n = len(tokens)
+    for i, token in enumerate(tokens):
+        if token.kind not in ("word", "quoted"):
+            continue
+        if i + 1 < n and tokens[i + 1] in (Token("punct", "."), Token("punct", "(")):
+            continue
+        name = unquote(token.value).lower()
+        if i >= 2 and tokens[i - 1] == Token("punct", "."):
+            qualifier = unquote(tokens[i - 2].value).lower()
+            table = aliases.get(qualifier)
+            if table and name in schema.get(table, ()):
+                found.append((table, name, i, qualifier))
+            continue
+        owners = [table for table in tables if name in schema.get(table, ())]
+        if len(owners) == 1:
+            found.append((owners[0], name, i, None))
+    return found
+
+
+def clause_at(tokens):
+    """
+    Name of the clause (select, from, where, on, group, having, order, limit...) each token belongs to.
+
+    Nested parentheses inherit the clause of the expression they appear in, except
+    subqueries, which track their own clauses.
+
+    Returns:
+        list[str]: One clause name per token.
+    """
+    clauses = []
+    stack = ["select"]
+    for i, token in enumerate(tokens):
+        lower = token.value.lower() if token.kind == "word" else None
+        if token == Token("punct", "("):
+            clauses.append(stack[-1])
+            stack.append(stack[-1])
+            continue
+        if token == Token("punct", ")"):
+            if len(stack) > 1:
+                stack.pop()
+            clauses.append(stack[-1])
+            continue
+        if lower in ("select", "from", "where", "on", "having", "limit", "join", "using"):
+            stack[-1] = "from" if lower == "join" else lower
+        elif lower in ("group", "order") and i + 1 < len(tokens) and tokens[i + 1].value.lower() == "by":
+            stack[-1] = lower
+        clauses.append(stack[-1])
+    return clauses
+
+
+def render_tokens(tokens):
+    """Join tokens back into SQL text with conventional spacing around punctuation."""
+    parts = []
+    previous = None
+    for token in tokens:
+        no_space = previous is None or previous.value in ("(", ".") or token.value in (",", ")", ".", ";")
+        if token == Token("punct", "(") and previous is not None and previous.kind in ("word", "quoted"):
+            # function call: COUNT(, LOWER(; keep a space after keywords such as IN (
+            no_space = previous.value.upper() not in ("IN", "AS", "FROM", "JOIN", "ON", "AND", "OR", "NOT", "EXISTS", "WHERE", "VALUES", "USING", "OVER")
+        parts.append(token.value if no_space else " " + token.value)
+        previous = token
+    return "".join(parts)
@@ -0,0 +1,162 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from src.database.connection_pool import pool
+from src.database.schema import get_schema_info, column_sets
+from src.database.sql_text import Token, tokenize, table_references, unquote, clause_at, render_tokens
+
+# Statements and keywords that can change the database or its connection, even inside a SELECT
+_FORBIDDEN_WORDS = {
+    "insert", "update", "delete", "replace", "merge", "upsert", "create", "drop", "alter", "truncate",
+    "attach", "detach", "pragma", "vacuum", "reindex", "analyze", "begin", "commit", "rollback", "savepoint",
+    "release", "grant", "revoke", "load_extension",
+}
+# Forbidden words that are also harmless scalar functions when followed by "("
+_FUNCTION_NAMES = {"replace"}
+_COMPARISONS = {"=", "==", "!=", "<>"}
+_OPEN, _CLOSE, _COMMA, _DOT, _SEMICOLON = (Token("punct", p) for p in "(),.;")
+_CASE_OPERATORS = {"like", "glob"}
+
+
+class ValidationResult(BaseModel):
+    valid: bool
+    sql: Optional[str] = Field(default=None, description="The rewritten query, when valid.")
+    errors: list[str] = Field(default_factory=list)
+    changes: list[str] = Field(default_factory=list, description="Rewrites applied to the query.")
+
+
+def _cte_names(tokens):
+    """Lowercase names defined by a leading WITH clause."""
+    names = set()
+    for i, token in enumerate(tokens):
+        if (token.kind in ("word", "quoted") and i + 2 < len(tokens) and tokens[i + 1].kind == "word"
+                and tokens[i + 1].value.lower() == "as" and tokens[i + 2] == _OPEN
+                and i > 0 and (tokens[i - 1] == _COMMA or tokens[i - 1].value.lower() in ("with", "recursive"))):
+            names.add(unquote(token.value).lower())
+        elif token.kind in ("word", "quoted") and i + 1 < len(tokens) and tokens[i + 1] == _OPEN \
+                and i > 0 and tokens[i - 1].value.lower() in ("with", "recursive"):
+            # WITH name(col, ...) AS (...)
+            names.add(unquote(token.value).lower())
+    return names
+
+
+def _lowercase_literals(tokens):
+    """
+    Lowercase string literals compared with =, !=, IN (...), LIKE or GLOB in WHERE, ON and HAVING.
+
+    insert_from_excel.py stores all text lowercased, so mixed-case literals can never match.
+
+    Returns:
+        tuple: (tokens, number of literals changed)
+    """
+    clauses = clause_at(tokens)
+    output = list(tokens)
+    changed = 0
+    in_list_depth = None
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token == _OPEN:
+            depth += 1
+            if i > 0 and tokens[i - 1].kind == "word" and tokens[i - 1].value.lower() == "in":
+                in_list_depth = depth
+        elif token == _CLOSE:
+            if in_list_depth == depth:
+                in_list_depth = None
+            depth -= 1
+        if token.kind != "string" or clauses[i] not in ("where", "on", "having") or token.value == token.value.lower():
+            continue
+        previous = tokens[i - 1] if i > 0 else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        compared = (
+            in_list_depth == depth
+            or (previous is not None and (previous.value in _COMPARISONS or previous.value.lower() in _CASE_OPERATORS))
+            or (following is not None and (following.value in _COMPARISONS or following.value.lower() in _CASE_OPERATORS))
+        )
+        if compared:
+            output[i] = Token("string", token.value.lower())
+            changed += 1
+    return output, changed
+
+
+def validate_sql(sql, schema, row_limit=None):
+    """
+    Check and rewrite a generated query before it is run.
+
+    Rejects anything but a single SELECT (or WITH ... SELECT) statement, including multi-statement
+    text, PRAGMA table-valued functions and data-changing keywords; rejects unknown tables and
+    unknown qualified columns; lowercases compared string literals; and, when row_limit is given,
+    appends a LIMIT to queries without one.
+
+    Args:
+        sql (str): The generated query.
+        schema (dict): Lowercase table name -> list of column names, see schema.load_schema().
+        row_limit (int, optional): LIMIT appended to queries that have none. Off by default: the
+            query governor already caps rows at execution time, and the query text is what the
+            /results stream pages through, so a LIMIT here would also cap the stream.
+
+    Returns:
+        ValidationResult: valid with the rewritten sql, or the reasons the query was rejected.
+    """
+    tokens = tokenize(sql or "")
+    while tokens and tokens[-1] == _SEMICOLON:
+        tokens.pop()
+    if not tokens:
+        return ValidationResult(valid=False, errors=["The query is empty."])
+    errors, changes = [], []
+
+    if _SEMICOLON in tokens:
+        errors.append("Only a single statement is allowed.")
+    if tokens[0].kind != "word" or tokens[0].value.lower() not in ("select", "with"):
+        errors.append(f"Only SELECT queries are allowed, not {tokens[0].value.upper()}.")
+    for i, token in enumerate(tokens):
+        if token.kind != "word":
+            continue
+        word = token.value.lower()
+        is_call = i + 1 < len(tokens) and tokens[i + 1] == _OPEN
+        if word.startswith("pragma_") or (word in _FORBIDDEN_WORDS and not (word in _FUNCTION_NAMES and is_call)):
+            errors.append(f"{token.value.upper()} is not allowed in a read-only query.")
+    if errors:
+        return ValidationResult(valid=False, errors=list(dict.fromkeys(errors)))
+
+    columns = column_sets(schema)
+    ctes = _cte_names(tokens)
+    references = table_references(tokens)
+    for table, _ in references:
+        if table not in columns and table not in ctes:
+            errors.append(f"no such table: {table}")
+    aliases = {alias: table for table, alias in references if table in columns}
+    for i in range(2, len(tokens)):
+        if tokens[i - 1] != _DOT or tokens[i].kind not in ("word", "quoted"):
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1] == _OPEN:
+            continue
+        table = aliases.get(unquote(tokens[i - 2].value).lower())
+        column = unquote(tokens[i].value).lower()
+        if table is not None and column != "*" and column not in columns[table]:
+            errors.append(f"no such column: {unquote(tokens[i - 2].value)}.{unquote(tokens[i].value)}")
+    if errors:
+        return ValidationResult(valid=False, errors=list(dict.fromkeys(errors)))
+
+    tokens, lowered = _lowercase_literals(tokens)
+    if lowered:
+        changes.append(f"lowercased {lowered} string literal(s)")
+    depth, has_limit = 0, False
+    for token in tokens:
+        if token == _OPEN:
+            depth += 1
+        elif token == _CLOSE:
+            depth -= 1
+        elif depth == 0 and token.kind == "word" and token.value.lower() == "limit":
+            has_limit = True
+    if not has_limit and row_limit:
+        tokens += [Token("word", "LIMIT"), Token("number", str(row_limit))]
+        changes.append(f"added LIMIT {row_limit}")
+    return ValidationResult(valid=True, sql=render_tokens(tokens) if changes else sql.strip().rstrip(";").strip(),
+                            changes=changes)
+
+
+def validate_generated_sql(sql):
+    """validate_sql() against the live schema of digibook.db, read through the connection pool."""
+    with pool.connection() as conn:
+        schema = get_schema_info(conn).schema
+    return validate_sql(sql, schema)
@@ -0,0 +1,267 @@
+import re
+import sqlite3
+import logging
+import threading
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Optional
+
+from pydantic import BaseModel
+
+from config.config import VALUE_DICTIONARY_CONFIG
+from src.database.connection_pool import pool
+from src.database.data_version import META_TABLE, ensure_meta_table, get_data_version
+
+# Low-cardinality columns the generator filters on; insert_from_excel.py lowercases their values
+CATEGORICAL_COLUMNS = {
+    "account": ["Vertical", "Industry", "Sub-Vertical_SF", "Account_Type__c", "AccountSource"],
+    "obm": [
+        "Primary_Practice__c", "Secondary_Practice__c", "Type__c", "Client_Geography_Tagging__c",
+        "Country_Bill_to_Budget_owning_geo__c", "Country_Ship_to_The_End_Client_Geo__c", "Pricing_Model__c",
+        "Revenue_Mix__c", "Type_of_Contracts__c", "Engagement_Model__c", "Delivery_Capability__c",
+        "Primary_Capability__c", "Primary_Functionality__c", "Opportunity_Type__c", "Primary_Flag__c",
+        "Secondary_Flag__c", "Secondary_Flag_2__c", "Course5_Location__c", "PO_Currency__c",
+    ],
+    "user": ["Department", "Title"],
+}
+
+VALUE_TABLE = "value_dictionary"
+_GENERATION_KEY = "value_dictionary_generation"
+
+# Question words that are never worth matching against stored values
+_STOP_WORDS = {
+    "the", "and", "for", "from", "with", "what", "which", "who", "how", "many", "much", "show", "list", "give",
+    "total", "revenue", "year", "month", "by", "in", "of", "all", "top", "per", "each", "are", "was", "were",
+    "this", "that", "last", "our", "their", "its", "me", "is", "to", "a", "an", "on", "vs", "between",
+}
+
+
+def build_value_dictionary(conn, tables=None):
+    """
+    (Re)build the value_dictionary table: the distinct values of each CATEGORICAL_COLUMNS column.
+
+    Columns with more than max_distinct values are not categorical in practice and are skipped.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to digibook.db.
+        tables (list[str], optional): Only refresh the values of these tables.
+
+    Returns:
+        list[tuple]: (table, column, distinct values) for every column that was indexed.
+    """
+    max_distinct = VALUE_DICTIONARY_CONFIG["max_distinct"]
+    conn.execute(
+        f'CREATE TABLE IF NOT EXISTS "{VALUE_TABLE}" '
+        "(table_name TEXT, column_name TEXT, value TEXT, rows INTEGER, PRIMARY KEY (table_name, column_name, value))"
+    )
+    built = []
+    for table, wanted in CATEGORICAL_COLUMNS.items():
+        if tables is not None and table not in tables:
+            continue
+        conn.execute(f'DELETE FROM "{VALUE_TABLE}" WHERE table_name = ?', (table,))
+        existing = {row[1].lower(): row[1] for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+        for column in (existing[c.lower()] for c in wanted if c.lower() in existing):
+            values = conn.execute(
+                f'SELECT "{column}", COUNT(*) FROM "{table}" WHERE "{column}" IS NOT NULL AND TRIM("{column}") != \'\' '
+                f'GROUP BY 1 LIMIT ?', (max_distinct + 1,)
+            ).fetchall()
+            if len(values) > max_distinct:
+                logging.info(f"Skipping {table}.{column} in the value dictionary: more than {max_distinct} values")
+                continue
+            conn.executemany(
+                f'INSERT OR REPLACE INTO "{VALUE_TABLE}" VALUES (?, ?, ?, ?)',
+                [(table, column, str(value), rows) for value, rows in values]
+            )
+            built.append((table, column, len(values)))
+    ensure_meta_table(conn)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)",
+        (_GENERATION_KEY, str(get_data_version(conn)))
+    )
+    return built
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9/&.\-]+", text.lower())
+
+
+def similarity(term, value):
+    """
+    Fuzzy similarity of a search term and a stored value, in [0, 1].
+
+    Exact matches score 1, a whole-word match of one inside the other ("pharma" in "pharma ci")
+    0.9, otherwise the better of trigram overlap and the edit-distance ratio.
+    """
+    term, value = term.strip().lower(), value.strip().lower()
+    if not term or not value:
+        return 0.0
+    if term == value:
+        return 1.0
+    shorter, longer = sorted((term, value), key=len)
+    if len(shorter) >= 3 and re.search(rf"(?<!\w){re.escape(shorter)}(?!\w)", longer):
+        return 0.9
+    a, b = _trigrams(term), _trigrams(value)
+    return max(len(a & b) / len(a | b), SequenceMatcher(None, term, value).ratio())
+
+
+class ValueMatch(BaseModel):
+    table: str
+    column: str
+    value: str
+    rows: int
+    score: float
+    term: Optional[str] = None  # The question words that matched, for hints
+
+
+class ValueDictionary:
+    """
+    In-process copy of the value_dictionary table with fuzzy lookup.
+
+    Reloaded through the connection pool whenever insert_from_excel.py has rebuilt the table.
+    """
+
+    def __init__(self, threshold=0.6, hint_threshold=0.85, max_matches=5, max_hints=10):
+        """
+        Args:
+            threshold (float): Minimum similarity for lookup() matches.
+            hint_threshold (float): Minimum similarity for hints() found in a question.
+            max_matches (int): Matches returned per term, and per question n-gram by hints().
+            max_hints (int): Matches returned by hints() in total.
+        """
+        self.threshold = threshold
+        self.hint_threshold = hint_threshold
+        self.max_matches = max_matches
+        self.max_hints = max_hints
+        self._lock = threading.Lock()
+        self._generation = None
+        self._values = []
+        self._index = None
+
+    def _current_values(self):
+        with pool.connection() as conn:
+            try:
+                row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (_GENERATION_KEY,)).fetchone()
+            except sqlite3.OperationalError:
+                return []
+            generation = row[0] if row else None
+            with self._lock:
+                if generation != self._generation:
+                    self._values = conn.execute(
+                        f'SELECT table_name, column_name, value, rows FROM "{VALUE_TABLE}"'
+                    ).fetchall() if generation is not None else []
+                    self._index = None
+                    self._generation = generation
+                return self._values
+
+    def _current_index(self):
+        """
+        The stored values with inverted word and trigram indexes over them, built on first use.
+
+        Returns:
+            tuple: (values, word -> value indexes, trigram -> value indexes)
+        """
+        values = self._current_values()
+        with self._lock:
+            if self._index is None or self._index[0] is not values:
+                words, trigrams = defaultdict(set), defaultdict(set)
+                for i, (_, _, value, _) in enumerate(values):
+                    for word in _words(value):
+                        words[word].add(i)
+                    for trigram in _trigrams(value.strip().lower()):
+                        trigrams[trigram].add(i)
+                self._index = (values, dict(words), dict(trigrams))
+            return self._index
+
+    @staticmethod
+    def _candidates(term, word_index, trigram_index):
+        """
+        Indexes of the stored values that can reach hint_threshold for a term: values sharing a
+        whole word with it (containment matches) and values sharing at least half of its trigrams
+        (near-identical spellings). Everything else is skipped without computing edit distance.
+        """
+        candidates = set()
+        for word in _words(term):
+            candidates |= word_index.get(word, set())
+        grams = _trigrams(term)
+        shared = Counter(i for gram in grams for i in trigram_index.get(gram, ()))
+        candidates.update(i for i, count in shared.items() if count * 2 >= len(grams))
+        return candidates
+
+    def lookup(self, term, table=None, column=None):
+        """
+        Stored values closest to a term.
+
+        Args:
+            term (str): What the user called the value, e.g. "pharma" or "north america".
+            table (str, optional): Only search this table.
+            column (str, optional): Only search this column.
+
+        Returns:
+            list[ValueMatch]: Matches at or above the threshold, best first.
+        """
+        matches = []
+        for value_table, value_column, value, rows in self._current_values():
+            if (table and value_table != table.lower()) or (column and value_column.lower() != column.lower()):
+                continue
+            score = similarity(term, value)
+            if score >= self.threshold:
+                matches.append(ValueMatch(table=value_table, column=value_column, value=value, rows=rows,
+                                          score=round(score, 3), term=term))
+        matches.sort(key=lambda m: (-m.score, -m.rows))
+        return matches[:self.max_matches]
+
+    def hints(self, question):
+        """
+        Stored values that a question mentions, for injection into the SQL generator's input.
+
+        Every run of one to three question words is compared with the stored values it shares a
+        word or most trigrams with; each run contributes at most max_matches values.
+
+        Returns:
+            list[ValueMatch]: The best match per stored value at or above hint_threshold, at most max_hints.
+        """
+        words = _words(question)
+        best = {}
+        values, word_index, trigram_index = self._current_index()
+        for size in (3, 2, 1):
+            for i in range(len(words) - size + 1):
+                gram = words[i:i + size]
+                if gram[0] in _STOP_WORDS or gram[-1] in _STOP_WORDS or (size == 1 and len(gram[0]) < 3) \
+                        or all(w.isdigit() for w in gram):
+                    continue
+                term = " ".join(gram)
+                matches = []
+                for index in self._candidates(term, word_index, trigram_index):
+                    table, column, value, rows = values[index]
+                    score = similarity(term, value)
+                    if score >= self.hint_threshold:
+                        matches.append(ValueMatch(table=table, column=column, value=value, rows=rows,
+                                                  score=round(score, 3), term=term))
+                matches.sort(key=lambda m: (-m.score, -m.rows))
+                for match in matches[:self.max_matches]:
+                    key = (match.table, match.column, match.value)
+                    if key not in best or match.score > best[key].score:
+                        best[key] = match
+        return sorted(best.values(), key=lambda m: (-m.score, -m.rows))[:self.max_hints]
+
+
+def format_matches(matches):
+    """One line per match: table.column = 'value' (rows, score)."""
+    return "\n".join(
+        f"- {m.table}.{m.column} = '{m.value}' ({m.rows} rows, similarity {m.score}"
+        + (f", matched '{m.term}')" if m.term else ")")
+        for m in matches
+    )
+
+
+value_dictionary = ValueDictionary(
+    threshold=VALUE_DICTIONARY_CONFIG["threshold"],
+    hint_threshold=VALUE_DICTIONARY_CONFIG["hint_threshold"],
+    max_matches=VALUE_DICTIONARY_CONFIG["max_matches"],
+    max_hints=VALUE_DICTIONARY_CONFIG["max_hints"],
+)
@@ -0,0 +1,202 @@
+import re
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config.config import EMBEDDING_CACHE_CONFIG
+
+
+def normalize_text(text):
+    """Cache key form of a text: surrounding and repeated whitespace does not change its embedding."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embedding vectors keyed by embedding model and normalized text.
+
+    An in-memory LRU sits in front of a small SQLite file, so a vector paid for once is reused
+    across requests, restarts and index rebuilds. Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, path, max_entries=4096):
+        """
+        Args:
+            path (str): Path of the embedding cache database, or None to keep vectors in memory only.
+            max_entries (int): Vectors kept in memory before the least recently used ones are evicted.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "model TEXT, text_hash TEXT, vector BLOB, PRIMARY KEY (model, text_hash))"
+            )
+        return self._conn
+
+    @staticmethod
+    def _key(model, text):
+        return model, hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model, texts):
+        """
+        Returns:
+            list: The cached vector of each text (a list of floats), or None where it is not cached.
+        """
+        keys = [self._key(model, text) for text in texts]
+        found = [None] * len(texts)
+        with self._lock:
+            missing = []
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    found[i] = vector
+                else:
+                    missing.append(i)
+            if missing and self.path:
+                hashes = list(dict.fromkeys(keys[i][1] for i in missing))
+                try:
+                    rows = dict(self._db().execute(
+                        f"SELECT text_hash, vector FROM embedding_cache WHERE model = ? AND text_hash IN "
+                        f"({', '.join('?' * len(hashes))})",
+                        [model, *hashes]
+                    ).fetchall())
+                except sqlite3.Error as e:
+                    logging.warning(f"Embedding cache read failed: {e}")
+                    rows = {}
+                for i in missing:
+                    blob = rows.get(keys[i][1])
+                    if blob is not None:
+                        found[i] = np.frombuffer(blob, dtype=np.float32).tolist()
+                        self._remember(keys[i], found[i])
+                        self._disk_hits += 1
+            self._misses += sum(1 for vector in found if vector is None)
+        return found
+
+    def put_many(self, model, texts, vectors):
+        """Cache freshly computed vectors, in memory and on disk."""
+        keys = [self._key(model, text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, list(vector))
+            if self.path:
+                try:
+                    db = self._db()
+                    db.executemany(
+                        "INSERT OR REPLACE INTO embedding_cache (model, text_hash, vector) VALUES (?, ?, ?)",
+                        [(model, key[1], np.asarray(vector, dtype=np.float32).tobytes())
+                         for key, vector in zip(keys, vectors)]
+                    )
+                    db.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"Embedding cache write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            stored = None
+            if self.path:
+                try:
+                    stored = self._db().execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_entries": stored,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._memory_hits + self._disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings model that only calls the wrapped model for texts it has not embedded before.
+
+    Queries and documents share the cache: the OpenAI and sentence-transformers models embed a
+    text the same way either way, so a question embedded by the indexer is free for the retriever.
+    """
+
+    def __init__(self, embeddings, model_name, cache=None):
+        """
+        Args:
+            embeddings (Embeddings): The model to call on cache misses.
+            model_name (str): Embedding deployment or model name, part of the cache key.
+            cache (EmbeddingCache, optional): Defaults to the shared embedding_cache.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name or ""
+        self.cache = cache or embedding_cache
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Each distinct text is embedded once, even when it repeats within the batch
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, self.embeddings.embed_documents(unique)))
+            self.cache.put_many(self.model_name, unique, [computed[text] for text in unique])
+            for i in missing:
+                vectors[i] = list(computed[texts[i]])
+        return vectors
+
+    def embed_query(self, text):
+        vector = self.cache.get_many(self.model_name, [text])[0]
+        if vector is None:
+            vector = list(self.embeddings.embed_query(text))
+            self.cache.put_many(self.model_name, [text], [vector])
+        return vector
+
+    async def _acache(self, method, *args):
+        # The disk tier is a SQLite read or commit under a thread lock, so it runs off the event loop
+        if self.cache.path is None:
+            return method(self.model_name, *args)
+        return await asyncio.to_thread(method, self.model_name, *args)
+
+    async def aembed_documents(self, texts):
+        vectors = await self._acache(self.cache.get_many, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, await self.embeddings.aembed_documents(unique)))
+            await self._acache(self.cache.put_many, unique, [computed[text] for text in unique])
+            for i in missing:
+                vectors[i] = list(computed[texts[i]])
+        return vectors
+
+    async def aembed_query(self, text):
+        vector = (await self._acache(self.cache.get_many, [text]))[0]
+        if vector is None:
+            vector = list(await self.embeddings.aembed_query(text))
+            await self._acache(self.cache.put_many, [text], [vector])
+        return vector
+
+embedding_cache = EmbeddingCache(
+    path=EMBEDDING_CACHE_CONFIG["path"] if EMBEDDING_CACHE_CONFIG["persist"] else None,
+    max_entries=EMBEDDING_CACHE_CONFIG["max_entries"],
+)
@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import argparse
 import numpy as np
 
 import time
@@ -23,9 +24,13 @@ from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.models import (
     VectorizedQuery
 )
-from langchain_community.document_loaders import CSVLoader
 from sentence_transformers import SentenceTransformer
 from langchain_openai import AzureOpenAIEmbeddings
+from pydantic import BaseModel, Field
+
+from config.config import EMBEDDING_CACHE_CONFIG, EXAMPLE_RETRIEVAL_CONFIG
+from src.llm.cached_embeddings import CachedEmbeddings
+from src.tools.local_example_index import content_hash, example_document, load_examples
 
 from dotenv import load_dotenv
 
@@ -43,12 +48,19 @@ model_type = os.getenv("AZURE_AI_MODEL_TYPE")
 length = os.getenv("AZURE_AI_MODEL_LENGTH")
 index_name = os.getenv("AZURE_AI_INDEX_NAME")
 credential = AzureKeyCredential(key)
+# Shared with the local example index, which searches the same vectors
+VECTORS_PATH = EXAMPLE_RETRIEVAL_CONFIG["vectors_path"]
+# What the Azure index last accepted, {"model": ..., "documents": {id: content_hash}}; diffs are taken against it
+UPLOADED_PATH = os.path.splitext(VECTORS_PATH)[0] + ".uploaded.json"
 # print(service_endpoint)
 
 if model_type != 'openai':
    model = SentenceTransformer(model_name)
 else:
     model = AzureOpenAIEmbeddings(model=model_name)
+    # Rows embedded by an earlier build (or asked by a user) are not paid for again
+    if EMBEDDING_CACHE_CONFIG["enabled"]:
+        model = CachedEmbeddings(model, model_name)
 
 
 # Define a custom JSON encoder for numpy types
@@ -92,116 +104,220 @@ semantic_config = SemanticConfiguration(
 )
 
 
+# Documents sent to Azure AI Search per merge_or_upload_documents / delete_documents call
+UPLOAD_BATCH_SIZE = 100
+
+
+class IndexDiff(BaseModel):
+    """Changes between the examples CSV and the documents last uploaded to the index."""
+    documents: list[dict] = Field(default_factory=list, description="Every document of the new vectors file.")
+    added: list[str] = Field(default_factory=list, description="Ids of new examples.")
+    changed: list[str] = Field(default_factory=list, description="Ids whose question, SQL or explanation changed.")
+    removed: list[str] = Field(default_factory=list, description="Ids no longer in the CSV.")
+    unchanged: int = 0
+    embedded: int = Field(default=0, description="Rows sent to the embedding model.")
+    reused: int = Field(default=0, description="Rows whose vector was reused by embedding model and content hash.")
+    embed_seconds: float = 0.0
+
+    def summary(self):
+        """One-line diff summary and the embedding time saved by reusing vectors."""
+        line = (f"{len(self.documents)} examples: {len(self.added)} added, {len(self.changed)} changed, "
+                f"{len(self.removed)} removed, {self.unchanged} unchanged; "
+                f"embedded {self.embedded} in {self.embed_seconds:.1f}s, reused {self.reused}")
+        if self.embedded and self.reused:
+            line += f" (saved ~{self.reused * self.embed_seconds / self.embedded:.1f}s)"
+        elif self.reused:
+            line += " (no embedding calls)"
+        return line
+
+
+def load_uploaded(uploaded_path=UPLOADED_PATH):
+    """
+    The record of the last successful upload.
+
+    Returns:
+        dict: {"model": embedding model, "documents": {id: content_hash}}; no documents when
+            nothing has been uploaded yet.
+    """
+    if not os.path.exists(uploaded_path):
+        return {"model": None, "documents": {}}
+    with open(uploaded_path, "r") as f:
+        return json.load(f)
+
+
+def save_uploaded(documents, uploaded_path=UPLOADED_PATH):
+    """Record documents as uploaded; only call once the index has accepted every one of them."""
+    # Documents of older vectors files name no model, so the next run re-uploads them
+    models = {d.get("model") for d in documents}
+    record = {
+        "model": models.pop() if len(models) == 1 else None,
+        "documents": {str(d["id"]): d.get("content_hash") or content_hash(d) for d in documents},
+    }
+    with open(uploaded_path, "w") as f:
+        json.dump(record, f)
+
+
+def embed_lines(lines):
+    """
+    Embed example documents with the configured model.
+
+    Args:
+        lines (list[str]): Texts from example_document().
+
+    Returns:
+        list: One vector per line.
+    """
+    if not lines:
+        return []
+    #If the model type is not OpenAI, use SentenceTransformer
+    if model_type != 'openai':
+        return [list(map(float, vector)) for vector in model.encode(lines)]
+
+    # For OpenAI models with retry logic
+    @retry(
+        wait=wait_exponential(multiplier=1, min=2, max=60),
+        stop=stop_after_attempt(5),
+        retry=retry_if_exception_type(Exception)
+    )
+    def embed_batch_with_retry(batch):
+        try:
+            return model.embed_documents(batch)
+        except Exception as e:
+            if "429" in str(e):
+                print(f"Rate limit hit, waiting before retry: {e}")
+                time.sleep(2)  # Force some delay
+            raise e
+
+    # Process in smaller batches to avoid rate limits
+    batch_size = 5  # Adjust based on your rate limits
+    all_embeddings = []
+
+    print(f"Processing {len(lines)} lines in batches of {batch_size}")
+    for i in range(0, len(lines), batch_size):
+        batch = lines[i:i+batch_size]
+        batch_end = min(i+batch_size, len(lines))
+        print(f"Processing batch {i//batch_size + 1}/{(len(lines) + batch_size - 1)//batch_size} (lines {i}-{batch_end-1})")
+
+        # Get embeddings with retry logic
+        all_embeddings.extend(embed_batch_with_retry(batch))
+
+        # Add a delay between batches to prevent rate limiting
+        if i + batch_size < len(lines):  # If not the last batch
+            print("Pausing between batches to avoid rate limits...")
+            time.sleep(1)
+    return all_embeddings
+
 
 #-- Create a vector embeddings
-def create_embeddings(inputfilepathname):
+def create_embeddings(inputfilepathname, vectors_path=VECTORS_PATH, full=False, uploaded_path=UPLOADED_PATH):
         """
-        Create embeddings for the input data.
+        Create embeddings for the input data, embedding only rows that are new or changed.
+
+        Each document in the vectors file carries the content hash of its question, SQL and
+        explanation and the embedding model; a row whose hash was already embedded by the same
+        model reuses that vector. Added, changed and removed rows are found by comparing with
+        the record of the last successful upload, not with the vectors file, so a failed upload
+        is retried by the next run.
 
         Args:
             inputfilepathname (str): Path to the input file.
+            vectors_path (str): Vectors file, read for the previous build and rewritten.
+            full (bool): Re-embed and re-upload every row, ignoring the previous build.
+            uploaded_path (str): Record written by create_vector_index() after a successful upload.
+
+        Returns:
+            IndexDiff: The new documents and what changed, or None on failure.
         """
-        
+
         try:
-            metadata_cols = ['question', 'sql', 'explanation']
-            content_columns = ['question', 'sql', 'explanation']
-
-            # Load the CSV file using CSVLoader
-            loader = CSVLoader(inputfilepathname, metadata_columns=metadata_cols,
-                               content_columns=content_columns)
-
-            data = loader.load()
-            lines = [text.page_content for text in data]
-
-            #If the model type is not OpenAI, use SentenceTransformer
-            if model_type != 'openai':
-                embeddings = model.encode(lines)
-                counter = 0               
-                input_data = []
-                for line in lines:
-                    d = {}  # Initialize dictionary here
-                    d['id'] = str(counter)
-                    # d['line'] = line
-                    d['embedding'] = embeddings[counter]
-                    d['sql'] = data[counter].metadata.get("sql", "")
-                    d['question'] = data[counter].metadata.get("question", "")
-                    d['explanation'] = data[counter].metadata.get("explanation", "")
-                    # d['tables_required'] = data[counter].metadata.get("tables_required", "")
-
-                    counter += 1
-                    input_data.append(d)
-
-                # Output embeddings to schemaVector.json file
-                with open(f"schemaVectors.json", "w") as f:
-                    json.dump(input_data, f, cls=NumpyEncoder)
+            examples = load_examples(inputfilepathname)
+
+            previous = []
+            if os.path.exists(vectors_path):
+                with open(vectors_path, "r") as f:
+                    previous = json.load(f)
+            # Vectors of another embedding model, or of files that did not record one, are not reused
+            vectors_by_hash = {} if full else {
+                d["content_hash"]: d["embedding"] for d in previous
+                if d.get("content_hash") and d.get("model") == model_name
+            }
+            uploaded = load_uploaded(uploaded_path)
+            # After a model change every uploaded vector is stale
+            uploaded_hashes = {} if full or uploaded["model"] != model_name else uploaded["documents"]
+
+            diff = IndexDiff()
+            ids = set()
+            for example in examples:
+                ids.add(example["id"])
+                old_hash = uploaded_hashes.get(example["id"])
+                if old_hash is None:
+                    diff.added.append(example["id"])
+                elif old_hash != example["content_hash"]:
+                    diff.changed.append(example["id"])
+                else:
+                    diff.unchanged += 1
+            known = dict.fromkeys([*uploaded["documents"], *(str(d["id"]) for d in previous)])
+            diff.removed = [doc_id for doc_id in known if doc_id not in ids]
+
+            # Identical rows under different ids are embedded once
+            missing = list(dict.fromkeys(e["content_hash"] for e in examples if e["content_hash"] not in vectors_by_hash))
+            documents_by_hash = {e["content_hash"]: example_document(e) for e in examples}
+            start = time.perf_counter()
+            vectors_by_hash.update(zip(missing, embed_lines([documents_by_hash[h] for h in missing])))
+            diff.embed_seconds = time.perf_counter() - start
+            diff.embedded = len(missing)
+            embedded = set(missing)
+            diff.reused = sum(1 for e in examples if e["content_hash"] not in embedded)
+
+            diff.documents = [
+                {
+                    "id": example["id"],
+                    "embedding": vectors_by_hash[example["content_hash"]],
+                    "question": example["question"],
+                    "sql": example["sql"],
+                    "explanation": example["explanation"],
+                    "content_hash": example["content_hash"],
+                    "model": model_name,
+                }
+                for example in examples
+            ]
 
-            else:
-                # For OpenAI models with retry logic
-                @retry(
-                    wait=wait_exponential(multiplier=1, min=2, max=60),
-                    stop=stop_after_attempt(5),
-                    retry=retry_if_exception_type(Exception)
-                )
-                def embed_batch_with_retry(batch):
-                    try:
-                        return model.embed_documents(batch)
-                    except Exception as e:
-                        if "429" in str(e):
-                            print(f"Rate limit hit, waiting before retry: {e}")
-                            time.sleep(2)  # Force some delay
-                        raise e
-
-                # Process in smaller batches to avoid rate limits
-                batch_size = 5  # Adjust based on your rate limits
-                all_embeddings = []
-                
-                print(f"Processing {len(lines)} lines in batches of {batch_size}")
-                for i in range(0, len(lines), batch_size):
-                    batch = lines[i:i+batch_size]
-                    batch_end = min(i+batch_size, len(lines))
-                    print(f"Processing batch {i//batch_size + 1}/{(len(lines) + batch_size - 1)//batch_size} (lines {i}-{batch_end-1})")
-                    
-                    # Get embeddings with retry logic
-                    batch_embeddings = embed_batch_with_retry(batch)
-                    all_embeddings.extend(batch_embeddings)
-                    
-                    # Add a delay between batches to prevent rate limiting
-                    if i + batch_size < len(lines):  # If not the last batch
-                        print("Pausing between batches to avoid rate limits...")
-                        time.sleep(1)
-                
-                # Create documents with embeddings
-                counter = 0
-                input_data = []
-                for line in lines:
-                    d = {}  # Initialize dictionary
-                    d['id'] = str(counter)
-                    # d['line'] = line
-                    d['embedding'] = all_embeddings[counter]
-                    d['question'] = data[counter].metadata.get("question", "")
-                    d['sql'] = data[counter].metadata.get("sql", "")
-                    d['explanation'] = data[counter].metadata.get("explanation", "")
-                    # d['tables_required'] = data[counter].metadata.get("tables_required", "")
-
-                    counter += 1
-                    input_data.append(d)
-
-                # Output embeddings to schemaVector.json file
-                with open("schemaVectors.json", "w") as f:
-                    json.dump(input_data, f)
-
-            logging.info("Vector Embeddings created!")
+            # Output embeddings to schemaVector.json file; the local example index searches it directly
+            with open(vectors_path, "w") as f:
+                json.dump(diff.documents, f, cls=NumpyEncoder)
+
+            logging.info(f"Vector Embeddings created! {diff.summary()}")
             print("Vector Embeddings created!")
-            return input_data
+            return diff
 
         except Exception as e:
             logging.error(f"Failed to create vector embeddings: {e}")
             print(f"Error creating embeddings: {e}")
             return None
 
-def create_vector_index():
+def _check_indexing(results):
+    # The batch calls only raise for request errors; rejected documents are reported per key
+    failed = [f"{result.key}: {result.error_message}" for result in results if not result.succeeded]
+    if failed:
+        raise RuntimeError(f"{len(failed)} documents were not indexed: {'; '.join(failed[:5])}")
+
+
+def create_vector_index(diff=None, vectors_path=VECTORS_PATH, uploaded_path=UPLOADED_PATH):
         """
-        Create a vector index from the schemaVector.json file.
+        Create or update the vector index and bring its documents in line with the vectors file.
+
+        The upload record is only rewritten once every batch has succeeded, so the next
+        incremental run sends whatever this one did not.
+
+        Args:
+            diff (IndexDiff, optional): Result of create_embeddings(); only its added and changed
+                documents are uploaded and its removed ids deleted. Without it every document
+                of the vectors file is uploaded.
+            vectors_path (str): Vectors file to upload from when no diff is given.
+            uploaded_path (str): Upload record to write on success.
+
+        Returns:
+            bool: True if successful, False otherwise
         """
         try:
             # index_client = SearchIndexClient(
@@ -318,11 +434,6 @@ def create_vector_index():
             logging.info(f'Index {result.name} created.')
             print(f'Index {result.name} created.')
 
-            # Upload some documents to the index
-            with open('schemaVectors.json', 'r') as file:
-                documents = json.load(file)
-
-
             #create a search client
             search_client = SearchClient(
                 endpoint=service_endpoint,
@@ -330,41 +441,61 @@ def create_vector_index():
                 credential=credential
             )
 
-            result = search_client.upload_documents(documents)
-            logging.info(f"Uploaded {len(documents)} documents")
-            print(f"Uploaded {len(documents)} documents")
+            if diff is None:
+                with open(vectors_path, 'r') as file:
+                    documents = json.load(file)
+                uploads = documents
+                removed = []
+            else:
+                documents = diff.documents
+                changed = set(diff.added) | set(diff.changed)
+                uploads = [d for d in documents if d["id"] in changed]
+                removed = diff.removed
+            # content_hash and model are bookkeeping for the next build, not fields of the index
+            uploads = [{k: v for k, v in d.items() if k not in ("content_hash", "model")} for d in uploads]
+
+            for i in range(0, len(uploads), UPLOAD_BATCH_SIZE):
+                _check_indexing(search_client.merge_or_upload_documents(uploads[i:i + UPLOAD_BATCH_SIZE]))
+            for i in range(0, len(removed), UPLOAD_BATCH_SIZE):
+                _check_indexing(search_client.delete_documents([{"id": doc_id} for doc_id in removed[i:i + UPLOAD_BATCH_SIZE]]))
+            save_uploaded(documents, uploaded_path)
+            logging.info(f"Uploaded {len(uploads)} documents, deleted {len(removed)}")
+            print(f"Uploaded {len(uploads)} documents, deleted {len(removed)}")
+            return True
 
         except Exception as e:
             logging.error(f"Failed to create Azure AI Index: {e}")
+            return False
 
 
-# if __name__ == "__main__":
- 
-#     input_file = "examples.csv"  # Replace with your actual file path
-#     embeddings = create_embeddings(input_file)
-
-#     create_vector_index = create_vector_index()
-   
-def initialize_search_index(input_file="updated_examples.csv"):
+def initialize_search_index(input_file=EXAMPLE_RETRIEVAL_CONFIG["examples_path"], full=False):
     """
     Initialize the Azure Search index with embeddings from the given input file.
-    
+
+    Only examples added or changed since the last successful upload are uploaded, only rows
+    without a vector from the same embedding model are embedded, and examples removed from the
+    file are deleted from the index.
+
     Args:
         input_file (str): Path to the CSV file containing updated_examples
-        
+        full (bool): Re-embed and re-upload every example.
+
     Returns:
         bool: True if successful, False otherwise
     """
     try:
         print(f"Creating embeddings from {input_file}...")
-        embeddings = create_embeddings(input_file)
-        if not embeddings:
+        diff = create_embeddings(input_file, full=full)
+        if diff is None:
             print("Failed to create embeddings")
             return False
-            
-        print("Creating vector index...")
-        create_vector_index()
-        
+        print(diff.summary())
+
+        print("Updating vector index...")
+        if not create_vector_index(diff):
+            print("Failed to update the vector index")
+            return False
+
         print("Search index initialization complete!")
         return True
     except Exception as e:
@@ -372,6 +503,9 @@ def initialize_search_index(input_file="updated_examples.csv"):
         return False
 
 
-
-
-
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Embed the SQL examples and update the Azure AI Search index.')
+    parser.add_argument('--examples', type=str, default=EXAMPLE_RETRIEVAL_CONFIG["examples_path"], help='Examples CSV')
+    parser.add_argument('--full', action='store_true', help='Re-embed and re-upload every example')
+    args = parser.parse_args()
+    initialize_search_index(args.examples, full=args.full)
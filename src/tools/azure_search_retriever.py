@@ -1,17 +1,52 @@
 import os
 import re
+import asyncio
+import threading
 
 import logging
 logging.basicConfig(level=logging.INFO)
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.models import VectorizedQuery
 from azure.core.credentials import AzureKeyCredential
 from langchain_openai import AzureOpenAIEmbeddings
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from dotenv import load_dotenv
 
+from config.config import EXAMPLE_RETRIEVAL_CONFIG, EMBEDDING_CACHE_CONFIG
+from src.llm.cached_embeddings import CachedEmbeddings
+from src.tools.local_example_index import LocalExampleIndex, unit_vector
+
 load_dotenv()
 
+_embedding_model = None
+_azure_search = None
+_local_index = None
+_init_lock = threading.RLock()
+
+
+def embedding_model():
+    """
+    The embedding model of the SQL examples index, created on first use and shared.
+
+    AZURE_AI_MODEL_TYPE other than "openai" selects the local sentence-transformers model that
+    azure_search_index.py uses for that setting, so the local backend can run without Azure.
+    Vectors are cached by CachedEmbeddings unless EMBEDDING_CACHE_ENABLED=false.
+    """
+    global _embedding_model
+    with _init_lock:
+        if _embedding_model is None:
+            model_name = os.getenv("AZURE_AI_MODEL_NAME")
+            if os.getenv("AZURE_AI_MODEL_TYPE", "openai") != "openai":
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                _embedding_model = HuggingFaceEmbeddings(model_name=model_name)
+            else:
+                _embedding_model = AzureOpenAIEmbeddings(azure_deployment=model_name)
+            if EMBEDDING_CACHE_CONFIG["enabled"]:
+                _embedding_model = CachedEmbeddings(_embedding_model, model_name)
+        return _embedding_model
+
+
 class AzureSearch_nlq_sql_db:
     """Class to connect to Azure search AI"""
  
@@ -23,6 +58,11 @@ class AzureSearch_nlq_sql_db:
         
         self.credential = AzureKeyCredential(self.key)
         self.search_client, self.llm = self.get_vectordb()
+        # Example question -> unit-length embedding, for question-to-question similarity
+        self._question_embeddings = {}
+        self._lock = threading.Lock()
+        self._async_client = None
+        self._async_loop = None
  
     def get_vectordb(self):
         """Get vector db connection"""
@@ -32,61 +72,249 @@ class AzureSearch_nlq_sql_db:
             credential=self.credential
         )
         
-        llm = AzureOpenAIEmbeddings(
-            azure_deployment=self.embed_deployment,
-        )
-        
-        return search_client, llm
+        return search_client, embedding_model()
+
+    def async_search_client(self):
+        """
+        aio SearchClient for the running event loop.
+
+        The client is kept for the life of the process, so its aiohttp session keeps connections
+        to the search service alive between requests. A client bound to an earlier event loop is
+        replaced.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = AsyncSearchClient(
+                endpoint=self.endpoint,
+                index_name=self.index_name,
+                credential=self.credential
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def aclose(self):
+        """Close the aio client's HTTP session, e.g. on API shutdown."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    def question_embedding(self, question):
+        """Unit-length embedding of an example question, embedded once per process."""
+        with self._lock:
+            cached = self._question_embeddings.get(question)
+        if cached is None:
+            cached = unit_vector(self.llm.embed_query(text=question))
+            with self._lock:
+                self._question_embeddings[question] = cached
+        return cached
+
+    async def aquestion_embedding(self, question):
+        """Async question_embedding()."""
+        with self._lock:
+            cached = self._question_embeddings.get(question)
+        if cached is None:
+            cached = unit_vector(await self.llm.aembed_query(question))
+            with self._lock:
+                self._question_embeddings[question] = cached
+        return cached
+
+    @staticmethod
+    def _search_kwargs(query, embedding, top):
+        # Hybrid query: the text and the embedding are ranked together by the service
+        return {
+            "search_text": query,
+            "vector_queries": [VectorizedQuery(vector=embedding, k_nearest_neighbors=5, fields="embedding", exhaustive=True)],
+            "select": ["question", "sql", "explanation"],
+            "top": top,
+        }
+
+    @staticmethod
+    def _example(result):
+        return {"question": result["question"], "sql": result["sql"], "explanation": result.get("explanation", "")}
     
-    def invoke_index(self, query):
-        """Search the index for similar SQL examples"""
+    def search_examples(self, query, top=2, with_similarity=False):
+        """
+        Search the index for similar SQL examples.
+
+        Args:
+            query (str): The user's question or reframed query.
+            top (int): Number of examples to return.
+            with_similarity (bool): Also score the best match against the query, see question_embedding().
+
+        Returns:
+            list[dict]: question, sql and explanation of each example, best match first, with the
+                cosine similarity of the query to the example's question when with_similarity is set.
+        """
         # Generate embedding for the query
         embedding = self.llm.embed_query(text=query)
-        
-        # Create a vector query
-        vector_query = VectorizedQuery(
-            vector=embedding, 
-            k_nearest_neighbors=5, 
-            fields="embedding", 
-            exhaustive=True
-        )
- 
-        # Search using both text and vector
-        results = self.search_client.search(  
-            search_text=query,  
-            vector_queries=[vector_query],
-            select=["question", "sql", "explanation"],
-            top=2
+        results = self.search_client.search(**self._search_kwargs(query, embedding, top))
+        examples = [self._example(result) for result in results]
+        if with_similarity and examples:
+            # The index embeds question, SQL and explanation together, so compare the questions alone
+            best = examples[0]
+            best["similarity"] = round(float(unit_vector(embedding) @ self.question_embedding(best["question"])), 4)
+        return examples
+
+    async def asearch_examples(self, query, top=2, with_similarity=False):
+        """Async search_examples() on the shared aio client and the async embeddings API."""
+        embedding = await self.llm.aembed_query(query)
+        results = await self.async_search_client().search(**self._search_kwargs(query, embedding, top))
+        examples = [self._example(result) async for result in results]
+        if with_similarity and examples:
+            best = examples[0]
+            question_vector = await self.aquestion_embedding(best["question"])
+            best["similarity"] = round(float(unit_vector(embedding) @ question_vector), 4)
+        return examples
+
+    def invoke_index(self, query):
+        """Search the index for similar SQL examples"""
+        return format_examples(self.search_examples(query))
+
+
+def format_examples(examples):
+    """Few-shot prompt text for the examples returned by search_examples()."""
+    formatted_examples = []
+    for i, example in enumerate(examples, 1):
+        formatted_examples.append(
+            f"Example {i}:\n"
+            f"Question: {example['question']}\n"
+            f"SQL: {example['sql']}\n"
+            f"Explanation: {example['explanation']}\n"
         )
- 
-        # Format the results
-        formatted_examples = []
-        for i, result in enumerate(results, 1):
-            formatted_examples.append(
-                f"Example {i}:\n"
-                f"Question: {result['question']}\n"
-                f"SQL: {result['sql']}\n"
-                f"Explanation: {result.get('explanation', '')}\n"
-            )
+    
+    if not formatted_examples:
+        return "No similar SQL examples found."
         
-        if not formatted_examples:
-            return "No similar SQL examples found."
-            
-        return "\n".join(formatted_examples)
+    return "\n".join(formatted_examples)
+
+
+def get_azure_search():
+    """The Azure AI Search connection, created on first use so the local backend needs no Azure credentials."""
+    global _azure_search
+    with _init_lock:
+        if _azure_search is None:
+            _azure_search = AzureSearch_nlq_sql_db()
+        return _azure_search
 
-azure_search = AzureSearch_nlq_sql_db()
 
+def get_local_index():
+    """The in-process example index used by the "local" retrieval backend."""
+    global _local_index
+    with _init_lock:
+        if _local_index is None:
+            _local_index = LocalExampleIndex(
+                EXAMPLE_RETRIEVAL_CONFIG["vectors_path"],
+                EXAMPLE_RETRIEVAL_CONFIG["examples_path"],
+                embedding_model(),
+                hybrid=EXAMPLE_RETRIEVAL_CONFIG["hybrid"],
+                rrf_k=EXAMPLE_RETRIEVAL_CONFIG["rrf_k"],
+                mmr_lambda=EXAMPLE_RETRIEVAL_CONFIG["mmr_lambda"],
+                candidates=EXAMPLE_RETRIEVAL_CONFIG["candidates"],
+                model_name=os.getenv("AZURE_AI_MODEL_NAME"),
+            )
+        return _local_index
+
+
+async def _alocal_index():
+    # Creating the index may load a local embedding model, so the first call runs in a thread
+    return _local_index or await asyncio.to_thread(get_local_index)
+
+
+async def _asearch_local(query, top, with_similarity):
+    return await (await _alocal_index()).asearch_examples(query, top, with_similarity)
+
+
+def _can_fall_back():
+    return EXAMPLE_RETRIEVAL_CONFIG["backend"] != "local" and os.path.exists(EXAMPLE_RETRIEVAL_CONFIG["vectors_path"])
+
+
+def search_examples(query, top=2, with_similarity=False):
+    """
+    Similar SQL examples from the configured backend, EXAMPLE_RETRIEVAL_BACKEND "azure" or "local".
+
+    When Azure AI Search fails, the local index answers instead if schemaVectors.json exists.
+    See AzureSearch_nlq_sql_db.search_examples() for the arguments and result.
+    """
+    if EXAMPLE_RETRIEVAL_CONFIG["backend"] == "local":
+        return get_local_index().search_examples(query, top, with_similarity)
+    try:
+        return get_azure_search().search_examples(query, top, with_similarity)
+    except Exception as e:
+        if not _can_fall_back():
+            raise
+        logging.warning(f"Azure example search failed, using the local index: {e}")
+        return get_local_index().search_examples(query, top, with_similarity)
+
+
+async def asearch_examples(query, top=2, with_similarity=False):
+    """
+    Async search_examples() that never blocks the event loop, bounded by EXAMPLE_RETRIEVAL_TIMEOUT.
+
+    On a timeout or error the local index answers if schemaVectors.json exists, otherwise no
+    examples are returned: few-shot examples help the generator but are not worth failing for.
+    """
+    timeout = EXAMPLE_RETRIEVAL_CONFIG["timeout_seconds"]
+    try:
+        if EXAMPLE_RETRIEVAL_CONFIG["backend"] == "local":
+            return await asyncio.wait_for(_asearch_local(query, top, with_similarity), timeout)
+        return await asyncio.wait_for(get_azure_search().asearch_examples(query, top, with_similarity), timeout)
+    except Exception as e:
+        reason = f"timed out after {timeout}s" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+        logging.warning(f"Example search {reason}")
+    if _can_fall_back():
+        try:
+            return await asyncio.wait_for(_asearch_local(query, top, with_similarity), timeout)
+        except Exception as e:
+            logging.warning(f"Local example search fallback failed: {e}")
+    return []
+
+
+async def awarm_example_index():
+    """
+    Load the local example index and embed its questions, e.g. at API startup, when the local
+    backend or the fallback to it is configured, so no request's timeout is spent on loading.
+    """
+    if EXAMPLE_RETRIEVAL_CONFIG["backend"] != "local" and not _can_fall_back():
+        return
+    try:
+        await (await _alocal_index()).aload()
+    except Exception as e:
+        logging.warning(f"Could not load the local example index: {e}")
 
-@tool
-def retrieve_sql_examples(query: str) -> str:
-    """Retrieve similar SQL examples that match the user's question using Azure AI Search.
+
+async def aclose_search_clients():
+    """Close the shared aio search client, if one was opened."""
+    if _azure_search is not None:
+        await _azure_search.aclose()
+
+
+def run_retrieve_sql_examples(query: str) -> str:
+    """Retrieve similar SQL examples that match the user's question.
     This tool finds SQL patterns for complex analytical queries like year-over-year comparisons.
     """
     try:
         logging.info(f"retrieve_sql_examples called with query: {query}")
-        results=azure_search.invoke_index(query)
-        logging.info(f"Azure Search returned examples: {results}")
+        results=format_examples(search_examples(query))
+        logging.info(f"Retrieved examples: {results}")
         return results
 
     except Exception as e:
-        return f"Error retrieving SQL examples: {str(e)}"
\ No newline at end of file
+        return f"Error retrieving SQL examples: {str(e)}"
+
+
+async def arun_retrieve_sql_examples(query: str) -> str:
+    """Retrieve similar SQL examples that match the user's question.
+    This tool finds SQL patterns for complex analytical queries like year-over-year comparisons.
+    """
+    logging.info(f"retrieve_sql_examples called with query: {query}")
+    results = format_examples(await asearch_examples(query))
+    logging.info(f"Retrieved examples: {results}")
+    return results
+
+
+# Agents invoked with ainvoke/astream call the coroutine, which does not block the event loop
+retrieve_sql_examples = StructuredTool.from_function(
+    func=run_retrieve_sql_examples,
+    coroutine=arun_retrieve_sql_examples,
+    name="retrieve_sql_examples",
+)
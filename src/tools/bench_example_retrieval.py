@@ -0,0 +1,85 @@
+"""
+Benchmark the local example index (vector-only and hybrid BM25 + RRF + MMR) against Azure AI Search.
+
+Every question of the examples CSV is used as a query. Reports the time per search (the query
+embedding is computed once up front and excluded), how often the query's own example comes
+first, how often the two returned examples have different SQL, and, with --azure, agreement
+with the Azure hybrid ranking:
+
+    python -m src.tools.bench_example_retrieval [--azure] [--top 2] [--repeat 20]
+"""
+import csv
+import time
+import argparse
+import statistics
+
+from config.config import EXAMPLE_RETRIEVAL_CONFIG
+from src.tools.azure_search_retriever import embedding_model, get_azure_search
+from src.tools.local_example_index import LocalExampleIndex
+
+
+def time_us(search, repeat):
+    """Median wall time of search() in microseconds."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        search()
+        runs.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(runs)
+
+
+def report(name, rankings, questions, examples, timings, azure=None):
+    own_first = sum(1 for q, ranked in zip(questions, rankings) if ranked and examples[ranked[0]]["question"] == q)
+    distinct_sql = sum(1 for ranked in rankings if len({examples[i]["sql"] for i in ranked}) == len(ranked))
+    line = (f"{name:<10} {statistics.mean(timings):10.1f} us/search   own example first {own_first}/{len(questions)}"
+            f"   distinct SQL {distinct_sql}/{len(questions)}")
+    if azure is not None:
+        top1 = sum(1 for ranked, expected in zip(rankings, azure) if ranked[:1] == expected[:1])
+        overlap = statistics.mean(len(set(ranked) & set(expected)) / max(len(expected), 1)
+                                  for ranked, expected in zip(rankings, azure))
+        line += f"   Azure top-1 agreement {top1}/{len(questions)}   top-k overlap {overlap:.2f}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark local few-shot example retrieval against Azure AI Search.')
+    parser.add_argument('--examples', type=str, default=EXAMPLE_RETRIEVAL_CONFIG["examples_path"], help='Examples CSV')
+    parser.add_argument('--vectors', type=str, default=EXAMPLE_RETRIEVAL_CONFIG["vectors_path"], help='schemaVectors.json')
+    parser.add_argument('--top', type=int, default=2, help='Examples returned per query')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median time is reported')
+    parser.add_argument('--azure', action='store_true', help='Also query Azure AI Search and compare rankings')
+    args = parser.parse_args()
+
+    with open(args.examples, newline="", encoding="utf-8") as f:
+        questions = [row["question"] for row in csv.DictReader(f)]
+    embeddings = embedding_model()
+    index = LocalExampleIndex(
+        args.vectors, args.examples, embeddings,
+        rrf_k=EXAMPLE_RETRIEVAL_CONFIG["rrf_k"],
+        mmr_lambda=EXAMPLE_RETRIEVAL_CONFIG["mmr_lambda"],
+        candidates=EXAMPLE_RETRIEVAL_CONFIG["candidates"],
+    )
+    vectors = embeddings.embed_documents(questions)
+    examples = index.examples
+    position = {example["question"]: i for i, example in enumerate(examples)}
+
+    azure = None
+    if args.azure:
+        search = get_azure_search()
+        azure, azure_timings = [], []
+        for question in questions:
+            start = time.perf_counter()
+            found = search.search_examples(question, args.top)
+            azure_timings.append((time.perf_counter() - start) * 1e6)
+            azure.append([position[example["question"]] for example in found if example["question"] in position])
+        print(f"{'azure':<10} {statistics.mean(azure_timings):10.1f} us/search (embedding and network round trips)")
+
+    for name, search in (("vector", lambda q, v: index.search_vector(v, args.top)),
+                         ("hybrid", lambda q, v: index.search_hybrid(q, v, args.top))):
+        rankings = [[i for i, _ in search(q, v)] for q, v in zip(questions, vectors)]
+        timings = [time_us(lambda: search(q, v), args.repeat) for q, v in zip(questions, vectors)]
+        report(name, rankings, questions, examples, timings, azure)
+
+
+if __name__ == '__main__':
+    main()
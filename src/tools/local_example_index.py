@@ -0,0 +1,368 @@
+import os
+import csv
+import asyncio
+import json
+import math
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from src.tools.schema_index import keywords
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+
+def unit_vector(vector):
+    """A float32 copy of vector scaled to unit length."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def example_document(example):
+    """Text embedded for an example, in the "column: value" form CSVLoader gave azure_search_index.py."""
+    return (f"question: {example['question'].strip()}\nsql: {example['sql'].strip()}\n"
+            f"explanation: {example['explanation'].strip()}")
+
+
+def content_hash(example):
+    """Hash of an example's question, SQL and explanation; its vector only changes when this does."""
+    return hashlib.sha256(example_document(example).encode("utf-8")).hexdigest()
+
+
+def load_examples(path):
+    """
+    Read the examples CSV.
+
+    Returns:
+        list[dict]: id (the CSV id column, or the row number), question, sql, explanation and content_hash.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    examples = []
+    for i, row in enumerate(rows):
+        example = {
+            "id": str(row.get("id") or i).strip(),
+            "question": row.get("question") or "",
+            "sql": row.get("sql") or "",
+            "explanation": row.get("explanation") or "",
+        }
+        example["content_hash"] = content_hash(example)
+        examples.append(example)
+    return examples
+
+
+class _LoadedIndex:
+    """One load of the vectors file, swapped in whole so a reload never mixes two versions."""
+
+    def __init__(self, examples, matrix, postings, signature):
+        self.examples = examples
+        self.matrix = matrix
+        self.postings = postings
+        self.signature = signature
+        self.question_matrix = None
+
+
+def _postings(examples):
+    # word -> (examples, BM25 weights), over the same text the vectors embed. The examples
+    # never change while loaded, so each posting's full BM25 term weight is computed here.
+    counts = defaultdict(dict)
+    lengths = []
+    for i, example in enumerate(examples):
+        words = keywords(example_document(example))
+        lengths.append(len(words))
+        for word, count in Counter(words).items():
+            counts[word][i] = count
+    total = len(examples)
+    avg_length = (sum(lengths) / total) if total else 0.0
+    postings = {}
+    for word, matches in counts.items():
+        idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+        ids = np.fromiter(matches.keys(), dtype=np.intp, count=len(matches))
+        weights = np.array([
+            idf * count * (_K1 + 1) / (count + _K1 * (1 - _B + _B * lengths[i] / avg_length))
+            for i, count in matches.items()
+        ], dtype=np.float32)
+        postings[word] = (ids, weights)
+    return postings
+
+
+class LocalExampleIndex:
+    """
+    In-process vector index over the few-shot SQL examples, in place of Azure AI Search.
+
+    Loads the schemaVectors.json written by azure_search_index.py into one contiguous matrix of
+    unit-length rows, so a search is a single matrix-vector product. Without the vectors file the
+    examples CSV is embedded once and the file is written, so the index also works offline with a
+    local embedding model. The index reloads when either file changes, and re-embeds the rows of
+    the CSV that the vectors file does not match.
+
+    In hybrid mode, like Azure AI Search's hybrid queries, a BM25 ranking over question, SQL and
+    explanation is fused with the vector ranking by reciprocal rank fusion; maximal marginal
+    relevance then picks the returned examples so they are not paraphrases of each other.
+    """
+
+    def __init__(self, vectors_path, examples_path, embeddings=None, hybrid=True, rrf_k=60, mmr_lambda=0.7,
+                 candidates=10, model_name=None):
+        """
+        Args:
+            vectors_path (str): Path of schemaVectors.json.
+            examples_path (str): Path of updated_examples.csv, embedded when vectors_path is missing or stale.
+            embeddings (Embeddings, optional): LangChain embeddings model, the same one the vectors were built with.
+            hybrid (bool): Fuse BM25 with the vector ranking and diversify with MMR; otherwise vector top-k only.
+            rrf_k (int): Reciprocal rank fusion constant; 60 is the value Azure AI Search uses.
+            mmr_lambda (float): Weight of relevance against novelty in MMR, 1 disables diversification.
+            candidates (int): Fused results that MMR chooses from.
+            model_name (str, optional): Embedding model name; vectors of another model are never reused.
+        """
+        self.vectors_path = vectors_path
+        self.examples_path = examples_path
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        self.mmr_lambda = mmr_lambda
+        self.candidates = candidates
+        self.model_name = model_name
+        self._embeddings = embeddings
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def set_embedder(self, embeddings):
+        """
+        Args:
+            embeddings (Embeddings): LangChain embeddings model with embed_documents and embed_query.
+        """
+        self._embeddings = embeddings
+
+    def build(self, previous=()):
+        """
+        Embed the examples CSV and write the vectors file in the format of azure_search_index.py.
+
+        Args:
+            previous (list[dict]): Documents of an earlier vectors file; rows with the same content
+                hash and embedding model reuse their vector.
+
+        Returns:
+            list[dict]: The indexed documents.
+        """
+        examples = load_examples(self.examples_path)
+        vectors_by_hash = {
+            d["content_hash"]: d["embedding"] for d in previous
+            if d.get("content_hash") and self.model_name and d.get("model") == self.model_name
+        }
+        missing = list(dict.fromkeys(e["content_hash"] for e in examples if e["content_hash"] not in vectors_by_hash))
+        if missing:
+            documents_by_hash = {e["content_hash"]: example_document(e) for e in examples}
+            vectors_by_hash.update(zip(missing, self._embeddings.embed_documents([documents_by_hash[h] for h in missing])))
+        documents = [
+            {"id": example["id"], "embedding": list(map(float, vectors_by_hash[example["content_hash"]])),
+             "question": example["question"], "sql": example["sql"], "explanation": example["explanation"],
+             "content_hash": example["content_hash"], "model": self.model_name}
+            for example in examples
+        ]
+        with open(self.vectors_path, "w") as f:
+            json.dump(documents, f)
+        logging.info(f"Embedded {len(missing)} of {len(documents)} SQL examples into {self.vectors_path}")
+        return documents
+
+    def _signature(self):
+        # A rewrite of either file, e.g. by azure_search_index.py, reloads the index
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None
+                     for path in (self.vectors_path, self.examples_path))
+
+    def _is_stale(self, documents):
+        if not os.path.exists(self.examples_path):
+            return False
+        if self.model_name and any(d.get("model") not in (None, self.model_name) for d in documents):
+            return True
+        expected = [(e["id"], e["content_hash"]) for e in load_examples(self.examples_path)]
+        # Files written before content hashes were stored are hashed on load
+        return expected != [(str(d["id"]), d.get("content_hash") or content_hash(d)) for d in documents]
+
+    def _ensure_loaded(self):
+        loaded = self._loaded
+        if loaded is not None and loaded.signature == self._signature():
+            return loaded
+        with self._lock:
+            signature = self._signature()
+            if self._loaded is not None and self._loaded.signature == signature:
+                return self._loaded
+            documents = []
+            if os.path.exists(self.vectors_path):
+                with open(self.vectors_path) as f:
+                    documents = json.load(f)
+            if not documents or self._is_stale(documents):
+                if self._embeddings is None:
+                    if not documents:
+                        raise FileNotFoundError(f"{self.vectors_path} is missing and no embeddings model is set")
+                    logging.warning(f"{self.vectors_path} does not match {self.examples_path}; no embeddings model to rebuild it")
+                else:
+                    documents = self.build(documents)
+                    signature = self._signature()
+            examples = [
+                {"question": d.get("question", ""), "sql": d.get("sql", ""), "explanation": d.get("explanation", "")}
+                for d in documents
+            ]
+            matrix = np.asarray([d["embedding"] for d in documents], dtype=np.float32).reshape(len(documents), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._loaded = _LoadedIndex(
+                examples, np.ascontiguousarray(matrix / np.where(norms == 0, 1, norms)), _postings(examples), signature
+            )
+            logging.info(f"Loaded {len(documents)} SQL examples into the local vector index")
+            return self._loaded
+
+    @property
+    def examples(self):
+        """The indexed examples, in index order."""
+        return self._ensure_loaded().examples
+
+    @staticmethod
+    def _bm25(loaded, words):
+        scores = np.zeros(len(loaded.examples), dtype=np.float32)
+        for word in set(words):
+            posting = loaded.postings.get(word)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    def _question_vectors(self, loaded):
+        # Example questions alone, embedded in one batch the first time a similarity is needed
+        if loaded.question_matrix is None:
+            vectors = self._embeddings.embed_documents([example["question"] for example in loaded.examples])
+            loaded.question_matrix = np.ascontiguousarray(np.stack([unit_vector(v) for v in vectors]))
+        return loaded.question_matrix
+
+    async def _aquestion_vectors(self, loaded):
+        if loaded.question_matrix is None:
+            vectors = await self._embeddings.aembed_documents([example["question"] for example in loaded.examples])
+            loaded.question_matrix = np.ascontiguousarray(np.stack([unit_vector(v) for v in vectors]))
+        return loaded.question_matrix
+
+    async def _aensure_loaded(self):
+        # Loading parses the vectors file and may embed the CSV, so it runs off the event loop
+        loaded = self._loaded
+        if loaded is not None and loaded.signature == self._signature():
+            return loaded
+        return await asyncio.to_thread(self._ensure_loaded)
+
+    async def aload(self):
+        """
+        Load the index and embed the example questions without blocking the event loop, e.g. at
+        startup, so the first search does not pay for either.
+        """
+        await self._aquestion_vectors(await self._aensure_loaded())
+
+    def _vector_scores(self, loaded, embedding):
+        if not loaded.examples:
+            return np.zeros(0, dtype=np.float32)
+        query = unit_vector(embedding)
+        if query.shape[0] != loaded.matrix.shape[1]:
+            raise ValueError(
+                f"Query embedding has {query.shape[0]} dimensions but {self.vectors_path} has "
+                f"{loaded.matrix.shape[1]}; rebuild it with the current embedding model."
+            )
+        return loaded.matrix @ query
+
+    def search_vector(self, embedding, top=2):
+        """
+        Cosine top-k over the examples.
+
+        Args:
+            embedding (list[float]): Query embedding.
+            top (int): Number of examples to return.
+
+        Returns:
+            list[tuple]: (example index, cosine similarity), best first.
+        """
+        return self._search_vector(self._ensure_loaded(), embedding, top)
+
+    def _search_vector(self, loaded, embedding, top):
+        scores = self._vector_scores(loaded, embedding)
+        if not len(scores):
+            return []
+        top = min(top, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def search_hybrid(self, query, embedding, top=2):
+        """
+        BM25 and vector rankings fused by reciprocal rank fusion, diversified with MMR.
+
+        Args:
+            query (str): Query text for BM25.
+            embedding (list[float]): Query embedding.
+            top (int): Number of examples to return.
+
+        Returns:
+            list[tuple]: (example index, fused score), in MMR selection order.
+        """
+        return self._search_hybrid(self._ensure_loaded(), query, embedding, top)
+
+    def _search_hybrid(self, loaded, query, embedding, top):
+        scores = self._vector_scores(loaded, embedding)
+        if not len(scores):
+            return []
+        # Each ranking adds 1 / (k + rank) to the fused score of its documents
+        rank_weights = 1 / (self.rrf_k + np.arange(1, len(scores) + 1))
+        fused = np.zeros(len(scores), dtype=np.float64)
+        fused[np.argsort(-scores, kind="stable")] += rank_weights
+        bm25 = self._bm25(loaded, keywords(query))
+        matched = np.flatnonzero(bm25 > 0)
+        fused[matched[np.argsort(-bm25[matched], kind="stable")]] += rank_weights[:len(matched)]
+        candidates = np.argsort(-fused, kind="stable")[:max(top, self.candidates)]
+        relevance = self.mmr_lambda * fused[candidates] / fused[candidates[0]]
+        similarity = loaded.matrix[candidates] @ loaded.matrix[candidates].T
+        # Candidates are penalized by their closeness to the examples already chosen
+        redundancy = np.zeros(len(candidates), dtype=np.float32)
+        available = np.ones(len(candidates), dtype=bool)
+        selected = []
+        for _ in range(min(top, len(candidates))):
+            mmr = np.where(available, relevance - (1 - self.mmr_lambda) * redundancy, -np.inf)
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            available[best] = False
+            redundancy = np.maximum(redundancy, similarity[best])
+        return [(int(candidates[i]), float(fused[candidates[i]])) for i in selected]
+
+    def search_examples(self, query, top=2, with_similarity=False):
+        """
+        Search the examples for the ones most similar to a question.
+
+        Args:
+            query (str): The user's question or reframed query.
+            top (int): Number of examples to return.
+            with_similarity (bool): Also score the best match's question against the query.
+
+        Returns:
+            list[dict]: question, sql and explanation of each example, best match first, like
+                AzureSearch_nlq_sql_db.search_examples().
+        """
+        return self.rank(query, self._embeddings.embed_query(query), top, with_similarity)
+
+    async def asearch_examples(self, query, top=2, with_similarity=False):
+        """Async search_examples(): loading and embedding are awaited, only the ranking runs on the event loop."""
+        loaded = await self._aensure_loaded()
+        embedding = await self._embeddings.aembed_query(query)
+        question_matrix = await self._aquestion_vectors(loaded) if with_similarity else None
+        return self._rank(loaded, query, embedding, top, question_matrix)
+
+    def rank(self, query, embedding, top=2, with_similarity=False):
+        """search_examples() for an already computed query embedding."""
+        loaded = self._ensure_loaded()
+        return self._rank(loaded, query, embedding, top, self._question_vectors(loaded) if with_similarity else None)
+
+    def _rank(self, loaded, query, embedding, top, question_matrix=None):
+        if self.hybrid:
+            ranked = self._search_hybrid(loaded, query, embedding, top)
+        else:
+            ranked = self._search_vector(loaded, embedding, top)
+        examples = [dict(loaded.examples[i]) for i, _ in ranked]
+        if question_matrix is not None and examples:
+            best = ranked[0][0]
+            examples[0]["similarity"] = round(float(question_matrix[best] @ unit_vector(embedding)), 4)
+        return examples
@@ -0,0 +1,352 @@
+import re
+import json
+import math
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Optional
+
+import numpy as np
+from pydantic import BaseModel
+from langchain_core.tools import tool
+
+from config.config import SCHEMA_INDEX_CONFIG
+
+# Words that say nothing about which column a question needs
+_STOP_WORDS = {
+    "a", "an", "the", "of", "for", "by", "in", "to", "on", "and", "or", "is", "are", "was", "were", "be", "this",
+    "that", "with", "as", "at", "it", "its", "e", "g", "etc", "if", "used", "which", "what", "show", "me", "give",
+    "list", "all", "each", "per", "how", "many", "much", "who", "when", "where", "do", "does", "did", "i", "we",
+    "c", "table", "record", "records", "field", "value", "id", "salesforce",
+}
+
+# Business terms users ask with that the column descriptions do not use
+COLUMN_ALIASES = {
+    "obm.Total__c": "revenue sales booking bookings amount value money earned billing usd",
+    "obm.Year__c": "year fiscal fy annual yoy",
+    "obm.Month__c": "month monthly mom quarter",
+    "obm.Account__c": "client customer account company",
+    "obm.Primary_Practice__c": "practice practices service line",
+    "obm.Client_Geography_Tagging__c": "geography region geo country location",
+    "obm.Country_Bill_to_Budget_owning_geo__c": "geography region geo country",
+    "obm.Sales_lead__c": "salesperson seller rep",
+    "obm.Owner__c": "owner salesperson",
+    "obm.Project_Name__c": "project projects engagement",
+    "obm.Vendor_Cost_USD__c": "cost costs spend margin",
+    "account.Name": "client customer company account name",
+    "account.Vertical": "vertical verticals segment sector",
+    "account.Industry": "industry industries sector",
+    "account.Sub-Vertical_SF": "subvertical sub vertical segment",
+    "account.OwnerId": "owner account manager",
+    "user.Name": "employee person people user staff",
+    "user.Department": "department team",
+    "user.Title": "designation title role",
+}
+
+# Years and months in a question filter on obm.Year__c / obm.Month__c even though the words never appear
+_YEAR = re.compile(r"\b(?:fy)?(?:19|20)\d{2}\b")
+_MONTH = re.compile(
+    r"\b(?:january|february|march|april|may|june|july|august|september|october|november|december"
+    r"|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec|q[1-4])\b"
+)
+
+_TABLE_HEADING = re.compile(r"^###\s+\d+\.\s+(\w+)\s+Table", re.I)
+_SECTION_HEADING = re.compile(r"^##\s+(.+)")
+_DICTIONARY_ROW = re.compile(r"^\|\s*([^|]+?)\s*\|\s*(.+?)\s*\|\s*$")
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+
+def date_terms(question):
+    """Column alias words for the years and month names a question mentions, e.g. "2025" -> "year"."""
+    lowered = question.lower()
+    return (["year"] if _YEAR.search(lowered) else []) + (["month"] if _MONTH.search(lowered) else [])
+
+
+def keywords(text):
+    """
+    Lowercase search terms of a column name or description.
+
+    Column names are split on underscores, hyphens and camel case, so "Primary_Practice__c"
+    yields "primary" and "practice". Trailing plural "s" is dropped.
+    """
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+            for w in words if w not in _STOP_WORDS]
+
+
+class SchemaChunk(BaseModel):
+    kind: str  # table, column or note
+    table: Optional[str] = None  # Lowercase table name
+    column: Optional[str] = None
+    text: str
+    keywords: list[str]
+
+
+def parse_schema_doc(markdown):
+    """
+    Split db_schema_and_rules.md into per-table, per-column and general note chunks.
+
+    Table chunks carry the purpose and relationships of the table, column chunks one data
+    dictionary row, and note chunks the document-wide sections such as the relationship summary.
+
+    Returns:
+        list[SchemaChunk]: Chunks in document order.
+    """
+    chunks = []
+    table, section, lines = None, None, []
+    key_fields = False
+
+    def flush():
+        text = "\n".join(line for line in lines if line.strip() and line.strip() != "---").strip()
+        if not text:
+            return
+        if table:
+            chunks.append(SchemaChunk(kind="table", table=table, text=text, keywords=keywords(f"{table} {text}")))
+        elif section and not section.lower().startswith(("executive", "usage")):
+            chunks.append(SchemaChunk(kind="note", text=f"## {section}\n{text}", keywords=keywords(text)))
+
+    for line in markdown.splitlines():
+        heading = _TABLE_HEADING.match(line)
+        if heading:
+            flush()
+            table, section, lines = heading.group(1).lower(), None, []
+            continue
+        heading = _SECTION_HEADING.match(line)
+        if heading and not line.startswith("###"):
+            flush()
+            table, section, lines = None, heading.group(1).strip(), []
+            continue
+        if line.startswith("####"):
+            continue
+        row = _DICTIONARY_ROW.match(line)
+        if row and table:
+            column, description = row.groups()
+            if column.lower() == "column" or set(column) <= {"-"}:
+                continue
+            alias = COLUMN_ALIASES.get(f"{table}.{column}", "")
+            chunks.append(SchemaChunk(
+                kind="column", table=table, column=column, text=description,
+                keywords=keywords(f"{column} {description} {alias}"),
+            ))
+            continue
+        if line.startswith("**"):
+            # The key field list repeats the data dictionary, so it is left out of the table chunk
+            key_fields = line.startswith("**Key Fields")
+            if key_fields:
+                continue
+        elif key_fields and line.startswith("- "):
+            continue
+        lines.append(line)
+    flush()
+    return chunks
+
+
+class SchemaIndex:
+    """
+    Precomputed search index over db_schema_and_rules.md for schema linking.
+
+    Each table, column and note chunk gets keyword postings (scored with BM25) and, when an
+    embedding model is set, an embedding. The index is saved next to the other generated files
+    and rebuilt automatically whenever the markdown changes, so the document stays the source.
+    """
+
+    def __init__(self, doc_path, index_path, max_columns=12, max_tables=3):
+        """
+        Args:
+            doc_path (str): Path of db_schema_and_rules.md.
+            index_path (str): Path of the generated JSON index.
+            max_columns (int): Most relevant columns returned per question.
+            max_tables (int): Most relevant tables returned per question.
+        """
+        self.doc_path = doc_path
+        self.index_path = index_path
+        self.max_columns = max_columns
+        self.max_tables = max_tables
+        self._embeddings = None
+        self._lock = threading.Lock()
+        self._chunks = None
+        self._vectors = None
+        self._postings = None
+        self._lengths = None
+        self._avg_length = 0.0
+
+    def set_embedder(self, embeddings):
+        """
+        Args:
+            embeddings (Embeddings): LangChain embeddings model with embed_documents and embed_query.
+        """
+        self._embeddings = embeddings
+
+    def _doc_hash(self, markdown):
+        return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+    def build(self):
+        """
+        Parse the markdown, embed the chunks if an embedding model is set and save the index.
+
+        Returns:
+            int: Number of chunks indexed.
+        """
+        with open(self.doc_path, "r") as f:
+            markdown = f.read()
+        chunks = parse_schema_doc(markdown)
+        vectors = None
+        if self._embeddings is not None:
+            try:
+                vectors = self._embeddings.embed_documents([self._chunk_document(chunk) for chunk in chunks])
+            except Exception as e:
+                logging.warning(f"Schema index built without embeddings: {e}")
+        with open(self.index_path, "w") as f:
+            json.dump({
+                "doc_hash": self._doc_hash(markdown),
+                "chunks": [chunk.model_dump() for chunk in chunks],
+                "embeddings": vectors,
+            }, f)
+        logging.info(f"Built schema index with {len(chunks)} chunks at {self.index_path}")
+        self._load_chunks(chunks, vectors)
+        return len(chunks)
+
+    @staticmethod
+    def _chunk_document(chunk):
+        if chunk.kind == "column":
+            return f"{chunk.table}.{chunk.column}: {chunk.text}"
+        return chunk.text
+
+    def _load_chunks(self, chunks, vectors):
+        postings = defaultdict(dict)
+        for i, chunk in enumerate(chunks):
+            for word, count in Counter(chunk.keywords).items():
+                postings[word][i] = count
+        matrix = None
+        if vectors:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        self._chunks = chunks
+        self._vectors = matrix
+        self._postings = dict(postings)
+        self._lengths = [len(chunk.keywords) for chunk in chunks]
+        self._avg_length = sum(self._lengths) / len(chunks) if chunks else 0.0
+
+    def _ensure_loaded(self):
+        """Load the saved index, rebuilding it if it is missing or the markdown has changed."""
+        if self._chunks is not None:
+            return
+        with self._lock:
+            if self._chunks is not None:
+                return
+            with open(self.doc_path, "r") as f:
+                doc_hash = self._doc_hash(f.read())
+            try:
+                with open(self.index_path, "r") as f:
+                    saved = json.load(f)
+                # An index saved before an embedding model was available is rebuilt once one is set
+                if saved.get("doc_hash") == doc_hash and (saved.get("embeddings") or self._embeddings is None):
+                    self._load_chunks([SchemaChunk(**chunk) for chunk in saved["chunks"]], saved.get("embeddings"))
+                    return
+                logging.info("db_schema_and_rules.md changed, rebuilding schema index")
+            except (OSError, ValueError):
+                logging.info("No schema index found, building it")
+            self.build()
+
+    def _bm25(self, words):
+        scores = np.zeros(len(self._chunks), dtype=np.float32)
+        total = len(self._chunks)
+        for word in set(words):
+            matches = self._postings.get(word)
+            if not matches:
+                continue
+            idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+            for i, count in matches.items():
+                norm = count + _K1 * (1 - _B + _B * self._lengths[i] / self._avg_length)
+                scores[i] += idf * count * (_K1 + 1) / norm
+        return scores
+
+    def search(self, question):
+        """
+        Score every chunk against a question.
+
+        Keyword (BM25) scores are scaled to [0, 1] and averaged with the cosine similarity of the
+        question embedding when the index has embeddings.
+
+        Returns:
+            list[tuple[SchemaChunk, float]]: Chunks with a positive score, best first.
+        """
+        self._ensure_loaded()
+        scores = self._bm25(keywords(question) + date_terms(question))
+        if scores.max() > 0:
+            scores = scores / scores.max()
+        if self._vectors is not None and self._embeddings is not None:
+            try:
+                query = np.asarray(self._embeddings.embed_query(question), dtype=np.float32)
+                query = query / (np.linalg.norm(query) or 1)
+                scores = 0.5 * scores + 0.5 * np.clip(self._vectors @ query, 0, None)
+            except Exception as e:
+                logging.warning(f"Schema search fell back to keywords only: {e}")
+        order = np.argsort(-scores, kind="stable")
+        return [(self._chunks[i], float(scores[i])) for i in order if scores[i] > 0]
+
+    def relevant_schema(self, question):
+        """
+        Markdown excerpt of db_schema_and_rules.md with only the tables and columns a question needs.
+
+        Args:
+            question (str): The user's question or the reframed query.
+
+        Returns:
+            str: Relevant tables (purpose and relationships), their relevant columns and the
+            document-wide relationship notes.
+        """
+        ranked = self.search(question)
+        columns = [(chunk, score) for chunk, score in ranked if chunk.kind == "column"][:self.max_columns]
+        tables = []
+        for chunk, _ in ranked:
+            if chunk.kind in ("table", "column") and chunk.table not in tables:
+                tables.append(chunk.table)
+        tables = tables[:self.max_tables]
+        if not tables:
+            # Nothing matched: fall back to the table overviews rather than an empty answer
+            tables = [chunk.table for chunk in self._chunks if chunk.kind == "table"]
+
+        sections = []
+        for table in tables:
+            overview = next((chunk.text for chunk in self._chunks if chunk.kind == "table" and chunk.table == table), "")
+            rows = [f"| {chunk.column} | {chunk.text} |" for chunk, _ in columns if chunk.table == table]
+            section = f"### {table}\n{overview}"
+            if rows:
+                section += "\n| Column | Description |\n|---|---|\n" + "\n".join(rows)
+            sections.append(section)
+        notes = [chunk.text for chunk in self._chunks if chunk.kind == "note"]
+        return "\n\n".join(["Relevant DigiBook schema (from db_schema_and_rules.md):", *sections, *notes])
+
+
+schema_index = SchemaIndex(
+    doc_path=SCHEMA_INDEX_CONFIG["doc_path"],
+    index_path=SCHEMA_INDEX_CONFIG["index_path"],
+    max_columns=SCHEMA_INDEX_CONFIG["max_columns"],
+    max_tables=SCHEMA_INDEX_CONFIG["max_tables"],
+)
+
+
+@tool
+def lookup_schema(question: str) -> str:
+    """Return the tables, columns and business rules of the DigiBook database (db_schema_and_rules.md)
+    that are relevant to a question. Pass the user's question or the reframed query.
+    """
+    try:
+        logging.info(f"lookup_schema called with question: {question}")
+        return schema_index.relevant_schema(question)
+    except Exception as e:
+        return f"Error looking up schema: {str(e)}"
+
+
+if __name__ == "__main__":
+    # Rebuild the index with embeddings from the same model as the SQL examples index
+    from src.tools.azure_search_retriever import embedding_model
+    schema_index.set_embedder(embedding_model())
+    print(f"Indexed {schema_index.build()} schema chunks")
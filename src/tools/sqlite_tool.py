@@ -1,30 +1,126 @@
 import sqlite3
-import os
-from typing import Any
-from langchain_core.tools import tool
+import logging
+from contextvars import ContextVar
+from langchain_core.tools import StructuredTool
+from config.config import INDEX_ADVISOR_CONFIG
+from src.database.async_executor import sql_executor, ExecutorBusyError
+from src.database.connection_pool import pool
+from src.database.data_version import get_data_version
+from src.database.fts_index import rewrite_fts_predicates
+from src.database.index_advisor import index_advisor
+from src.database.query_governor import execute_governed
+from src.database.result_cache import result_cache, is_cacheable
+from src.database.result_pages import first_page
+from src.database.result_renderer import summarize
+from src.database.rollups import rewrite_with_rollups, rollups_current
+from src.database.schema import get_schema_info
+from src.database.sql_normalizer import normalize_case_predicates
+from src.database.sql_text import sql_fingerprint
 
-@tool
-def sqlite_tool(query: str) -> str:
-    """Execute a SQL query on the digibook.db SQLite database and return the results as a string. Expects only a SQL query from the user."""
-    db_path = os.path.join(os.path.dirname(__file__), '../database/digibook.db')
+# Result pages produced by sqlite_tool during the current request, see collect_query_results()
+_collected_pages = ContextVar("collected_pages", default=None)
+
+
+def collect_query_results():
+    """
+    Start recording the ResultPage of every sqlite_tool call made in the current context.
+
+    Returns:
+        list[ResultPage]: List that sqlite_tool appends to for the rest of the request.
+    """
+    pages = []
+    _collected_pages.set(pages)
+    return pages
+
+
+def _execute(conn, query, version, observe=True):
+    """Run a query through the result cache and the query governor."""
+    fingerprint = sql_fingerprint(query)
+    cacheable = is_cacheable(query)
+    result = result_cache.get(fingerprint, version) if cacheable else None
+    if result is not None:
+        print(f"Result cache hit for query: {query}")
+        return result
+    print(f"Executing query: {query}")
+    result = execute_governed(conn, query)
+    if observe and INDEX_ADVISOR_CONFIG["enabled"]:
+        index_advisor.observe(query, result.elapsed_ms)
+    if cacheable and not result.aborted:
+        result_cache.put(fingerprint, version, result)
+    return result
+
+
+def collect_page(page):
+    """Record a ResultPage as if sqlite_tool had produced it in the current context."""
+    collected = _collected_pages.get()
+    if collected is not None:
+        collected.append(page)
+
+
+def query_database(query):
+    """
+    Execute a query like sqlite_tool, without recording its page for the current request.
+
+    Returns:
+        tuple: (tool output text, ResultPage or None when the query failed or was aborted)
+    """
     if not query.strip():
-        return "No SQL query provided."
+        return "No SQL query provided.", None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        print(f"Executing query: {query}")
-        cursor.execute(query)
-        # Fetch all results
-        results = cursor.fetchall()
-        # Get column names
-        columns = [description[0] for description in cursor.description] if cursor.description else []
-        conn.close()
-        if not results:
-            return "No results found."
-        # Format results as a table-like string
-        output = '\t'.join(columns) + '\n'
-        for row in results:
-            output += '\t'.join(str(item) for item in row) + '\n'
-        return output.strip()
+        # Pooled connections are opened read-only, so only SELECT queries can succeed
+        with pool.connection() as conn:
+            version = get_data_version(conn)
+            schema_info = get_schema_info(conn)
+            # Let lowercased-text predicates use the COLLATE NOCASE indexes built at load time,
+            # and substring LIKEs the trigram full-text indexes
+            base_query = normalize_case_predicates(query, schema_info.nocase_columns)
+            base_query = rewrite_fts_predicates(base_query, schema_info.fts_columns)
+            # Aggregates over obm are answered from the pre-aggregated rollup tables when they cover the query
+            rollup_query = None
+            if schema_info.rollup_columns and rollups_current(conn, version):
+                rollup_query = rewrite_with_rollups(query, schema_info.schema, schema_info.rollup_columns)
+                rollup_query = None if rollup_query == query else rollup_query
+            query, result = base_query, None
+            if rollup_query is not None:
+                try:
+                    result = _execute(conn, rollup_query, version, observe=False)
+                    query = rollup_query
+                except sqlite3.Error as e:
+                    logging.warning(f"Rollup query failed, falling back to base tables: {e}")
+            if result is None:
+                result = _execute(conn, query, version)
+            if result.aborted:
+                return (
+                    f"Query aborted: {result.reason}. "
+                    "The query is too expensive; add filters, avoid cross joins or aggregate the data and try again."
+                ), None
+            page = first_page(conn, query, result, version)
+        # The table itself is rendered in code; the runner agent only needs enough to explain it
+        return summarize(page), page
     except Exception as e:
-        return f"Error executing query: {e}" 
\ No newline at end of file
+        return f"Error executing query: {e}", None
+
+
+def run_sqlite_query(query: str) -> str:
+    """Execute a SQL query on the digibook.db SQLite database and return the results as a string. Expects only a SQL query from the user."""
+    output, page = query_database(query)
+    if page is not None:
+        collect_page(page)
+    return output
+
+
+async def arun_sqlite_query(query: str) -> str:
+    """Execute a SQL query on the digibook.db SQLite database and return the results as a string. Expects only a SQL query from the user."""
+    # Connection waits and query execution block, so they run on the bounded SQL worker pool
+    try:
+        return await sql_executor.run(run_sqlite_query, query)
+    except ExecutorBusyError as e:
+        return f"Error executing query: the database is busy ({e}). Try again shortly."
+
+
+# Agents invoked with ainvoke/astream call the coroutine, synchronous ones the plain function
+sqlite_tool = StructuredTool.from_function(
+    func=run_sqlite_query,
+    coroutine=arun_sqlite_query,
+    name="sqlite_tool",
+)
@@ -0,0 +1,23 @@
+import logging
+from langchain_core.tools import tool
+
+from src.database.value_dictionary import value_dictionary, format_matches
+
+
+@tool
+def lookup_column_values(terms: str) -> str:
+    """Find the exact values stored in categorical columns (e.g. Vertical, Industry, Primary_Practice__c,
+    Client_Geography_Tagging__c, Type__c) that match what the user called them.
+    Pass a comma-separated list of terms, e.g. "pharma, north america". Filter on the returned values with = or IN.
+    """
+    try:
+        logging.info(f"lookup_column_values called with terms: {terms}")
+        lines = []
+        for term in (t.strip() for t in terms.split(",")):
+            if not term:
+                continue
+            matches = value_dictionary.lookup(term)
+            lines.append(f"{term}:\n{format_matches(matches)}" if matches else f"{term}: no matching stored value")
+        return "\n".join(lines) or "No terms given."
+    except Exception as e:
+        return f"Error looking up column values: {str(e)}"
@@ -1,6 +1,6 @@
 import streamlit as st
 import asyncio
-from src.agents.LangBotAgent import LangBotAgent
+from src.agents.LangBotAgent import LangBotAgent, find_structured_response
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
 if 'agent' not in st.session_state:
@@ -33,8 +33,8 @@ agent = st.session_state['agent']
 
 def extract_message_content(chunk):
     if isinstance(chunk, dict):
-        if 'supervisor' in chunk and 'structured_response' in chunk['supervisor']:
-            sr = chunk['supervisor']['structured_response']
+        sr = find_structured_response(chunk)
+        if sr is not None:
             if hasattr(sr, 'dict'):
                 sr = sr.dict()
             return sr  # Return the dict for final output